@@ -0,0 +1,106 @@
+# admission.py
+"""
+Queue-depth admission control for the upload endpoints.
+
+Every accepted file holds one unit of capacity from admission until its
+result is ready. Once `max_queued` files are waiting or in flight, new
+uploads are turned away with 503 and a Retry-After estimated from the
+recent per-file service time, instead of queueing behind work that would
+take minutes to drain:
+
+    if not admission.try_admit(len(files)):
+        raise HTTPException(503, BUSY_DETAIL, {"Retry-After": str(admission.retry_after(len(files)))})
+    try:
+        ...
+    finally:
+        admission.release(len(files))
+"""
+import math
+import threading
+
+from starlette.responses import JSONResponse
+
+from metrics import Counter, Gauge, REGISTRY
+
+BUSY_DETAIL = "Server busy, retry later"
+
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "invoice_admission_rejected_total", "Uploads turned away by admission control", ["endpoint"]
+))
+ADMISSION_QUEUED = REGISTRY.register(Gauge(
+    "invoice_admission_queued_files", "Admitted files waiting for or holding a processing slot"
+))
+
+
+class AdmissionController:
+    def __init__(self, max_queued: int, concurrency: int, initial_service_seconds: float = 5.0,
+                 max_retry_after: int = 120):
+        self.max_queued = max_queued
+        self.concurrency = max(1, concurrency)
+        self.max_retry_after = max_retry_after
+        # EWMA of how long one file holds a processing slot; with `concurrency`
+        # slots the queue drains at concurrency / service_seconds files per second
+        self._service_seconds = initial_service_seconds
+        self._queued = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def saturated(self) -> bool:
+        return self._queued >= self.max_queued
+
+    def try_admit(self, files: int = 1) -> bool:
+        with self._lock:
+            if self._queued + files > self.max_queued:
+                return False
+            self._queued += files
+        ADMISSION_QUEUED.set(self._queued)
+        return True
+
+    def release(self, files: int = 1) -> None:
+        with self._lock:
+            self._queued = max(0, self._queued - files)
+        ADMISSION_QUEUED.set(self._queued)
+
+    def observe(self, seconds: float) -> None:
+        """Feed the processing time of one finished file into the Retry-After estimate."""
+        with self._lock:
+            self._service_seconds += 0.2 * (seconds - self._service_seconds)
+
+    def retry_after(self, files: int = 1) -> int:
+        """Seconds until roughly enough files have drained for `files` more to fit."""
+        excess = max(1, self._queued + files - self.max_queued)
+        seconds = math.ceil(excess * self._service_seconds / self.concurrency)
+        return max(1, min(self.max_retry_after, seconds))
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that turns POSTs to `paths` away before their body is
+    read while `admission` is saturated; the endpoints still admit the actual
+    number of files themselves.
+    """
+
+    def __init__(self, app, admission: AdmissionController, paths):
+        self.app = app
+        self.admission = admission
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["method"] == "POST"
+            and scope["path"] in self.paths
+            and self.admission.saturated()
+        ):
+            ADMISSION_REJECTED.inc(endpoint=scope["path"])
+            response = JSONResponse(
+                {"detail": BUSY_DETAIL},
+                status_code=503,
+                headers={"Retry-After": str(self.admission.retry_after())},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
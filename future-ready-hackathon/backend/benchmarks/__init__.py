@@ -0,0 +1,3 @@
+# benchmarks/
+# Offline benchmarks for the backend. Run from the backend directory, e.g.
+#   python -m benchmarks.bench_fast_path
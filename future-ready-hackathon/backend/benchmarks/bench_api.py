@@ -0,0 +1,239 @@
+# benchmarks/bench_api.py
+"""
+End-to-end load benchmark of the FastAPI app with stubbed LlamaParse and
+Gemini, so it runs offline, costs nothing and is reproducible.
+
+    python -m benchmarks.bench_api --requests 40 --concurrency 8
+    python -m benchmarks.bench_api --requests 40 --compare benchmarks/results/<older>.json
+    python -m benchmarks.bench_api --requests 200 --concurrency 100 --max-queued 40   # overload
+
+Drives main.app in-process through httpx, reports p50/p95/p99 request
+latency (of admitted requests), throughput, requests turned away with 503,
+per-stage mean time and peak RSS, and writes the run to benchmarks/results/
+as JSON for comparing commits.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).parent / "results"
+LINES_PER_PAGE = 60
+
+
+def parse_range(value: str):
+    """"5" -> 5, "1-50" -> (1, 50)"""
+    if "-" in value:
+        low, high = value.split("-", 1)
+        return int(low), int(high)
+    return int(value)
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux; children covers the local-parse process pool
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round((own + children) / scale, 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def build_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=40, help="number of HTTP requests")
+    ap.add_argument("--files-per-request", type=int, default=1)
+    ap.add_argument("--concurrency", type=int, default=8, help="requests in flight")
+    ap.add_argument("--endpoint", choices=["upload", "jobs"], default="upload")
+    ap.add_argument("--view", choices=["full", "compact", "summary"], default="full", help="result view requested")
+    ap.add_argument("--line-items", type=parse_range, default=(1, 40), help='e.g. "10" or "1-40"')
+    ap.add_argument("--terms-pages", type=parse_range, default=(0, 2), help='e.g. "0" or "0-2"')
+    ap.add_argument("--parse-median", type=float, default=0.5, help="stub LlamaParse median latency (s)")
+    ap.add_argument("--parse-sigma", type=float, default=0.4)
+    ap.add_argument("--parse-error-rate", type=float, default=0.0)
+    ap.add_argument("--llm-median", type=float, default=1.0, help="stub lx.extract median latency (s)")
+    ap.add_argument("--llm-sigma", type=float, default=0.4)
+    ap.add_argument("--llm-error-rate", type=float, default=0.0)
+    ap.add_argument("--max-queued", type=int, help="MAX_QUEUED_FILES admission limit (default: the app's)")
+    ap.add_argument("--local-parse", action=argparse.BooleanOptionalAction, default=False,
+                    help="let aparse_file try the local text layer first")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, default=RESULTS_DIR)
+    ap.add_argument("--compare", type=Path, help="earlier result JSON to diff against")
+    return ap.parse_args()
+
+
+def install_stubs(args, workdir: Path):
+    """Point the backend at temp dirs and replace the remote calls. Must run before using main."""
+    os.environ["CACHE_DIR"] = str(workdir / "cache")
+    os.environ["RESULTS_DB"] = str(workdir / "results.db")
+    os.environ.setdefault("LLAMA_CLOUD_API_KEY", "offline-benchmark")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.max_queued:
+        os.environ["MAX_QUEUED_FILES"] = str(args.max_queued)
+
+    import langextract as lx
+    import parse
+
+    from benchmarks.stubs import LatencyModel, StubExtract, StubParser
+
+    parser = StubParser(LatencyModel(args.parse_median, args.parse_sigma, args.parse_error_rate, seed=args.seed))
+    extract = StubExtract(LatencyModel(args.llm_median, args.llm_sigma, args.llm_error_rate, seed=args.seed + 1))
+    parse.parser = parser
+    parse.LOCAL_PARSE_ENABLED = args.local_parse and parse.HAS_PDFPLUMBER
+    lx.extract = extract
+
+    import main
+
+    main.PDF_DIR = workdir / "pdf"
+    main.PDF_DIR.mkdir()
+    return main, parser, extract
+
+
+async def drive(app, args, pdfs):
+    import httpx
+
+    latencies = []
+    errors = 0
+    rejected = 0
+    response_bytes = 0
+    files_done = 0
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def one(client, i):
+        nonlocal errors, files_done, rejected, response_bytes
+        batch = [pdfs[(i * args.files_per_request + k) % len(pdfs)] for k in range(args.files_per_request)]
+        files = [("files", (name, data, "application/pdf")) for name, data in batch]
+        async with slots:
+            start = time.perf_counter()
+            if args.endpoint == "upload":
+                response = await client.post("/upload-pdf", params={"view": args.view}, files=files)
+                if response.status_code == 503:
+                    rejected += 1
+                    return
+                response_bytes += len(response.content)
+                results = response.json().get("results", [])
+            else:
+                response = await client.post("/jobs", files=files)
+                if response.status_code == 503:
+                    rejected += 1
+                    return
+                job = response.json()
+                # The stream ends once every file has a result
+                await client.get(job["stream_url"])
+                response = await client.get(job["status_url"], params={"view": args.view})
+                response_bytes += len(response.content)
+                results = response.json()["results"]
+            latencies.append(time.perf_counter() - start)
+        files_done += len(results)
+        errors += sum(1 for r in results if not r or r.get("error"))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(args.requests)))
+        wall = time.perf_counter() - start
+    return latencies, wall, files_done, errors, rejected, response_bytes
+
+
+def compare(current: dict, previous_path: Path) -> None:
+    previous = json.loads(previous_path.read_text())
+    rows = [
+        ("p50 latency (s)", ("latency_s", "p50")),
+        ("p95 latency (s)", ("latency_s", "p95")),
+        ("p99 latency (s)", ("latency_s", "p99")),
+        ("throughput (files/s)", ("throughput_files_per_s",)),
+        ("response KB / file", ("response_kb_per_file",)),
+        ("peak RSS (MB)", ("peak_rss_mb",)),
+    ]
+    print(f"\ncompared with {previous_path.name} ({previous.get('git_commit')})")
+    for label, path in rows:
+        old, new = previous, current
+        for key in path:
+            old, new = old.get(key, {}), new.get(key, {})
+        if isinstance(old, (int, float)) and old:
+            print(f"  {label:<22} {old:>10.3f} -> {new:>10.3f}  ({(new - old) / old:+.1%})")
+
+
+def main():
+    args = build_args()
+    with tempfile.TemporaryDirectory(prefix="invoice-bench-") as tmp:
+        app_module, parser, extract = install_stubs(args, Path(tmp))
+
+        from benchmarks.synthetic import make_corpus, make_pdf
+        from metrics import STAGE_SECONDS
+
+        n_files = args.requests * args.files_per_request
+        corpus = make_corpus(n_files, line_items=args.line_items, seed=args.seed, terms_pages=args.terms_pages)
+        pdfs = []
+        for i, (text, _) in enumerate(corpus):
+            data = make_pdf(text, lines_per_page=LINES_PER_PAGE)
+            lines = text.splitlines()
+            parser.known_pages[hashlib.sha256(data).hexdigest()] = [
+                "\n".join(lines[j:j + LINES_PER_PAGE]) for j in range(0, len(lines), LINES_PER_PAGE)
+            ]
+            pdfs.append((f"invoice_{i}.pdf", data))
+
+        latencies, wall, files_done, errors, rejected, response_bytes = asyncio.run(drive(app_module.app, args, pdfs))
+
+    stages = {
+        key[0]: {"count": s["count"], "mean_s": round(s["sum"] / s["count"], 4)}
+        for key, s in STAGE_SECONDS.snapshot().items() if s["count"]
+    }
+    config = {k: (list(v) if isinstance(v, tuple) else v) for k, v in vars(args).items() if k not in ("out", "compare")}
+    result = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "config": config,
+        "requests": len(latencies),
+        "files": files_done,
+        "errors": errors,
+        "rejected": rejected,
+        "response_kb_per_file": round(response_bytes / 1024 / files_done, 2) if files_done else 0.0,
+        "wall_s": round(wall, 3),
+        "throughput_files_per_s": round(files_done / wall, 3) if wall else 0.0,
+        "latency_s": {
+            "p50": round(percentile(latencies, 50), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+            "max": round(max(latencies), 4) if latencies else 0.0,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stages,
+        "stub_calls": {"parser": parser.calls, "extract": extract.calls, "extract_documents": extract.documents},
+    }
+
+    print(json.dumps(result, indent=2))
+    args.out.mkdir(parents=True, exist_ok=True)
+    out_path = args.out / f"{time.strftime('%Y%m%d-%H%M%S')}-{result['git_commit']}.json"
+    out_path.write_text(json.dumps(result, indent=2))
+    print(f"\nsaved {out_path}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_compact.py
+"""
+Tokens sent to the LLM with and without input compaction.
+
+    python -m benchmarks.bench_compact --docs 50 --line-items 5,60 --terms-pages 0,3
+
+Builds paginated synthetic invoices (repeated page header, page footers,
+terms pages, long item tables), compacts them and reports estimated tokens
+before / after, compaction time and how many ground-truth values survived
+with intervals that map back onto the original text.
+"""
+import argparse
+import statistics
+import time
+
+import langextract as lx
+
+from compact import compact
+
+from benchmarks.synthetic import make_corpus, paginate
+
+
+def _range(value: str):
+    lo, _, hi = value.partition(",")
+    return (int(lo), int(hi)) if hi else int(lo)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=50)
+    ap.add_argument("--line-items", type=_range, default=(5, 60), help="N or MIN,MAX")
+    ap.add_argument("--terms-pages", type=_range, default=(0, 3), help="N or MIN,MAX")
+    ap.add_argument("--lines-per-page", type=int, default=50)
+    args = ap.parse_args()
+
+    corpus = make_corpus(args.docs, line_items=args.line_items, terms_pages=args.terms_pages)
+    before = after = kept = total = remapped = 0
+    ratios, timings = [], []
+    for i, (text, values) in enumerate(corpus):
+        text = paginate(text, args.lines_per_page, header=f"Hibiscus Trading Sdn Bhd | Invoice {i:05d}")
+        t0 = time.perf_counter()
+        compacted = compact(text)
+        timings.append(time.perf_counter() - t0)
+        before += compacted.tokens_before
+        after += compacted.tokens_after
+        ratios.append(compacted.tokens_after / compacted.tokens_before)
+
+        # Pretend the model found every value still present in the compacted text
+        doc = lx.data.AnnotatedDocument(text=compacted.text, extractions=[])
+        for field, value in values.items():
+            total += 1
+            start = compacted.text.find(value)
+            if start >= 0:
+                kept += 1
+                doc.extractions.append(lx.data.Extraction(
+                    field, value, char_interval=lx.data.CharInterval(start_pos=start, end_pos=start + len(value))
+                ))
+        for x in compacted.to_original(doc).extractions:
+            remapped += text[x.char_interval.start_pos:x.char_interval.end_pos] == x.extraction_text
+
+    print(f"docs               {args.docs}")
+    print(f"tokens before      {before}  ({before / args.docs:.0f}/doc)")
+    print(f"tokens after       {after}  ({after / args.docs:.0f}/doc)")
+    print(f"reduction          {1 - after / before:.1%}  (median per doc {1 - statistics.median(ratios):.1%})")
+    print(f"values kept        {kept}/{total}")
+    print(f"intervals remapped {remapped}/{kept}")
+    print(f"compact time       {statistics.mean(timings) * 1000:.2f} ms/doc (max {max(timings) * 1000:.2f})")
+
+
+if __name__ == "__main__":
+    main()
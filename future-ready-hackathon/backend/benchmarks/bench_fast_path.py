@@ -0,0 +1,66 @@
+# benchmarks/bench_fast_path.py
+"""
+How much of the mandatory-field set does the rule-based fast path resolve?
+
+    python -m benchmarks.bench_fast_path --docs 500
+
+Reports per-field coverage and precision against the synthetic ground truth,
+how many documents skip the LLM entirely, and extraction time per document.
+"""
+import argparse
+import time
+from collections import Counter
+
+from fast_extract import FAST_FIELDS, missing_fields, pre_extract
+from invoice_runner import mandatory_fields
+
+from benchmarks.synthetic import make_corpus
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--docs", type=int, default=500)
+    ap.add_argument("--line-items", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    corpus = make_corpus(args.docs, line_items=args.line_items, seed=args.seed)
+
+    present, found, correct = Counter(), Counter(), Counter()
+    resolved_per_doc = []
+    llm_skipped = 0
+    elapsed = 0.0
+    for text, truth in corpus:
+        t0 = time.perf_counter()
+        extractions = pre_extract(text)
+        elapsed += time.perf_counter() - t0
+
+        resolved_per_doc.append(len(extractions))
+        if not missing_fields(extractions, mandatory_fields, text=text):
+            llm_skipped += 1
+        got = {x.extraction_class: x.extraction_text for x in extractions}
+        for field in FAST_FIELDS:
+            if field in truth:
+                present[field] += 1
+                if field in got:
+                    found[field] += 1
+                    correct[field] += got[field] == truth[field]
+
+    print(f"{'field':<42} {'coverage':>9} {'precision':>10}")
+    for field in FAST_FIELDS:
+        if present[field]:
+            coverage = found[field] / present[field]
+            precision = correct[field] / found[field] if found[field] else 0.0
+            print(f"{field:<42} {coverage:>8.1%} {precision:>10.1%}")
+
+    n = len(corpus)
+    avg = sum(resolved_per_doc) / n
+    print()
+    print(f"documents:                     {n}")
+    print(f"fields resolved per document:  {avg:.1f} / {len(mandatory_fields)} ({avg / len(mandatory_fields):.1%})")
+    print(f"documents skipping the LLM:    {llm_skipped} ({llm_skipped / n:.1%})")
+    print(f"fast path time per document:   {elapsed / n * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# benchmarks/bench_fields.py
+"""
+Matching extractions to the mandatory fields: exact names against the
+alias index in invoice_schema.
+
+    python -m benchmarks.bench_fields --extractions 100000 --variants 0.5
+
+Builds an extraction list whose classes are the API's field names, or with
+probability --variants a variant of one (official name, alias, different
+case / quotes / punctuation, the model's typos) plus some unknown classes,
+then times the old exact-name lookup, canonicalizing every name without the
+index cache, and select_fields (cold and warm cache). Reports ns per
+extraction and the share of extractions each approach matches to a field.
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from invoice_schema import ALIAS_INDEX, FIELD_NAMES, MANDATORY_FIELDS, canonical_name, resolve_field, select_fields
+
+_UNKNOWN = ["Supplier Name", "Buyer Name", "Page", "Bank Account", "Remarks", "Tax Amount", "Discount"]
+
+
+def _variant(rng: random.Random, field: str) -> str:
+    name = rng.choice((field, *FIELD_NAMES[field]))
+    style = rng.randrange(4)
+    if style == 0:
+        name = name.upper()
+    elif style == 1:
+        name = name.lower()
+    elif style == 2:
+        name = name.replace("'", "’").replace(" ", "  ")
+    return name + rng.choice(["", ":", " .", ""])
+
+
+def make_extractions(count: int, variants: float, unknown: float, seed: int):
+    rng = random.Random(seed)
+    extractions = []
+    for _ in range(count):
+        if rng.random() < unknown:
+            name = rng.choice(_UNKNOWN)
+        else:
+            field = rng.choice(MANDATORY_FIELDS)
+            name = _variant(rng, field) if rng.random() < variants else field
+        extractions.append(SimpleNamespace(
+            extraction_class=name, extraction_text=f"value {rng.randrange(1000)}",
+            char_interval=None, alignment_status=None,
+        ))
+    return extractions
+
+
+def match_exact(extractions):
+    """What create_mandatory_fields_structure_simple used to do."""
+    found = {}
+    for extraction in extractions:
+        if extraction.extraction_class and extraction.extraction_text:
+            found[extraction.extraction_class] = extraction
+    return {field: found[field] for field in MANDATORY_FIELDS if field in found}
+
+
+def match_uncached(extractions):
+    best = {}
+    for extraction in extractions:
+        field = ALIAS_INDEX.get(canonical_name(extraction.extraction_class))
+        if field is not None:
+            best.setdefault(field, extraction)
+    return best
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--extractions", type=int, default=100000)
+    ap.add_argument("--variants", type=float, default=0.5, help="fraction of classes that are variants")
+    ap.add_argument("--unknown", type=float, default=0.05, help="fraction of classes that are no field")
+    ap.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    extractions = make_extractions(args.extractions, args.variants, args.unknown, args.seed)
+    print(f"{len(extractions)} extractions, {len({x.extraction_class for x in extractions})} distinct classes, "
+          f"index of {len(ALIAS_INDEX)} names")
+    names = set(MANDATORY_FIELDS)
+    exact = sum(x.extraction_class in names for x in extractions) / len(extractions)
+    aliased = sum(resolve_field(x.extraction_class) is not None for x in extractions) / len(extractions)
+
+    resolve_field.cache_clear()
+    _, cold_s = timed(lambda: select_fields(extractions), 1)
+    runs = [
+        ("exact names", timed(lambda: match_exact(extractions), args.repeat)[1], exact),
+        ("canonicalize each", timed(lambda: match_uncached(extractions), args.repeat)[1], aliased),
+        ("alias index (cold)", cold_s, aliased),
+        ("alias index", timed(lambda: select_fields(extractions), args.repeat)[1], aliased),
+    ]
+    print(f"{'matcher':<20} {'ms':>8} {'ns/extraction':>14} {'matched':>8}")
+    for name, seconds, matched in runs:
+        print(f"{name:<20} {seconds * 1000:>8.1f} {seconds * 1e9 / len(extractions):>14.0f} {matched:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
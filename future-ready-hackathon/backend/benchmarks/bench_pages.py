@@ -0,0 +1,99 @@
+# benchmarks/bench_pages.py
+"""
+Whole-document vs page-incremental extraction latency by page count.
+
+    python -m benchmarks.bench_pages --pages 2,5,10,20,40 --latency 0.5
+
+Long synthetic invoices (line-item tables spread over N pages, terms pages
+at the end) go through the API's LLM step twice against a stub lx.extract
+whose latency grows with the number of chunks it has to process, as
+lx.extract's does: once over the whole compacted document, once through
+page_extract.extract_pages. Both ask for every field present in the
+document; the stub answers the ones actually on the text it is given.
+
+Item rows are plain text by default, as pdfplumber reads a table without
+ruling lines; --pipes keeps them as a Markdown table. Compaction already
+shrinks these repetitive synthetic tables a lot; --no-compact models
+documents whose pages don't compact (every line distinct).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+# The benchmark measures extraction, not the provider rate limit
+os.environ.setdefault("GEMINI_RPS", "0")
+
+import langextract as lx
+
+import compact as compact_module
+import invoice_runner
+from compact import compact
+from fast_extract import pre_extract
+from page_extract import PAGE_SEPARATOR, extract_pages
+
+from benchmarks.stubs import LatencyModel, StubExtract
+from benchmarks.synthetic import make_invoice, paginate
+
+
+def _ints(value: str):
+    return [int(v) for v in value.split(",")]
+
+
+async def measure(pages, fields):
+    batcher = invoice_runner.ExtractionBatcher(max_wait=0.01)
+    text = PAGE_SEPARATOR.join(pages)
+
+    t0 = time.perf_counter()
+    compacted = compact(text)
+    full = compacted.to_original(await batcher.extract(compacted.text, fields=fields))
+    full_seconds = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    paged, report = await extract_pages(pages, fields, batcher.extract)
+    page_seconds = time.perf_counter() - t0
+
+    found_full = {x.extraction_class for x in full.extractions}
+    found_paged = {x.extraction_class for x in paged.extractions}
+    return full_seconds, page_seconds, report, len(found_full & set(fields)), len(found_paged & set(fields))
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pages", type=_ints, default=[2, 5, 10, 20, 40])
+    ap.add_argument("--docs", type=int, default=3, help="documents per page count")
+    ap.add_argument("--lines-per-page", type=int, default=50)
+    ap.add_argument("--pipes", action="store_true", help="keep item rows as a pipe table")
+    ap.add_argument("--no-compact", action="store_true", help="turn input compaction off")
+    ap.add_argument("--latency", type=float, default=0.5, help="stub seconds per round of chunks")
+    args = ap.parse_args()
+
+    compact_module.COMPACT_ENABLED = not args.no_compact
+    lx.extract = StubExtract(LatencyModel(median=args.latency, sigma=0.0), chunked=True, found_only=True)
+
+    print(f"{'pages':>5} {'full s':>8} {'paged s':>8} {'speedup':>8} {'waves':>6} {'pages used':>10} {'fields full/paged':>18}")
+    for target in args.pages:
+        rows = []
+        for seed in range(args.docs):
+            # ~1 line per item; the last page or two are terms and conditions
+            items = max(1, (target - 1) * args.lines_per_page - 40)
+            text, _ = make_invoice(seed, line_items=items, layout="markdown", terms_pages=1)
+            if not args.pipes:
+                text = text.replace(" | ", "   ")
+            pages = paginate(text, args.lines_per_page, header="Hibiscus Trading Sdn Bhd | Statement").split(PAGE_SEPARATOR)
+            fields = sorted({x.extraction_class for x in pre_extract(PAGE_SEPARATOR.join(pages))})
+            rows.append((len(pages), *await measure(pages, fields), len(fields)))
+
+        full = statistics.mean(r[1] for r in rows)
+        paged = statistics.mean(r[2] for r in rows)
+        print(
+            f"{statistics.mean(r[0] for r in rows):>5.0f} {full:>8.2f} {paged:>8.2f} {full / paged:>7.1f}x"
+            f" {statistics.mean(r[3]['waves'] for r in rows):>6.1f}"
+            f" {statistics.mean(r[3]['pages_extracted'] for r in rows):>10.1f}"
+            f" {sum(r[4] for r in rows):>8}/{sum(r[5] for r in rows)} of {sum(r[6] for r in rows)}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# benchmarks/bench_payload.py
+"""
+Size and encode time of /upload-pdf responses per view and encoder.
+
+    python -m benchmarks.bench_payload --files 20 --line-items 5,60
+
+Builds upload results the way main.process_saved_upload does (markdown
+pages, fast-path extractions, mandatory-field structure) for synthetic
+invoices, then for each view reports the encode time of FastAPI's default
+path (jsonable_encoder + json.dumps) against fastjson, and the body size
+raw, gzipped and zstd-compressed (when zstandard is installed).
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi.encoders import jsonable_encoder
+
+import fastjson
+from fast_extract import pre_extract
+from page_extract import PAGE_SEPARATOR
+from payload import GZIP_LEVEL, VIEWS, ZSTD_LEVEL, shape_result, zstandard
+from scoring import score
+
+from benchmarks.synthetic import make_corpus, paginate
+
+
+def _range(value: str):
+    lo, _, hi = value.partition(",")
+    return (int(lo), int(hi)) if hi else int(lo)
+
+
+def build_results(args):
+    results = []
+    corpus = make_corpus(args.files, line_items=args.line_items, terms_pages=args.terms_pages)
+    for i, (text, _) in enumerate(corpus):
+        pages = paginate(text, args.lines_per_page).split(PAGE_SEPARATOR)
+        extractions = pre_extract(text)
+        structured, summary = score(extractions)
+        results.append({
+            "filename": f"{i:032x}_invoice_{i}.pdf",
+            "summary": summary,
+            "markdown_pages": pages,
+            "structured_data": structured,
+            "extractions": extractions,
+            "visualization_url": f"/visualization/{i:032x}_invoice_{i}.pdf",
+            "compaction": {"tokens_before": 0, "tokens_after": 0, "chars_before": 0, "chars_after": 0},
+            "duplicate_of": None,
+        })
+    return results
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--files", type=int, default=20, help="results per response")
+    ap.add_argument("--line-items", type=_range, default=(5, 60), help="N or MIN,MAX")
+    ap.add_argument("--terms-pages", type=_range, default=(0, 2), help="N or MIN,MAX")
+    ap.add_argument("--lines-per-page", type=int, default=60)
+    ap.add_argument("--repeat", type=int, default=5, help="best of N encodes")
+    args = ap.parse_args()
+
+    results = build_results(args)
+    print(f"{args.files} files per response, encoder: {'orjson' if fastjson.orjson else 'stdlib json'}")
+    print(f"{'view':<8} {'default ms':>10} {'fastjson ms':>11} {'speedup':>8} "
+          f"{'raw KB':>9} {'gzip KB':>8} {'zstd KB':>8}")
+    for view in VIEWS:
+        def default():
+            shaped = {"results": [shape_result(r, view) for r in results]}
+            return json.dumps(jsonable_encoder(shaped), ensure_ascii=False).encode("utf-8")
+
+        def fast():
+            return fastjson.dumps({"results": [shape_result(r, view) for r in results]})
+
+        _, default_s = timed(default, args.repeat)
+        body, fast_s = timed(fast, args.repeat)
+        gzipped = len(gzip.compress(body, GZIP_LEVEL))
+        zstd = len(zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)) if zstandard else None
+        print(
+            f"{view:<8} {default_s * 1000:>10.2f} {fast_s * 1000:>11.2f} {default_s / fast_s:>7.1f}x "
+            f"{len(body) / 1024:>9.1f} {gzipped / 1024:>8.1f} "
+            f"{zstd / 1024 if zstd else float('nan'):>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_rescore.py
+"""
+Re-scoring a results store from its artifacts against re-running every
+invoice through LlamaParse + Gemini.
+
+    python -m benchmarks.bench_rescore --invoices 2000 --workers 1,4 --backlog 1000000
+
+Fills a scratch store with synthetic invoices the way the API saves them
+(parsed document + fast-path extraction result as artifacts, scored under an
+older rule version), then times rescore.Rescorer over all of them for each
+--workers count, plus the incremental no-op run once everything is current.
+Projects the rows/s onto a --backlog of invoices next to a re-run bound by
+--remote-seconds per invoice at --remote-concurrency.
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fast_extract import pre_extract
+from invoice_runner import merge_results, result_to_dict
+from rescore import Rescorer
+from scoring import create_mandatory_fields_structure_simple, summary_line
+from store import ResultsStore
+
+from benchmarks.synthetic import make_corpus
+
+
+def _range(value: str):
+    lo, _, hi = value.partition(",")
+    return (int(lo), int(hi)) if hi else int(lo)
+
+
+def fill_store(store: ResultsStore, count: int, line_items, seed: int) -> None:
+    for i, (text, _) in enumerate(make_corpus(count, line_items=line_items, seed=seed)):
+        result = merge_results(text, pre_extract(text))
+        structured = create_mandatory_fields_structure_simple(result.extractions)
+        store.save(
+            f"{i:032x}_invoice_{i}.pdf", f"{i:064x}", structured, summary=summary_line(structured),
+            artifacts={"parsed": {"text": text, "markdown_pages": [text]}, "result": result_to_dict(result)},
+            score_version="old",
+        )
+
+
+def _duration(seconds: float) -> str:
+    if seconds >= 86400:
+        return f"{seconds / 86400:.1f} days"
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 60:.1f} min"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--invoices", type=int, default=2000)
+    ap.add_argument("--line-items", type=_range, default=(5, 60), help="N or MIN,MAX per invoice")
+    ap.add_argument("--workers", default="1,4", help="comma-separated worker counts to time")
+    ap.add_argument("--batch-size", type=int, default=200)
+    ap.add_argument("--backlog", type=int, default=1_000_000, help="invoices to project onto")
+    ap.add_argument("--remote-seconds", type=float, default=20.0, help="parse + LLM time per invoice")
+    ap.add_argument("--remote-concurrency", type=int, default=8, help="invoices in flight on a re-run")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench-rescore-") as tmp:
+        store = ResultsStore(Path(tmp) / "results.db")
+        started = time.perf_counter()
+        fill_store(store, args.invoices, args.line_items, args.seed)
+        print(f"{args.invoices} invoices stored in {time.perf_counter() - started:.1f} s, "
+              f"{store.stats()['artifact_bytes'] / 1e6:.1f} MB of artifacts")
+
+        print(f"{'run':<18} {'s':>8} {'rows/s':>9} {'changed':>8} {'unchanged':>9} {'backlog':>12}")
+        best = 0.0
+        for workers in (int(w) for w in args.workers.split(",")):
+            store._conn().execute("UPDATE invoices SET score_version = 'old'")
+            progress = Rescorer(store, workers=workers, batch_size=args.batch_size).run()
+            rate = progress["done"] / progress["seconds"]
+            best = max(best, rate)
+            print(f"{f'{workers} worker(s)':<18} {progress['seconds']:>8.2f} {rate:>9,.0f} "
+                  f"{progress['changed']:>8} {progress['unchanged']:>9} {_duration(args.backlog / rate):>12}")
+        progress = Rescorer(store, workers=1, batch_size=args.batch_size).run()
+        print(f"{'incremental no-op':<18} {progress['seconds']:>8.2f} {'':>9} "
+              f"{progress['changed']:>8} {progress['unchanged']:>9}")
+
+    remote = args.backlog * args.remote_seconds / args.remote_concurrency
+    print(f"{args.backlog:,} invoices: re-score {_duration(args.backlog / best)}, "
+          f"re-upload ~{_duration(remote)} ({args.remote_seconds:g} s each, {args.remote_concurrency} in flight)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+# benchmarks/bench_scale.py
+"""
+Throughput of the multi-process deployment (JOB_QUEUE=sqlite) against the
+number of extraction workers, with stubbed LlamaParse and Gemini.
+
+    python -m benchmarks.bench_scale --workers 1,2,4,8 --api-workers 2
+    python -m benchmarks.bench_scale --workers 1,4 --min-efficiency 0.8   # gate
+
+For each --workers count this starts `uvicorn main:app` with --api-workers
+processes and that many worker.py processes (each --concurrency items at a
+time) on fresh job queue, results store, cache and upload directories,
+uploads --files-per-worker synthetic invoices per worker through POST /jobs
+and reads every job's stream to the end. The stubs only sleep, so with
+enough cores left over the throughput should grow with the worker count;
+efficiency is files/s per worker over that of the first count. Provider
+rate limits are lifted (they are split between the processes, so in
+production they cap the total whatever the worker count). Also checks
+that every file got a result and a results-store row. Exits 1 on missing
+results or when an efficiency falls below --min-efficiency.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+LINES_PER_PAGE = 60
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_worker(options: dict, stubs: dict, ready) -> None:
+    """Target of one spawned worker process: install the stubs, then worker.serve."""
+    import langextract as lx
+    import parse
+
+    from benchmarks.stubs import LatencyModel, StubExtract, StubParser
+
+    known_pages = json.loads(Path(stubs["known_pages"]).read_text())
+    seed = os.getpid()
+    parse.parser = StubParser(LatencyModel(stubs["parse_median"], stubs["sigma"], seed=seed), known_pages)
+    lx.extract = StubExtract(LatencyModel(stubs["llm_median"], stubs["sigma"], seed=seed + 1))
+
+    import main  # noqa: F401  (the slow part of startup, before saying ready)
+    import worker
+
+    ready.put(os.getpid())
+    worker.serve(**options)
+
+
+def make_uploads(count: int, seed: int, workdir: Path):
+    """(name, PDF bytes) of `count` distinct invoices; their page texts go to a file for the stub parser."""
+    from benchmarks.synthetic import make_corpus, make_pdf
+
+    uploads, known_pages = [], {}
+    for i, (text, _) in enumerate(make_corpus(count, line_items=(1, 40), seed=seed)):
+        data = make_pdf(text, lines_per_page=LINES_PER_PAGE)
+        lines = text.splitlines()
+        known_pages[hashlib.sha256(data).hexdigest()] = [
+            "\n".join(lines[j:j + LINES_PER_PAGE]) for j in range(0, len(lines), LINES_PER_PAGE)
+        ]
+        uploads.append((f"invoice_{i}.pdf", data))
+    path = workdir / "known_pages.json"
+    path.write_text(json.dumps(known_pages))
+    return uploads, path
+
+
+async def drive(base_url: str, uploads, files_per_job: int):
+    """Submit every upload as /jobs requests and read all streams; (seconds, results, errors)."""
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        started = time.perf_counter()
+        jobs = []
+        for i in range(0, len(uploads), files_per_job):
+            files = [("files", (name, data, "application/pdf")) for name, data in uploads[i:i + files_per_job]]
+            response = await client.post("/jobs", files=files)
+            response.raise_for_status()
+            jobs.append(response.json())
+
+        async def read(job):
+            lines = []
+            async with client.stream("GET", job["stream_url"], params={"view": "summary"}) as response:
+                async for line in response.aiter_lines():
+                    if line:
+                        lines.append(json.loads(line))
+            return [event["result"] for event in lines if "result" in event]
+
+        results = [r for rs in await asyncio.gather(*(read(job) for job in jobs)) for r in rs]
+        seconds = time.perf_counter() - started
+    errors = sum(1 for r in results if not r or r.get("error"))
+    return seconds, results, errors
+
+
+def run_once(args, workers: int, uploads, known_pages: Path, workdir: Path) -> dict:
+    workdir.mkdir()
+    env = {
+        **os.environ,
+        "JOB_QUEUE": "sqlite",
+        "JOB_DB": str(workdir / "jobs.db"),
+        "JOB_POLL_SECONDS": "0.05",
+        "JOB_QUEUE_MAX_ITEMS": str(len(uploads) + 1),
+        "RESULTS_DB": str(workdir / "results.db"),
+        "CACHE_DIR": str(workdir / "cache"),
+        "PDF_DIR": str(workdir / "pdf"),
+        "LOCAL_PARSE": "0",
+        "WARM_UP": "0",
+        "LOG_LEVEL": "WARNING",
+        "LLAMA_CLOUD_API_KEY": os.environ.get("LLAMA_CLOUD_API_KEY", "offline-benchmark"),
+        # Lets the workers' warm-up build the model client; the stubs never call it
+        "LANGEXTRACT_API_KEY": os.environ.get("LANGEXTRACT_API_KEY", "offline-benchmark"),
+    }
+    # The real quotas are split between the processes and would cap the
+    # total whatever the worker count; leave each worker room for its items
+    room = str(2 * args.concurrency * workers)
+    for prefix in ("LLAMAPARSE", "GEMINI"):
+        env[f"{prefix}_RPS"] = "0"
+        env[f"{prefix}_MAX_CONCURRENCY"] = room
+    # Spawned children copy this process's environment
+    saved_env = dict(os.environ)
+    os.environ.update(env)
+    port = _free_port()
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.api_workers), "--log-level", "warning"],
+        cwd=BACKEND, env={**env, "API_WORKERS": str(args.api_workers)},
+    )
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    stubs = {"known_pages": str(known_pages), "parse_median": args.parse_median,
+             "llm_median": args.llm_median, "sigma": args.sigma}
+    options = dict(db=env["JOB_DB"], concurrency=args.concurrency, workers=workers,
+                   poll_seconds=0.05, drain_seconds=5, log_level="WARNING")
+    processes = [context.Process(target=_run_worker, args=(options, stubs, ready)) for _ in range(workers)]
+    try:
+        for process in processes:
+            process.start()
+        for _ in processes:
+            ready.get(timeout=120)
+        import httpx
+
+        base_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if httpx.get(f"{base_url}/health").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise SystemExit("API did not come up")
+            time.sleep(0.1)
+
+        count = workers * args.files_per_worker
+        seconds, results, errors = asyncio.run(drive(base_url, uploads[:count], args.files_per_job))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        api.terminate()
+        api.wait()
+        os.environ.clear()
+        os.environ.update(saved_env)
+
+    with sqlite3.connect(workdir / "results.db") as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+    return {"workers": workers, "files": count, "results": len(results), "stored": rows,
+            "errors": errors, "seconds": seconds, "rate": len(results) / seconds}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", default="1,2,4", help="comma-separated extraction worker counts")
+    ap.add_argument("--api-workers", type=int, default=2, help="uvicorn worker processes")
+    ap.add_argument("--concurrency", type=int, default=4, help="items in flight per extraction worker")
+    ap.add_argument("--files-per-worker", type=int, default=24, help="files uploaded per extraction worker")
+    ap.add_argument("--files-per-job", type=int, default=8, help="files per POST /jobs")
+    ap.add_argument("--parse-median", type=float, default=0.5, help="stub LlamaParse median latency (s)")
+    ap.add_argument("--llm-median", type=float, default=1.0, help="stub lx.extract median latency (s)")
+    ap.add_argument("--sigma", type=float, default=0.2, help="log-normal spread of the stub latencies")
+    ap.add_argument("--min-efficiency", type=float, default=0.0, help="fail below this scaling efficiency")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    counts = [int(w) for w in args.workers.split(",")]
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="bench-scale-") as tmp:
+        tmp = Path(tmp)
+        uploads, known_pages = make_uploads(max(counts) * args.files_per_worker, args.seed, tmp)
+        print(f"{args.api_workers} API worker(s), {args.concurrency} items in flight per extraction worker, "
+              f"stub latency parse {args.parse_median:g} s + LLM {args.llm_median:g} s")
+        print(f"{'workers':>7} {'files':>6} {'s':>7} {'files/s':>8} {'speedup':>8} {'efficiency':>10} {'errors':>6}")
+        base = None
+        for workers in counts:
+            run = run_once(args, workers, uploads, known_pages, tmp / f"run-{workers}")
+            per_worker = run["rate"] / workers
+            base = base or per_worker
+            efficiency = per_worker / base
+            print(f"{workers:>7} {run['files']:>6} {run['seconds']:>7.2f} {run['rate']:>8.2f} "
+                  f"{run['rate'] / base:>8.2f} {efficiency:>10.0%} {run['errors']:>6}")
+            if run["results"] != run["files"] or run["stored"] != run["files"]:
+                print(f"  {run['files']} files, {run['results']} results, {run['stored']} stored rows")
+                failed = True
+            if efficiency < args.min_efficiency:
+                failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_scheduler.py
+"""
+Naive concurrent calls vs the outbound scheduler against a local
+rate-limited upstream (benchmarks.fake_upstream).
+
+    python -m benchmarks.bench_scheduler --requests 100 --quota-rps 10 --quota-concurrency 4
+
+The naive client fires everything at once and retries a 429 straight away
+(up to --attempts times); the scheduler client goes through
+OutboundScheduler.call with a token bucket at the quota rate. Reports
+successes, 429s received, wall time and successful calls per second.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from scheduler import OutboundScheduler, Provider
+
+from benchmarks.fake_upstream import FakeUpstream
+
+
+async def run_naive(client, url, requests, attempts):
+    async def one():
+        for _ in range(attempts):
+            response = await client.post(url)
+            if response.status_code != 429:
+                response.raise_for_status()
+                return True
+        return False
+
+    return await asyncio.gather(*(one() for _ in range(requests)), return_exceptions=True)
+
+
+async def run_scheduled(client, url, requests, attempts, rate, concurrency):
+    scheduler = OutboundScheduler()
+    scheduler.add_provider(Provider(
+        "upstream", rate=rate, burst=rate, max_concurrency=concurrency * 4,
+        initial_concurrency=concurrency * 2, max_attempts=attempts, deadline=600,
+    ))
+
+    async def post():
+        response = await client.post(url)
+        response.raise_for_status()
+        return True
+
+    return await asyncio.gather(
+        *(scheduler.call("upstream", post) for _ in range(requests)), return_exceptions=True
+    )
+
+
+async def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--quota-rps", type=float, default=10, help="upstream requests per second")
+    ap.add_argument("--quota-concurrency", type=int, default=4, help="upstream concurrent requests")
+    ap.add_argument("--latency", type=float, default=0.05, help="upstream latency per request (s)")
+    ap.add_argument("--attempts", type=int, default=5, help="attempts per request")
+    args = ap.parse_args()
+
+    limits = httpx.Limits(max_connections=args.requests, max_keepalive_connections=args.requests)
+    for name in ("naive", "scheduler"):
+        upstream = FakeUpstream(args.quota_rps, args.quota_concurrency, args.latency)
+        async with upstream.running() as base_url, httpx.AsyncClient(limits=limits, timeout=60) as client:
+            url = f"{base_url}/v1/work"
+            t0 = time.perf_counter()
+            if name == "naive":
+                outcomes = await run_naive(client, url, args.requests, args.attempts)
+            else:
+                outcomes = await run_scheduled(
+                    client, url, args.requests, args.attempts, args.quota_rps, args.quota_concurrency
+                )
+            elapsed = time.perf_counter() - t0
+        ok = sum(1 for o in outcomes if o is True)
+        print(
+            f"{name:<10} {ok:>5}/{args.requests} ok  {upstream.throttled:>6} x 429  "
+            f"{elapsed:>7.2f} s  {ok / elapsed:>7.2f} ok/s"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
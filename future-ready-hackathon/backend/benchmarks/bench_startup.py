@@ -0,0 +1,107 @@
+# benchmarks/bench_startup.py
+"""
+Cold-import time of the API module and the cost of the startup warm-up.
+
+    python -m benchmarks.bench_startup --runs 5 --budget-ms 400
+
+Imports `main` in fresh interpreters --runs times and reports the median
+wall time, the slowest top-level imports (from -X importtime) and any
+heavy dependency (langextract, llama-index, uvicorn, ...) that got loaded
+although it is only needed once a request or the warm-up runs. Then times
+main.warm_up() in one more interpreter (API keys missing just show up as a
+failed step). Exits 1 when the median import exceeds --budget-ms or a
+heavy dependency is imported eagerly, so it can gate CI.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+# Loaded lazily by parse / invoice_runner, never by `import main`
+HEAVY = ("langextract", "llama_cloud_services", "llama_index", "google.genai", "uvicorn")
+
+_IMPORT = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"ms": elapsed * 1000, "heavy": heavy}}))
+"""
+
+_WARM_UP = """
+import json, time
+import main
+started = time.perf_counter()
+steps = main.warm_up()
+print(json.dumps({"ms": (time.perf_counter() - started) * 1000, "steps": steps}))
+main.parse.shutdown()
+"""
+
+
+def run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "LOG_LEVEL": "WARNING"}
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code], cwd=BACKEND, env=env,
+        capture_output=True, text=True, check=True,
+    )
+
+
+def slowest_imports(stderr: str, top: int):
+    """Modules imported directly by main, by cumulative import time (-X importtime output)."""
+    children, totals = {}, {}
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if not match:
+            continue
+        depth, name = len(match.group(2)), match.group(3)
+        if depth == 3:
+            children[name] = int(match.group(1))
+        elif depth == 1:
+            # importtime lists a module after everything it imported
+            if name == "main":
+                totals = children
+            children = {}
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5, help="fresh interpreters to time the import in")
+    ap.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    ap.add_argument("--budget-ms", type=float, default=400, help="fail when the median import is slower")
+    ap.add_argument("--skip-warm-up", action="store_true")
+    args = ap.parse_args()
+
+    code = _IMPORT.format(heavy=HEAVY)
+    samples = [json.loads(run(code).stdout.splitlines()[-1]) for _ in range(args.runs)]
+    median_ms = statistics.median(sample["ms"] for sample in samples)
+    heavy = sorted({name for sample in samples for name in sample["heavy"]})
+
+    print(f"import main: median {median_ms:.0f} ms over {args.runs} runs "
+          f"(min {min(s['ms'] for s in samples):.0f}, max {max(s['ms'] for s in samples):.0f}), "
+          f"budget {args.budget_ms:.0f} ms")
+    print("slowest imports by main (cumulative):")
+    for name, us in slowest_imports(run(code, "-X", "importtime").stderr, args.top):
+        print(f"  {name:<32} {us / 1000:>8.1f} ms")
+    print(f"heavy modules loaded at import: {', '.join(heavy) or 'none'}")
+
+    if not args.skip_warm_up:
+        warm = json.loads(run(_WARM_UP).stdout.splitlines()[-1])
+        print(f"warm_up(): {warm['ms']:.0f} ms")
+        for name, step in warm["steps"].items():
+            error = f"  ({step['error'].splitlines()[0]})" if "error" in step else ""
+            print(f"  {name:<10} {step['seconds'] * 1000:>8.0f} ms{error}")
+
+    if median_ms > args.budget_ms or heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
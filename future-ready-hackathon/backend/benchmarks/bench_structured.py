@@ -0,0 +1,88 @@
+# benchmarks/bench_structured.py
+"""
+How much of the LLM's work LlamaParse's structured output saves, checked on
+recorded parser output.
+
+    python -m benchmarks.bench_structured --fixtures benchmarks/fixtures/llamaparse
+
+Every fixture holds the markdown pages and structured_data of one parsed
+invoice plus the field values structured_extract must map out of it. For
+each one this checks the mapping against them, then runs the upload path's
+order (fast path, structured data, missing_fields) and reports how many
+fields each stage covered and which ones would still go to the LLM. Ends
+with the mapping time per invoice and the share of invoices that need no
+LLM call at all. Exits 1 when a mapping differs from the fixture.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+from fast_extract import missing_fields, pre_extract
+from invoice_schema import MANDATORY_FIELDS
+from page_extract import join_pages
+from structured_extract import structured_extract
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "llamaparse"
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--fixtures", type=Path, default=FIXTURES, help="directory of *.json fixtures")
+    ap.add_argument("--repeat", type=int, default=200, help="best of N mapping runs")
+    args = ap.parse_args()
+
+    fixtures = sorted(args.fixtures.glob("*.json"))
+    if not fixtures:
+        raise SystemExit(f"no fixtures in {args.fixtures}")
+
+    failed = 0
+    skipped_llm = 0
+    total_s = 0.0
+    print(f"{'fixture':<16} {'rules':>5} {'structured':>10} {'aligned':>7} {'llm':>4}  mapping")
+    for path in fixtures:
+        fixture = json.loads(path.read_text(encoding="utf-8"))
+        text, _ = join_pages(fixture["markdown_pages"])
+        structured_data = fixture["structured_data"]
+
+        mapped, seconds = timed(lambda: structured_extract(structured_data, text), args.repeat)
+        total_s += seconds
+        got = {x.extraction_class: x.extraction_text for x in mapped}
+        expected = fixture["expected"]
+        diffs = [
+            f"{field}: {got.get(field)!r} != {expected.get(field)!r}"
+            for field in MANDATORY_FIELDS
+            if got.get(field) != expected.get(field)
+        ]
+
+        fast = pre_extract(text)
+        extra = structured_extract(structured_data, text, skip={x.extraction_class for x in fast})
+        llm_fields = missing_fields(fast + extra, MANDATORY_FIELDS, text=text)
+        skipped_llm += not llm_fields
+        aligned = sum(x.char_interval is not None for x in extra)
+        print(f"{path.stem:<16} {len(fast):>5} {len(extra):>10} {aligned:>7} {len(llm_fields):>4}  "
+              f"{'ok' if not diffs else f'{len(diffs)} differ'}")
+        if llm_fields:
+            print(f"  LLM still asked for: {', '.join(llm_fields)}")
+        for diff in diffs:
+            print(f"  {diff}")
+        failed += bool(diffs)
+
+    print(f"mapping: {total_s / len(fixtures) * 1e6:.0f} us per invoice; "
+          f"{skipped_llm}/{len(fixtures)} invoices need no LLM call")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# benchmarks/bench_validate.py
+"""
+Line-item validation throughput: a per-row Python loop against the batched
+engine in utils.invoice_utils.
+
+    python -m benchmarks.bench_validate --invoices 200 --line-items 10,2000 --error-rate 0.02
+
+Builds to_structured-shaped invoices with RM-formatted amounts, corrupts
+--error-rate of the rows (wrong subtotal or tax), then times a naive
+validator that parses every cell with Decimal and checks each row in a loop
+against validate_invoices, and checks both flag the same rows. Reports rows
+per second for each.
+"""
+import argparse
+import random
+import time
+from decimal import Decimal, InvalidOperation
+
+from utils.invoice_utils import (
+    QUANTITY,
+    SUBTOTAL,
+    TAX_RATE,
+    TOTAL_EXCLUDING_TAX,
+    TOTAL_INCLUDING_TAX,
+    TOTAL_PAYABLE,
+    UNIT_PRICE,
+    parse_number,
+    validate_invoices,
+)
+
+
+def _range(value: str):
+    lo, _, hi = value.partition(",")
+    return (int(lo), int(hi)) if hi else int(lo)
+
+
+def _money(cents: int) -> str:
+    return f"RM {cents / 100:,.2f}"
+
+
+def make_invoices(count: int, line_items, error_rate: float, seed: int):
+    rng = random.Random(seed)
+    invoices, corrupted = [], 0
+    for i in range(count):
+        n = rng.randint(*line_items) if isinstance(line_items, tuple) else line_items
+        items = []
+        for _ in range(n):
+            qty = rng.randint(1, 50)
+            unit = rng.randint(100, 500000)
+            subtotal = qty * unit
+            rate = rng.choice([0, 6, 8, 10])
+            including = subtotal + (subtotal * rate + 50) // 100
+            if rng.random() < error_rate:
+                corrupted += 1
+                if rng.random() < 0.5:
+                    subtotal += rng.randint(2, 1000)
+                else:
+                    including += rng.randint(2, 1000)
+            items.append({
+                QUANTITY: str(qty),
+                UNIT_PRICE: _money(unit),
+                SUBTOTAL: _money(subtotal),
+                TAX_RATE: f"{rate}%",
+                TOTAL_EXCLUDING_TAX: _money(subtotal),
+                TOTAL_INCLUDING_TAX: _money(including),
+                TOTAL_PAYABLE: _money(including),
+            })
+        invoices.append({
+            "supplier": {"Supplier's TIN": f"C{i:011d}"},
+            "buyer": {"Buyer's TIN": "EI00000000010"},
+            "invoice": {"Invoice Currency Code": "MYR"},
+            "items": items,
+        })
+    return invoices, corrupted
+
+
+def _decimal(text):
+    try:
+        return Decimal(text.replace("RM", "").replace(",", "").replace("%", "").strip())
+    except (AttributeError, InvalidOperation):
+        return None
+
+
+def validate_naive(invoices):
+    """Row by row with Decimal: the two arithmetic checks only."""
+    flagged = []
+    for index, invoice in enumerate(invoices):
+        for row, item in enumerate(invoice["items"]):
+            qty, unit, subtotal = (_decimal(item.get(k)) for k in (QUANTITY, UNIT_PRICE, SUBTOTAL))
+            if None not in (qty, unit, subtotal) and abs(qty * unit - subtotal) > Decimal("0.01"):
+                flagged.append((index, row))
+                continue
+            rate, excluding, including = (
+                _decimal(item.get(k)) for k in (TAX_RATE, TOTAL_EXCLUDING_TAX, TOTAL_INCLUDING_TAX)
+            )
+            if None not in (rate, excluding, including):
+                if abs(excluding * (1 + rate / 100) - including) > Decimal("0.01"):
+                    flagged.append((index, row))
+    return flagged
+
+
+def validate_batched(invoices):
+    results = validate_invoices(invoices)
+    return sorted({
+        (index, entry["row"])
+        for index, result in enumerate(results)
+        for entry in result["rows"]
+        if entry["check"] in ("quantity_x_unit_price", "tax_rate")
+    })
+
+
+def timed(fn, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--invoices", type=int, default=200)
+    ap.add_argument("--line-items", type=_range, default=(10, 2000), help="N or MIN,MAX per invoice")
+    ap.add_argument("--error-rate", type=float, default=0.02, help="fraction of rows corrupted")
+    ap.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    invoices, corrupted = make_invoices(args.invoices, args.line_items, args.error_rate, args.seed)
+    rows = sum(len(invoice["items"]) for invoice in invoices)
+    print(f"{args.invoices} invoices, {rows} line items, {corrupted} corrupted")
+
+    naive, naive_s = timed(lambda: validate_naive(invoices), args.repeat)
+    # Cold: the parse cache only helps across repeated cell values
+    parse_number.cache_clear()
+    batched, cold_s = timed(lambda: validate_batched(invoices), 1)
+    _, batched_s = timed(lambda: validate_batched(invoices), args.repeat)
+
+    print(f"{'validator':<16} {'ms':>9} {'rows/s':>12} {'flagged':>8}")
+    print(f"{'per-row loop':<16} {naive_s * 1000:>9.1f} {rows / naive_s:>12,.0f} {len(naive):>8}")
+    print(f"{'batched (cold)':<16} {cold_s * 1000:>9.1f} {rows / cold_s:>12,.0f} {len(batched):>8}")
+    print(f"{'batched':<16} {batched_s * 1000:>9.1f} {rows / batched_s:>12,.0f} {len(batched):>8}")
+    print(f"speedup {naive_s / batched_s:.1f}x (cold {naive_s / cold_s:.1f}x), "
+          f"same rows flagged: {sorted(naive) == batched}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/fake_upstream.py
+"""
+Local stand-in for a rate-limited provider (LlamaParse / Gemini).
+
+Accepts at most `rps` requests per one-second window and `concurrency`
+requests at a time; anything over quota gets a 429 with a Retry-After
+header, like the real APIs do. Each accepted request takes `latency`
+seconds.
+
+    server = FakeUpstream(rps=10, concurrency=4)
+    async with server.running() as base_url:
+        ...
+"""
+import asyncio
+import contextlib
+import math
+import socket
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+class FakeUpstream:
+    def __init__(self, rps: float = 10, concurrency: int = 4, latency: float = 0.05):
+        self.rps = rps
+        self.concurrency = concurrency
+        self.latency = latency
+        self.accepted = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self._window = 0
+        self._window_count = 0
+        self.app = Starlette(routes=[Route("/v1/work", self.work, methods=["POST"])])
+
+    async def work(self, request: Request):
+        now = time.monotonic()
+        window = math.floor(now)
+        if window != self._window:
+            self._window, self._window_count = window, 0
+        if self._window_count >= self.rps or self.in_flight >= self.concurrency:
+            self.throttled += 1
+            retry_after = max(0.05, window + 1 - now)
+            return JSONResponse(
+                {"error": "RESOURCE_EXHAUSTED"}, status_code=429,
+                headers={"Retry-After": f"{retry_after:.2f}"},
+            )
+        self._window_count += 1
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        self.accepted += 1
+        return JSONResponse({"ok": True})
+
+    @contextlib.asynccontextmanager
+    async def running(self):
+        """Serve on a free localhost port for the duration of the block; yields the base URL."""
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=port, log_level="warning"))
+        task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            yield f"http://127.0.0.1:{port}"
+        finally:
+            server.should_exit = True
+            await task
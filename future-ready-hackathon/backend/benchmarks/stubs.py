@@ -0,0 +1,182 @@
+# benchmarks/stubs.py
+"""
+Local stand-ins for the remote services, with configurable latency.
+
+- StubLanguageModel: a langextract model, for exercising lx.extract itself
+- StubParser:        drop-in for parse.parser (LlamaParse.aparse)
+- StubExtract:       drop-in for lx.extract (skips langextract entirely)
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import langextract as lx
+from langextract.core import base_model, types
+
+from fast_extract import pre_extract
+
+
+class StubUpstreamError(Exception):
+    """Raised by the stubs to simulate a failing remote call."""
+
+    def __init__(self, status_code: int, message: str = ""):
+        super().__init__(f"{status_code} {message or 'stub upstream error'}")
+        self.status_code = status_code
+
+
+class LatencyModel:
+    """
+    Log-normal latency around `median` seconds (sigma controls the tail),
+    plus an independent failure probability per call.
+    """
+
+    def __init__(self, median=0.5, sigma=0.4, error_rate=0.0, error_status=503, seed=0):
+        self.median = median
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.median <= 0:
+                return 0.0
+            return self._rng.lognormvariate(math.log(self.median), self.sigma)
+
+    def maybe_fail(self) -> None:
+        with self._lock:
+            failed = self._rng.random() < self.error_rate
+        if failed:
+            raise StubUpstreamError(self.error_status)
+
+    def to_dict(self) -> dict:
+        return {"median": self.median, "sigma": self.sigma, "error_rate": self.error_rate}
+
+
+class StubLanguageModel(base_model.BaseLanguageModel):
+    """
+    langextract model that answers every prompt with a fixed extraction
+    after `base_latency + per_char_latency * len(prompt)` seconds. Prompts of
+    one infer() call run in parallel on up to `max_workers` threads, like the
+    Gemini provider does.
+    """
+
+    def __init__(self, base_latency=0.05, per_char_latency=2e-6, max_workers=10, **kwargs):
+        super().__init__(**kwargs)
+        self.base_latency = base_latency
+        self.per_char_latency = per_char_latency
+        self.max_workers = max_workers
+        self.calls = 0
+        self.prompts = 0
+        self.prompt_chars = 0
+
+    def _answer(self, prompt: str) -> str:
+        time.sleep(self.base_latency + self.per_char_latency * len(prompt))
+        payload = {"extractions": [{"Supplier TIN": "C00000000000", "Supplier TIN_attributes": {}}]}
+        return "```json\n" + json.dumps(payload) + "\n```"
+
+    def infer(self, batch_prompts, **kwargs):
+        self.calls += 1
+        self.prompts += len(batch_prompts)
+        self.prompt_chars += sum(len(p) for p in batch_prompts)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batch_prompts)))) as pool:
+            outputs = list(pool.map(self._answer, batch_prompts))
+        for output in outputs:
+            yield [types.ScoredOutput(score=1.0, output=output)]
+
+
+class StubParser:
+    """
+    Stand-in for the LlamaParse client: aparse(path) returns an object with
+    the attributes aparse_remote reads. Page texts come from `known_pages`
+    or else the PDF text layer (pdfplumber), otherwise a placeholder.
+    """
+
+    def __init__(self, latency: LatencyModel = None, known_pages=None):
+        self.latency = latency or LatencyModel(median=2.0)
+        # sha256 of PDF bytes -> page texts, so the benchmark harness doesn't
+        # spend its own CPU re-reading PDFs it generated
+        self.known_pages = known_pages or {}
+        self.calls = 0
+
+    async def aparse(self, pdf_path: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency.sample())
+        self.latency.maybe_fail()
+        with open(pdf_path, "rb") as f:
+            pages = self.known_pages.get(hashlib.sha256(f.read()).hexdigest())
+        if pages is None:
+            pages = await asyncio.to_thread(_read_pages, pdf_path)
+        text = "\n\n".join(pages)
+        return SimpleNamespace(
+            pages=[SimpleNamespace(md=p, structuredData=None) for p in pages],
+            get_text_documents=lambda split_by_page=False: [SimpleNamespace(text=text)],
+        )
+
+
+def _read_pages(pdf_path: str):
+    try:
+        import pdfplumber
+    except ImportError:
+        return [f"stub text for {pdf_path}"]
+    with pdfplumber.open(pdf_path) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+class StubExtract:
+    """
+    Stand-in for lx.extract with the same call signature. Sleeps for one
+    latency sample per round of `max_workers` documents (with `chunked`, per
+    round of `max_workers` max_char_buffer-sized chunks, like lx.extract
+    schedules them), then answers every requested field (the classes used in
+    `examples`): with the value the rule-based fast path finds in the text
+    where possible, else "stub" -- or, with `found_only`, not at all.
+    """
+
+    def __init__(self, latency: LatencyModel = None, chunked: bool = False, found_only: bool = False):
+        self.latency = latency or LatencyModel(median=4.0)
+        self.chunked = chunked
+        self.found_only = found_only
+        self.calls = 0
+        self.documents = 0
+
+    def __call__(self, text_or_documents, prompt_description=None, examples=None, max_workers=10, **kwargs):
+        single = isinstance(text_or_documents, str)
+        documents = [lx.data.Document(text=text_or_documents)] if single else list(text_or_documents)
+        self.calls += 1
+        self.documents += len(documents)
+
+        units = len(documents)
+        if self.chunked:
+            buffer = kwargs.get("max_char_buffer") or 1000
+            units = sum(max(1, math.ceil(len(doc.text) / buffer)) for doc in documents)
+        rounds = max(1, math.ceil(units / max(1, max_workers or 1)))
+        time.sleep(sum(self.latency.sample() for _ in range(rounds)))
+        self.latency.maybe_fail()
+
+        fields = []
+        for example in examples or []:
+            for x in example.extractions:
+                if x.extraction_class not in fields:
+                    fields.append(x.extraction_class)
+
+        results = []
+        for doc in documents:
+            found = {x.extraction_class: x for x in pre_extract(doc.text)}
+            if self.found_only:
+                extractions = [found[f] for f in fields if f in found]
+            else:
+                extractions = [found.get(f) or lx.data.Extraction(f, "stub") for f in fields]
+            results.append(
+                lx.data.AnnotatedDocument(
+                    text=doc.text, document_id=doc.document_id, extractions=extractions
+                )
+            )
+        return results[0] if single else results
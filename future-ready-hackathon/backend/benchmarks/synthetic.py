@@ -0,0 +1,231 @@
+# benchmarks/synthetic.py
+"""
+Synthetic Malaysian e-invoice generator for offline benchmarks.
+
+make_invoice() returns the invoice text plus the ground-truth value of every
+mandatory field it contains, with randomized label wording and layout so the
+fast path sees realistic variation.
+"""
+import random
+import string
+from typing import Dict, List, Tuple
+
+LAYOUTS = ["plain", "markdown", "table"]
+
+_LABELS = {
+    "Supplier TIN": ["Supplier TIN", "Supplier's TIN", "Supplier TIN No."],
+    "Supplier Registration Number": ["Supplier Registration Number", "Supplier Reg. No.", "Supplier BRN"],
+    "Supplier SST ID": ["Supplier SST ID", "Supplier SST Registration No."],
+    "Supplier MSIC code": ["Supplier MSIC code", "MSIC Code"],
+    "Supplier business activity description": ["Business Activity", "Supplier business activity description"],
+    "Supplier Tourism Tax Registration Number": ["Tourism Tax Registration No.", "Supplier Tourism Tax Registration Number"],
+    "Supplier Contact Number": ["Supplier Contact Number", "Supplier Tel."],
+    "Supplier Address": ["Supplier Address", "Address"],
+    "Buyer TIN": ["Buyer TIN", "Buyer's TIN"],
+    "Buyer Registration Number": ["Buyer Registration Number", "Buyer Reg. No."],
+    "Buyer SST Registration ID": ["Buyer SST Registration ID", "Buyer SST ID"],
+    "Buyer Contact Number": ["Buyer Contact Number", "Buyer Phone"],
+    "Buyer Address": ["Buyer Address", "Bill To"],
+    "E-Invoice Version": ["e-Invoice Version", "E-Invoice version"],
+    "E-Invoice Type": ["e-Invoice Type", "E-Invoice Type"],
+    "E-Invoice Code": ["e-Invoice Code", "e-Invoice Number", "E-Invoice No."],
+    "Original Invoice Reference No.": ["Original Invoice Ref. No.", "Original e-Invoice Reference Number"],
+    "Invoice Date and Time": ["Invoice Date and Time", "e-Invoice Date & Time"],
+    "Invoice Currency Code": ["Invoice Currency Code", "Currency"],
+    "Currency Exchange Rate": ["Currency Exchange Rate", "Exchange Rate"],
+    "Subtotal": ["Subtotal", "Sub-total"],
+    "Total excluding Tax": ["Total excluding tax", "Total Excl. Tax"],
+    "Total Including Tax": ["Total including tax", "Total Incl. Tax"],
+    "Total Payable Amount": ["Total payable amount", "Total Payable"],
+    "Digital Signature": ["Digital Signature", "Issuer's Digital Signature"],
+}
+
+_STREETS = ["Jalan Ampang", "Persiaran Jaya", "Jalan Kenanga", "Lorong Bunga", "Jalan Tun Razak"]
+_CITIES = ["50450 Kuala Lumpur", "47301 Petaling Jaya", "10200 George Town", "80000 Johor Bahru"]
+_PRODUCTS = ["Retail display shelves", "Office chairs", "Consulting services", "Printer toner", "Cloud hosting"]
+_UNITS = ["pcs", "unit", "hr", "box", "month"]
+_TERMS = [
+    "Payment is due within 30 days of the invoice date.",
+    "Goods remain the property of the supplier until paid in full.",
+    "Late payments are subject to interest at 1.5% per month.",
+    "Claims for damaged goods must be made within 7 days of delivery.",
+    "This invoice is governed by the laws of Malaysia.",
+]
+
+
+def _digits(rng: random.Random, n: int) -> str:
+    return "".join(rng.choice(string.digits) for _ in range(n))
+
+
+def _money(cents: int) -> str:
+    return f"RM {cents / 100:,.2f}"
+
+
+def _address(rng: random.Random) -> str:
+    return f"Lot {rng.randint(1, 200)}, {rng.choice(_STREETS)}, {rng.choice(_CITIES)}"
+
+
+def make_invoice(
+    seed: int, line_items: int = 5, layout: str = None, terms_pages: int = 0
+) -> Tuple[str, Dict[str, str]]:
+    """
+    Return (invoice_text, {mandatory field -> value present in the text}).
+    `terms_pages` appends that many pages of terms-and-conditions boilerplate.
+    """
+    rng = random.Random(seed)
+    layout = layout or rng.choice(LAYOUTS)
+
+    items = []
+    subtotal = 0
+    for _ in range(line_items):
+        qty = rng.randint(1, 20)
+        unit = rng.randint(100, 500000)
+        subtotal += qty * unit
+        items.append((rng.choice(_PRODUCTS), qty, unit, rng.choice(_UNITS)))
+    tax_rate = rng.choice([0, 6, 8, 10])
+    tax = subtotal * tax_rate // 100
+    tax_type = "E - Tax exemption" if tax_rate == 0 else rng.choice(["01 - Sales Tax", "02 - Service Tax"])
+
+    values = {
+        "Supplier TIN": "C" + _digits(rng, 11),
+        "Supplier Registration Number": _digits(rng, 12),
+        "Supplier SST ID": f"W{_digits(rng, 2)}-{_digits(rng, 4)}-{_digits(rng, 8)}",
+        "Supplier MSIC code": _digits(rng, 5),
+        "Supplier business activity description": rng.choice(["Supermarket", "IT consulting", "Wholesale trade"]),
+        "Supplier Tourism Tax Registration Number": _digits(rng, 12),
+        "Supplier Contact Number": f"+60{_digits(rng, 9)}",
+        "Supplier Address": _address(rng),
+        "Buyer TIN": rng.choice(["EI00000000010", "C" + _digits(rng, 11), "IG" + _digits(rng, 11)]),
+        "Buyer Registration Number": _digits(rng, 12),
+        "Buyer SST Registration ID": f"B{_digits(rng, 2)}-{_digits(rng, 4)}-{_digits(rng, 8)}",
+        "Buyer Contact Number": f"+60{_digits(rng, 9)}",
+        "Buyer Address": _address(rng),
+        "E-Invoice Version": rng.choice(["1.0", "1.1"]),
+        "E-Invoice Type": rng.choice(["01 - Invoice", "02 - Credit Note", "03 - Debit Note"]),
+        "E-Invoice Code": f"INV-{rng.randint(2023, 2025)}-{_digits(rng, 5)}",
+        "Original Invoice Reference No.": rng.choice(["Not Applicable", f"INV-{_digits(rng, 6)}"]),
+        "Invoice Date and Time": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}",
+        "Invoice Currency Code": rng.choice(["MYR", "USD", "SGD"]),
+        "Currency Exchange Rate": rng.choice(["1.0000", "4.4500", "3.3100"]),
+        "Subtotal": _money(subtotal),
+        "Total excluding Tax": _money(subtotal),
+        "Total Including Tax": _money(subtotal + tax),
+        "Total Payable Amount": _money(subtotal + tax),
+        "Digital Signature": "".join(rng.choice("0123456789abcdef") for _ in range(64)),
+    }
+    # Not every invoice carries every optional field
+    for optional in ("Supplier Tourism Tax Registration Number", "Currency Exchange Rate", "Buyer SST Registration ID"):
+        if rng.random() < 0.4:
+            del values[optional]
+
+    def line(field: str) -> str:
+        label = rng.choice(_LABELS[field])
+        value = values[field]
+        if field == "Digital Signature":
+            return f"{label}:\n{value}"
+        if layout == "markdown":
+            return f"**{label}:** {value}"
+        if layout == "table":
+            return f"| {label} | {value} |"
+        return f"{label}: {value}"
+
+    header_fields = [f for f in values if not f.startswith(("Subtotal", "Total", "Digital"))]
+    lines: List[str] = [f"{rng.choice(['Hibiscus', 'Orchid', 'Rafflesia'])} Trading Sdn Bhd", "E-INVOICE", ""]
+    lines += [line(f) for f in header_fields]
+    lines += [
+        "",
+        "Classification | Description | Quantity | Unit Price | Amount | Tax Type | Tax Rate"
+        " | Details of Tax Exemption | Amount Exempted from Tax | Measurement",
+    ]
+    for desc, qty, unit, measure in items:
+        exemption = f"Exempt supply (Schedule A) | {_money(qty * unit)}" if tax_rate == 0 else "- | -"
+        lines.append(
+            f"022 | {desc} | {qty} | {_money(unit)} | {_money(qty * unit)} | {tax_type} | {tax_rate}%"
+            f" | {exemption} | {measure}"
+        )
+    lines.append("")
+    lines += [line(f) for f in values if f.startswith(("Subtotal", "Total"))]
+    lines += ["", line("Digital Signature")]
+    for page in range(terms_pages):
+        lines += ["", f"Terms and Conditions ({page + 1}/{terms_pages})"]
+        lines += [f"{n}. {rng.choice(_TERMS)}" for n in range(1, 50)]
+
+    return "\n".join(lines) + "\n", values
+
+
+def paginate(text: str, lines_per_page: int = 60, header: str = None) -> str:
+    """
+    Lay `text` out like a multi-page LlamaParse markdown export: `header` at
+    the top of every page, a "Page n of m" footer and a --- separator.
+    """
+    rows = text.splitlines()
+    chunks = [rows[i:i + lines_per_page] for i in range(0, len(rows), lines_per_page)] or [[]]
+    pages = []
+    for n, chunk in enumerate(chunks, start=1):
+        page = [header, ""] if header else []
+        page += chunk + ["", f"Page {n} of {len(chunks)}"]
+        pages.append("\n".join(page))
+    return "\n\n---\n\n".join(pages) + "\n"
+
+
+def make_pdf(text: str, lines_per_page: int = 60) -> bytes:
+    """
+    Render plain text into a minimal born-digital PDF (Helvetica, one line per
+    text row), so parsers see a real text layer. No third-party dependency.
+    """
+    rows = text.splitlines() or [""]
+    pages = [rows[i:i + lines_per_page] for i in range(0, len(rows), lines_per_page)]
+
+    def escape(s: str) -> str:
+        s = s.encode("latin-1", "replace").decode("latin-1")
+        return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = []  # object bodies, numbered from 1
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(None)  # pages tree, filled in below
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    kids = []
+    for page_rows in pages:
+        ops = ["BT", "/F1 9 Tf", "11 TL", "36 806 Td"]
+        ops += [f"({escape(r)}) Tj T*" for r in page_rows]
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_corpus(
+    n: int, line_items=5, seed: int = 0, terms_pages=0
+) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    `line_items` and `terms_pages` are either fixed ints or (min, max) ranges
+    sampled per document.
+    """
+    rng = random.Random(seed)
+
+    def pick(value):
+        return rng.randint(*value) if isinstance(value, (tuple, list)) else value
+
+    return [
+        make_invoice(seed + i, line_items=pick(line_items), terms_pages=pick(terms_pages))
+        for i in range(n)
+    ]
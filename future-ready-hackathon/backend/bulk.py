@@ -0,0 +1,378 @@
+# bulk.py
+"""
+Offline bulk mode: check every PDF in a directory tree or ZIP archive and
+write one JSON line per invoice.
+
+    python bulk.py /archive/2025-09 -o results.jsonl --workers 4 --concurrency 16
+    python bulk.py invoices.zip -o results.jsonl          # re-run to resume
+    python bulk.py invoices.zip -o results.jsonl --db results.db   # also make it queryable / re-scorable
+
+Work is split over `--workers` processes; each runs its own event loop with
+up to `--concurrency` invoices in flight, so parsing / LLM calls overlap and
+concurrent extractions share lx.extract calls (ExtractionBatcher ->
+run_ie_batch). Provider rate limits are divided between the processes.
+
+Inputs are enumerated lazily in a fixed order (sorted per directory, archive
+order for ZIPs) and only a bounded window of chunks is in flight, so memory
+doesn't grow with the corpus. Progress is checkpointed next to the output
+(`<output>.checkpoint`): after a crash the same command truncates the output
+to the last checkpoint and carries on with whatever wasn't recorded there.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Iterator, List, Optional, Tuple
+
+import fastjson
+import parse
+from compact import compact
+from fast_extract import missing_fields, pre_extract
+from invoice_runner import ExtractionBatcher, mandatory_fields, merge_results, result_to_dict
+from page_extract import PAGE_MODE_MIN_PAGES, extract_pages, join_pages
+from scheduler import scheduler
+from scoring import SCORE_VERSION, score
+from structured_extract import structured_extract
+from store import ResultsStore
+
+logger = logging.getLogger("invoice.bulk")
+
+# (index, input path, ZIP member name or None)
+Item = Tuple[int, str, Optional[str]]
+
+
+def iter_pdfs(source: str) -> Iterator[Tuple[str, Optional[str]]]:
+    """(path, ZIP member) of every PDF under `source`, in a stable order."""
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(".pdf"):
+                    yield source, info.filename
+        return
+
+    if os.path.isfile(source):
+        yield source, None
+        return
+
+    with os.scandir(source) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_pdfs(entry.path)
+        elif entry.is_file() and entry.name.lower().endswith(".pdf"):
+            yield entry.path, None
+
+
+class Checkpoint:
+    """
+    Which item indices are finished, and how many output bytes belong to
+    them. Finished indices are kept as a low-water mark plus the (small) set
+    of finished indices above it.
+    """
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = source
+        self.next_index = 0
+        self.done = set()
+        self.output_bytes = 0
+
+    @classmethod
+    def load(cls, path: str, source: str) -> Optional["Checkpoint"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("source") != source:
+            raise SystemExit(f"{path} belongs to {data.get('source')!r}, not {source!r}")
+        checkpoint = cls(path, source)
+        checkpoint.next_index = data["next_index"]
+        checkpoint.done = set(data["done"])
+        checkpoint.output_bytes = data["output_bytes"]
+        return checkpoint
+
+    def finished(self, index: int) -> bool:
+        return index < self.next_index or index in self.done
+
+    def mark(self, index: int) -> None:
+        self.done.add(index)
+        while self.next_index in self.done:
+            self.done.remove(self.next_index)
+            self.next_index += 1
+
+    def save(self, output_bytes: int) -> None:
+        self.output_bytes = output_bytes
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "source": self.source,
+                "next_index": self.next_index,
+                "done": sorted(self.done),
+                "output_bytes": output_bytes,
+            }, f)
+        os.replace(tmp, self.path)
+
+
+# ---- worker process side ----
+
+_loop = None
+_batcher = None
+_scratch = None
+_keep_artifacts = False
+_archives = {}
+
+
+def _init_worker(
+    workers: int, batch_max: int, batch_wait: float, log_level: str, scratch: str, keep_artifacts: bool,
+) -> None:
+    global _loop, _batcher, _scratch, _keep_artifacts
+    logging.getLogger("invoice").setLevel(log_level)
+
+    # One event loop for the process lifetime: the scheduler's and batcher's
+    # locks and timers bind to the loop that first uses them
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _batcher = ExtractionBatcher(max_batch=batch_max, max_wait=batch_wait)
+    # This process already is one of `workers`: parse on a thread, not another pool
+    parse.set_local_pool(ThreadPoolExecutor(max_workers=2))
+    for provider in scheduler.providers.values():
+        provider.scale(1 / workers)
+    # ZIP members are unpacked here one at a time
+    _scratch = scratch
+    # Raw artifacts go to the results store with the row, so rescore.py can redo it
+    _keep_artifacts = keep_artifacts
+
+
+def _materialize(path: str, member: Optional[str]) -> Tuple[str, str, bool]:
+    """(local PDF path, sha256, is a temporary copy) for an input item."""
+    if member is None:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return path, digest.hexdigest(), False
+
+    archive = _archives.get(path)
+    if archive is None:
+        archive = _archives[path] = zipfile.ZipFile(path)
+    digest = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(suffix=".pdf", dir=_scratch)
+    with os.fdopen(fd, "wb") as out, archive.open(member) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    return tmp, digest.hexdigest(), True
+
+
+async def _process_item(item: Item) -> dict:
+    index, path, member = item
+    # ZIP members as <archive>/<member>: the results store is keyed by this,
+    # and archives often share member names (invoice.pdf)
+    record = {"index": index, "source": os.path.join(path, member) if member else path}
+    started = time.perf_counter()
+    local_path = None
+    temporary = False
+    try:
+        local_path, content_hash, temporary = await asyncio.to_thread(_materialize, path, member)
+        record["content_hash"] = content_hash
+        parsed = await parse.aparse_file(local_path, key=content_hash)
+        record["parser"] = parsed.get("parser")
+        if parsed.get("error"):
+            record["parse_error"] = parsed["error"]
+
+        pages = parsed.get("markdown_pages") or []
+        page_mode = len(pages) >= PAGE_MODE_MIN_PAGES
+        if page_mode:
+            text, _ = join_pages(pages)
+        else:
+            text = parsed.get("text") or parsed.get("markdown") or "\n\n".join(pages)
+        extractions = []
+        result = None
+        if text:
+            fast_extractions = pre_extract(text)
+            fast_extractions += structured_extract(
+                parsed.get("structured_data"), text, skip={x.extraction_class for x in fast_extractions}
+            )
+            llm_fields = missing_fields(fast_extractions, mandatory_fields, text=text)
+            llm_result = None
+            if llm_fields:
+                try:
+                    if page_mode:
+                        llm_result, record["page_extraction"] = await extract_pages(pages, llm_fields, _batcher.extract)
+                    else:
+                        compacted = compact(text)
+                        record["compaction"] = compacted.report()
+                        llm_result = compacted.to_original(await _batcher.extract(compacted.text, fields=llm_fields))
+                except Exception as e:
+                    record["extraction_error"] = str(e)
+            result = merge_results(text, fast_extractions, llm_result)
+            extractions = result.extractions
+
+        record["structured_data"], record["summary"] = score(extractions)
+        if _keep_artifacts:
+            record["artifacts"] = {
+                "parsed": parsed,
+                "result": result_to_dict(result) if result is not None else None,
+            }
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if temporary and local_path:
+            os.unlink(local_path)
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def _process_chunk(items: List[Item]) -> List[dict]:
+    return _loop.run_until_complete(asyncio.gather(*(_process_item(item) for item in items)))
+
+
+# ---- coordinator side ----
+
+def _chunks(items: Iterator[Item], size: int) -> Iterator[List[Item]]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Progress:
+    def __init__(self, total: Optional[int], already_done: int, interval: float = 1.0):
+        self.total = total
+        self.done = already_done
+        self.processed = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self.interval = interval if sys.stderr.isatty() else max(interval, 10.0)
+        self._last = 0.0
+
+    def update(self, records: List[dict]) -> None:
+        self.done += len(records)
+        self.processed += len(records)
+        self.errors += sum(1 for r in records if "error" in r)
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.print()
+
+    def print(self, final: bool = False) -> None:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        rate = self.processed / elapsed
+        line = f"{self.done}" + (f"/{self.total}" if self.total is not None else "")
+        line += f" done  {rate * 60:.1f}/min  {self.errors} errors"
+        if self.total is not None and rate > 0 and not final:
+            remaining = (self.total - self.done) / rate
+            line += f"  ETA {int(remaining // 3600)}:{int(remaining % 3600 // 60):02d}:{int(remaining % 60):02d}"
+        if sys.stderr.isatty():
+            print(f"\r\033[K{line}", end="\n" if final else "", file=sys.stderr, flush=True)
+        else:
+            print(line, file=sys.stderr, flush=True)
+
+
+def run(args) -> None:
+    source = os.path.abspath(args.input)
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    checkpoint = Checkpoint.load(checkpoint_path, source)
+    if checkpoint is not None and (
+        not os.path.exists(args.output) or os.path.getsize(args.output) < checkpoint.output_bytes
+    ):
+        logger.warning("%s is missing or shorter than %s records, starting over", args.output, checkpoint_path)
+        checkpoint = None
+    if checkpoint is None:
+        checkpoint = Checkpoint(checkpoint_path, source)
+        out = open(args.output, "wb")
+    else:
+        # Lines written after the last checkpoint are redone, not duplicated
+        out = open(args.output, "r+b")
+        out.truncate(checkpoint.output_bytes)
+        out.seek(checkpoint.output_bytes)
+
+    total = None if args.no_count else sum(1 for _ in iter_pdfs(source))
+    already_done = checkpoint.next_index + len(checkpoint.done)
+    progress = Progress(total, already_done)
+    todo = (
+        (index, path, member)
+        for index, (path, member) in enumerate(iter_pdfs(source))
+        if not checkpoint.finished(index)
+    )
+
+    store = ResultsStore(args.db) if args.db else None
+
+    last_save = time.monotonic()
+    scratch = tempfile.mkdtemp(prefix="invoice-bulk-")
+    pool = ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=_init_worker,
+        initargs=(args.workers, args.batch_max, args.batch_wait, args.log_level.upper(), scratch, bool(args.db)),
+    )
+    try:
+        pending = set()
+        chunks = _chunks(todo, args.concurrency)
+        while True:
+            # Keep every worker busy with one chunk queued behind it, no more
+            for chunk in chunks:
+                pending.add(pool.submit(_process_chunk, chunk))
+                if len(pending) >= args.workers * 2:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                records = future.result()
+                for record in records:
+                    artifacts = record.pop("artifacts", None)
+                    out.write(fastjson.dumps(record) + b"\n")
+                    checkpoint.mark(record["index"])
+                    if store is not None and "structured_data" in record:
+                        store.save(
+                            record["source"], record.get("content_hash"),
+                            record["structured_data"], summary=record.get("summary"),
+                            artifacts=artifacts, score_version=SCORE_VERSION,
+                        )
+                progress.update(records)
+            if time.monotonic() - last_save >= args.checkpoint_every:
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.save(out.tell())
+                last_save = time.monotonic()
+    finally:
+        out.flush()
+        os.fsync(out.fileno())
+        checkpoint.save(out.tell())
+        out.close()
+        pool.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(scratch, ignore_errors=True)
+        progress.print(final=True)
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("input", help="directory, ZIP archive or single PDF")
+    ap.add_argument("-o", "--output", required=True, help="JSONL file, one line per invoice")
+    ap.add_argument("--checkpoint", help="checkpoint path (default: <output>.checkpoint)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    ap.add_argument("--concurrency", type=int, default=16, help="invoices in flight per worker")
+    ap.add_argument("--batch-max", type=int, default=16, help="documents per lx.extract call")
+    ap.add_argument("--batch-wait", type=float, default=0.2, help="seconds to wait for a fuller batch")
+    ap.add_argument("--db", help="also insert results into this SQLite results store")
+    ap.add_argument("--checkpoint-every", type=float, default=5.0, help="seconds between checkpoints")
+    ap.add_argument("--no-count", action="store_true", help="skip the counting pass (no ETA)")
+    ap.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "WARNING"))
+    args = ap.parse_args(argv)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
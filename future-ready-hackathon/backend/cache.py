@@ -0,0 +1,209 @@
+# cache.py
+"""
+Content-addressed cache for parse and extraction results.
+
+Entries are keyed by the SHA-256 of the uploaded PDF (plus a version string
+for extraction results) and live in two tiers:
+
+- memory: an LRU bounded by total serialized size
+- disk:   one JSON file per entry under CACHE_DIR, LRU by mtime, bounded by size
+
+Both tiers honour the same TTL. Values must be JSON-serializable.
+
+Several processes (API and worker.py processes, on one host or sharing
+CACHE_DIR) can use the same disk tier: entries are replaced atomically and
+each process keeps its own memory tier.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+import fastjson
+
+
+class ResultCache:
+    def __init__(
+        self,
+        root: Path,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600,
+    ):
+        self.root = Path(root)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        # key -> (stored_at, size, value)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes: Optional[int] = None  # computed lazily on first write
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    # ---- helpers ----
+
+    def _count(self, namespace: str, counter: str, n: int = 1) -> None:
+        ns = self._stats.setdefault(
+            namespace,
+            {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0},
+        )
+        ns[counter] += n
+
+    def _path(self, namespace: str, key: str) -> Path:
+        return self.root / namespace / key[:2] / f"{key}.json"
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - stored_at > self.ttl_seconds
+
+    def _memory_put(self, mkey: str, stored_at: float, size: int, value: Any) -> None:
+        old = self._memory.pop(mkey, None)
+        if old is not None:
+            self._memory_bytes -= old[1]
+        if size > self.max_memory_bytes:
+            return
+        self._memory[mkey] = (stored_at, size, value)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, evicted_size, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    def _scan_disk_bytes(self) -> int:
+        total = 0
+        if self.root.exists():
+            for p in self.root.rglob("*.json"):
+                try:
+                    total += p.stat().st_size
+                except OSError:
+                    pass
+        return total
+
+    def _evict_disk(self, namespace: str) -> None:
+        """Drop least recently used files until the disk tier fits again."""
+        entries = []
+        for p in self.root.rglob("*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # Leave some headroom so we don't rescan on every write
+        target = int(self.max_disk_bytes * 0.9)
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+                self._count(namespace, "evictions")
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    # ---- public API ----
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        mkey = f"{namespace}:{key}"
+        with self._lock:
+            entry = self._memory.get(mkey)
+            if entry is not None:
+                if self._expired(entry[0]):
+                    self._memory.pop(mkey)
+                    self._memory_bytes -= entry[1]
+                    self._count(namespace, "expired")
+                else:
+                    self._memory.move_to_end(mkey)
+                    self._count(namespace, "hits")
+                    self._count(namespace, "memory_hits")
+                    return entry[2]
+
+        path = self._path(namespace, key)
+        try:
+            raw = path.read_bytes()
+            record = fastjson.loads(raw)
+        except (OSError, ValueError):
+            with self._lock:
+                self._count(namespace, "misses")
+            return None
+
+        with self._lock:
+            if self._expired(record.get("stored_at", 0)):
+                self._count(namespace, "expired")
+                self._count(namespace, "misses")
+                try:
+                    path.unlink()
+                    if self._disk_bytes is not None:
+                        self._disk_bytes -= len(raw)
+                except OSError:
+                    pass
+                return None
+            # Touch the file so disk eviction is LRU rather than FIFO
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            value = record.get("value")
+            self._memory_put(mkey, record.get("stored_at", time.time()), len(raw), value)
+            self._count(namespace, "hits")
+            self._count(namespace, "disk_hits")
+            return value
+
+    def set(self, namespace: str, key: str, value: Any) -> None:
+        stored_at = time.time()
+        raw = fastjson.dumps({"stored_at": stored_at, "value": value})
+        path = self._path(namespace, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so readers never see a half-written entry. The
+        # temp name is unique across processes and hosts sharing CACHE_DIR
+        # (pid / thread ids repeat between containers)
+        tmp = path.with_suffix(f".{uuid4().hex}.tmp")
+        tmp.write_bytes(raw)
+        try:
+            replaced = path.stat().st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.replace(tmp, path)
+
+        with self._lock:
+            self._count(namespace, "sets")
+            self._memory_put(f"{namespace}:{key}", stored_at, len(raw), value)
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(raw) - replaced
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk(namespace)
+
+    async def aget(self, namespace: str, key: str) -> Optional[Any]:
+        """Async version of get; disk reads run off the event loop."""
+        return await asyncio.to_thread(self.get, namespace, key)
+
+    async def aset(self, namespace: str, key: str, value: Any) -> None:
+        """Async version of set; disk writes run off the event loop."""
+        await asyncio.to_thread(self.set, namespace, key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            namespaces = {}
+            for name, counters in self._stats.items():
+                lookups = counters["hits"] + counters["misses"]
+                namespaces[name] = {
+                    **counters,
+                    "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+                }
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "namespaces": namespaces,
+            }
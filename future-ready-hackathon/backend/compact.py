@@ -0,0 +1,242 @@
+# compact.py
+"""
+Input compaction between parsing and the LLM.
+
+Parsed invoices carry a lot the model doesn't need: per-page headers and
+footers, page separators and page numbers, terms-and-conditions prose and
+long line-item tables. compact() drops those, collapses whitespace and keeps
+an offset map, so char_intervals the model returns against the compacted
+text can be moved back onto the original text:
+
+    compacted = compact(text)
+    result = run_ie(compacted.text, fields=...)
+    result = compacted.to_original(result)   # char_intervals point into `text`
+"""
+import bisect
+import collections
+import copy
+import hashlib
+import os
+import re
+from typing import List, Tuple
+
+from fast_extract import item_header_columns
+from metrics import Counter, REGISTRY
+
+COMPACT_ENABLED = os.getenv("COMPACT_INPUT", "1") != "0"
+# Line-item rows kept for the model (it only needs a sample, the fast path
+# and the first row cover the mandatory item columns)
+COMPACT_ITEM_ROWS = int(os.getenv("COMPACT_ITEM_ROWS", 3))
+# A non-table line seen this many times is page boilerplate; the first copy stays
+COMPACT_REPEAT_MIN = int(os.getenv("COMPACT_REPEAT_MIN", 3))
+# Sentences at least this long, with no "Label:" in them, are treated as prose
+COMPACT_PROSE_WORDS = int(os.getenv("COMPACT_PROSE_WORDS", 10))
+
+# Part of the extraction cache key: changing the rules changes the LLM input
+COMPACT_VERSION = hashlib.sha256(
+    f"2:{COMPACT_ENABLED}:{COMPACT_ITEM_ROWS}:{COMPACT_REPEAT_MIN}:{COMPACT_PROSE_WORDS}".encode()
+).hexdigest()[:12]
+
+COMPACT_TOKENS = REGISTRY.register(Counter(
+    "invoice_compact_tokens_total", "Estimated LLM input tokens before / after compaction", ["when"]
+))
+
+_SEPARATOR = re.compile(r"^(?:-{3,}|_{3,}|={3,}|\*{3,})$")
+_PAGE_NUMBER = re.compile(r"^(?:page[ \t]*)?\d+[ \t]*(?:of|/)[ \t]*\d+$|^page[ \t]*\d+$", re.I)
+_RULE_ROW = set("|-: ")
+_WS_RUN = re.compile(r"[ \t\f\v]{2,}|[\t\f\v]")
+_DIGITS = re.compile(r"\d+")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (words and punctuation); good enough for before/after ratios."""
+    return len(_TOKEN.findall(text))
+
+
+class OffsetMap:
+    """Maps positions in a compacted text back to the text it was cut from."""
+
+    def __init__(self):
+        # Parallel lists of runs copied verbatim: compacted start, original start, length
+        self._starts: List[int] = []
+        self._origins: List[int] = []
+        self._lengths: List[int] = []
+
+    def add(self, start: int, origin: int, length: int) -> None:
+        if (
+            self._starts
+            and self._starts[-1] + self._lengths[-1] == start
+            and self._origins[-1] + self._lengths[-1] == origin
+        ):
+            self._lengths[-1] += length
+            return
+        self._starts.append(start)
+        self._origins.append(origin)
+        self._lengths.append(length)
+
+    def position(self, pos: int) -> int:
+        """Original position of the character at compacted position `pos`."""
+        if not self._starts:
+            return pos
+        i = max(0, bisect.bisect_right(self._starts, pos) - 1)
+        return self._origins[i] + min(max(pos - self._starts[i], 0), self._lengths[i] - 1)
+
+    def interval(self, start: int, end: int) -> Tuple[int, int]:
+        """Original [start, end) covering the compacted [start, end)."""
+        if end <= start:
+            origin = self.position(start)
+            return origin, origin
+        return self.position(start), self.position(end - 1) + 1
+
+
+class Compacted:
+    def __init__(self, text: str, offsets: OffsetMap, source: str):
+        self.text = text
+        self.offsets = offsets
+        self.tokens_before = estimate_tokens(source)
+        self.tokens_after = estimate_tokens(text)
+        self.chars_before = len(source)
+        self.chars_after = len(text)
+
+    def report(self) -> dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "chars_before": self.chars_before,
+            "chars_after": self.chars_after,
+        }
+
+    def to_original(self, result, offset: int = 0):
+        """
+        Copy of an AnnotatedDocument extracted from `self.text` with its
+        char_intervals moved onto the original text, plus `offset` (where that
+        text starts in a larger document, e.g. a page). `result` itself is left
+        alone: coalesced requests share one result object.
+        """
+        result = copy.deepcopy(result)
+        for extraction in getattr(result, "extractions", None) or []:
+            interval = extraction.char_interval
+            if interval is None or interval.start_pos is None or interval.end_pos is None:
+                continue
+            start, end = self.offsets.interval(interval.start_pos, interval.end_pos)
+            interval.start_pos, interval.end_pos = start + offset, end + offset
+            # Token positions were computed on the compacted text
+            extraction.token_interval = None
+        return result
+
+
+def _normalize(line: str) -> str:
+    """Key for spotting repeated boilerplate: "Page 2 of 5" == "Page 3 of 5"."""
+    return _DIGITS.sub("0", " ".join(line.lower().split()))
+
+
+def _is_prose(line: str) -> bool:
+    return (
+        line[-1] in ".;!?"
+        and ":" not in line
+        and "|" not in line
+        and len(line.split()) >= COMPACT_PROSE_WORDS
+    )
+
+
+def compact(text: str) -> Compacted:
+    """Compact `text` for the LLM; see module docstring."""
+    offsets = OffsetMap()
+    if not COMPACT_ENABLED or not text:
+        offsets.add(0, 0, len(text))
+        compacted = Compacted(text, offsets, text)
+        COMPACT_TOKENS.inc(compacted.tokens_before, when="before")
+        COMPACT_TOKENS.inc(compacted.tokens_after, when="after")
+        return compacted
+
+    # (start, end, stripped line) for every line, end excluding the line break
+    lines = []
+    pos = 0
+    for raw in text.splitlines(keepends=True):
+        body = raw.rstrip("\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+        lead = len(body) - len(body.lstrip())
+        lines.append((pos + lead, pos + len(body.rstrip()), body.strip()))
+        pos += len(raw)
+
+    repeats = collections.Counter(_normalize(line) for _, _, line in lines if line and line.count("|") < 2)
+
+    parts: List[str] = []
+    size = 0
+
+    def emit(piece: str, origin: int) -> None:
+        nonlocal size
+        parts.append(piece)
+        offsets.add(size, origin, len(piece))
+        size += len(piece)
+
+    seen = set()
+    item_rows = 0
+    item_header_kept = False
+    # Pipes in the item table header: rows continued on the next page (after
+    # the page break, without a header) are recognised by the same shape.
+    # Cleared once the table ends on its own page, so later tables of the
+    # same width (totals, payment details) are not taken for items.
+    item_pipes = None
+    in_items = False
+    page_break = False
+    blank_pending = False
+    last_end = 0
+    for start, end, line in lines:
+        if not line:
+            in_items = False
+            blank_pending = size > 0
+            continue
+
+        if item_header_columns(line) is not None:
+            in_items = True
+            page_break = False
+            if item_header_kept:
+                continue
+            item_header_kept = True
+            item_pipes = line.count("|")
+        elif (in_items and "|" in line) or (item_pipes and page_break and line.count("|") == item_pipes):
+            in_items = True
+            page_break = False
+            if set(line) <= _RULE_ROW:
+                if item_rows:
+                    continue
+            else:
+                item_rows += 1
+                if item_rows > COMPACT_ITEM_ROWS:
+                    continue
+        else:
+            in_items = False
+            if _SEPARATOR.match(line) or _PAGE_NUMBER.match(line):
+                page_break = True
+                continue
+            if _is_prose(line):
+                continue
+            key = _normalize(line)
+            if repeats[key] >= COMPACT_REPEAT_MIN and line.count("|") < 2:
+                if key in seen:
+                    continue
+                seen.add(key)
+            elif not page_break or line.count("|") >= 2:
+                # Kept on the same page as the last item row, or another table
+                item_pipes = None
+
+        if size:
+            # One newline between kept lines, a blank line where the text had one
+            emit("\n\n" if blank_pending else "\n", last_end)
+        blank_pending = False
+        last_end = end
+        chunk = text[start:end]
+        copied = 0
+        for m in _WS_RUN.finditer(chunk):
+            if m.start() > copied:
+                emit(chunk[copied:m.start()], start + copied)
+            emit(" ", start + m.start())
+            copied = m.end()
+        if copied < len(chunk):
+            emit(chunk[copied:], start + copied)
+
+    compacted = Compacted("".join(parts), offsets, text)
+    COMPACT_TOKENS.inc(compacted.tokens_before, when="before")
+    COMPACT_TOKENS.inc(compacted.tokens_after, when="after")
+    return compacted
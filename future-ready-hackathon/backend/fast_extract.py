@@ -0,0 +1,220 @@
+# fast_extract.py
+"""
+Deterministic pre-extractor for the rigidly formatted mandatory fields.
+
+Runs a handful of label + value regexes over the parsed invoice text and
+returns lx.data.Extraction objects (with char intervals into that text) using
+the same field names as invoice_runner.mandatory_fields. Whatever it finds
+doesn't need to be asked from the LLM.
+"""
+import re
+from typing import TYPE_CHECKING, Iterable, List, Set
+
+from invoice_schema import resolve_field
+
+if TYPE_CHECKING:  # imported lazily, it is slow to import
+    import langextract as lx
+
+# Separator between a label and its value: "Label: value", "**Label:** value",
+# "| Label | value |" or just whitespace.
+_SEP = r"(?:[ \t*|]*[:：][ \t*|]*|[ \t*|]+)"
+
+_TIN = r"(?:EI\d{11}|[A-Z]{1,2}\d{9,12})"
+_SST = r"[A-Z]\d{2}-\d{3,4}-\d{8}(?:\s*;\s*[A-Z]\d{2}-\d{3,4}-\d{8})?"
+_REG_NO = r"[A-Z0-9][A-Z0-9\-]{5,24}"
+_PHONE = r"\+?\d[\d \-()]{6,18}\d"
+_DATE_TIME = (
+    r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2})?(?:Z|[+-]\d{2}:?\d{2})?"
+    r"|\d{2}/\d{2}/\d{4}[ ]\d{2}:\d{2}(?::\d{2})?"
+)
+_HEX_64 = r"[0-9a-fA-F]{64}"
+# Thousands separators or none ("1,500.00" / "1500.00"); never stops inside a number
+_AMOUNT = r"(?:(?:RM|MYR)[ \t]?)?-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d{2})?(?![.,]?\d)"
+
+# (field name, label regex, value regex) -- labels are case-insensitive,
+# values are not, so "MYR" matches a currency code but "and" doesn't.
+_RULES = [
+    ("Supplier TIN", r"supplier(?:'?s)?[ \t]+tin(?:[ \t]+no\.?)?", _TIN),
+    ("Buyer TIN", r"buyer(?:'?s)?[ \t]+tin(?:[ \t]+no\.?)?", _TIN),
+    ("Supplier SST ID", r"supplier(?:'?s)?[ \t]+sst(?:[ \t]+(?:id|registration(?:[ \t]+(?:no\.?|number|id))?))?", _SST),
+    ("Buyer SST Registration ID", r"buyer(?:'?s)?[ \t]+sst(?:[ \t]+(?:id|registration(?:[ \t]+(?:no\.?|number|id))?))?", _SST),
+    ("Supplier MSIC code", r"(?:supplier(?:'?s)?[ \t]+)?msic(?:[ \t]+code)?", r"\d{5}"),
+    ("E-Invoice Version", r"e-?invoice[ \t]+version", r"\d+\.\d+"),
+    ("E-Invoice Type", r"e-?invoice[ \t]+type", r"\d{2}(?:[ \t]*-[ \t]*[A-Za-z][A-Za-z \t]*[A-Za-z])?"),
+    ("E-Invoice Code", r"e-?invoice[ \t]+(?:code|number|no\.?)(?:[ \t]*/[ \t]*number)?", r"[A-Za-z0-9][A-Za-z0-9\-/_.]{0,49}"),
+    ("Invoice Date and Time", r"(?:e-?)?invoice[ \t]+date(?:[ \t]+(?:and|&)[ \t]+time)?", _DATE_TIME),
+    ("Invoice Currency Code", r"(?:invoice[ \t]+)?currency(?:[ \t]+code)?", r"[A-Z]{3}"),
+    ("Currency Exchange Rate", r"(?:currency[ \t]+)?exchange[ \t]+rate", r"\d+(?:\.\d+)?"),
+    ("Digital Signature", r"(?:issuer(?:'?s)?[ \t]+)?digital[ \t]+signature", r"\s*" + _HEX_64),
+    ("Supplier Registration Number", r"supplier(?:'?s)?[ \t]+(?:registration|reg\.?|brn)(?:[ \t]+(?:no\.?|number))?", _REG_NO),
+    ("Buyer Registration Number", r"buyer(?:'?s)?[ \t]+(?:registration|reg\.?|brn)(?:[ \t]+(?:no\.?|number))?", _REG_NO),
+    ("Supplier Tourism Tax Registration Number", r"(?:supplier(?:'?s)?[ \t]+)?tourism[ \t]+tax(?:[ \t]+registration)?(?:[ \t]+(?:no\.?|number|id))?", _REG_NO),
+    ("Supplier Contact Number", r"supplier(?:'?s)?[ \t]+(?:contact|phone|tel\.?)(?:[ \t]+(?:no\.?|number))?", _PHONE),
+    ("Buyer Contact Number", r"buyer(?:'?s)?[ \t]+(?:contact|phone|tel\.?)(?:[ \t]+(?:no\.?|number))?", _PHONE),
+    ("Subtotal", r"sub[ \t-]?total", _AMOUNT),
+    ("Total excluding Tax", r"total[ \t]+excl(?:uding|\.)?[ \t]+tax", _AMOUNT),
+    ("Total Including Tax", r"total[ \t]+incl(?:uding|\.)?[ \t]+tax", _AMOUNT),
+    ("Total Payable Amount", r"total[ \t]+payable(?:[ \t]+amount)?", _AMOUNT),
+    ("Original Invoice Reference No.", r"original[ \t]+(?:e-?)?invoice[ \t]+ref(?:erence)?\.?(?:[ \t]+(?:no\.?|number))?", r"(?:Not Applicable|N/?A|[A-Za-z0-9][A-Za-z0-9\-/_.]{2,49})"),
+]
+
+# Free-text fields, only taken from an explicit "Supplier/Buyer ..." label up to
+# the end of the line
+_LINE = r"[^\s|*][^\n|]*[^\s|*]"
+_RULES += [
+    ("Supplier Address", r"supplier(?:'?s)?[ \t]+address", _LINE),
+    ("Buyer Address", r"buyer(?:'?s)?[ \t]+address", _LINE),
+    ("Supplier business activity description", r"(?:supplier(?:'?s)?[ \t]+)?business[ \t]+activity(?:[ \t]+description)?", _LINE),
+]
+_FREE_TEXT_FIELDS = {field for field, _, value in _RULES if value == _LINE}
+
+# Line-item table headers -> mandatory field of that column
+_ITEM_COLUMNS = {
+    "classification": "Classification",
+    "description": "Description of Product or Service",
+    "description of product or service": "Description of Product or Service",
+    "quantity": "Quantity",
+    "qty": "Quantity",
+    "unit price": "Unit Price",
+    "tax type": "Tax Type",
+    "tax rate": "Tax Rate",
+    "details of tax exemption": "Details of Tax Exemption",
+    "amount exempted from tax": "Amount Exempted from Tax",
+    "measurement": "Measurement",
+    "uom": "Measurement",
+}
+_EMPTY_CELLS = {"", "-", "na", "n/a", "nil"}
+
+# "Where applicable" fields and the keyword any mention of them has to contain
+_CONDITIONAL_KEYWORDS = {
+    "Supplier Tourism Tax Registration Number": "tourism",
+    "Currency Exchange Rate": "exchange",
+    "Original Invoice Reference No.": "original",
+    "Details of Tax Exemption": "exempt",
+    "Amount Exempted from Tax": "exempt",
+}
+
+_COMPILED = [
+    (field, re.compile(rf"(?i:\b{label}){_SEP}(?P<value>{value})(?![\w\-])", re.M))
+    for field, label, value in _RULES
+]
+
+# A bare 64-hex string is almost certainly the digital signature even without a label
+_BARE_SIGNATURE = re.compile(rf"(?<![0-9a-fA-F])(?P<value>{_HEX_64})(?![0-9a-fA-F])")
+
+FAST_FIELDS = [field for field, _, _ in _RULES]
+
+
+def pre_extract(text: str) -> List["lx.data.Extraction"]:
+    """
+    Extract every rule-covered field found in `text`. Returns at most one
+    Extraction per field (first occurrence), aligned to `text`.
+    """
+    if not text:
+        return []
+
+    import langextract as lx
+
+    extractions = []
+    for field, pattern in _COMPILED:
+        m = pattern.search(text)
+        # "Buyer Address: NA" is a placeholder, not an address: leave it to the LLM
+        while m is not None and field in _FREE_TEXT_FIELDS and m["value"].strip().lower() in _EMPTY_CELLS:
+            m = pattern.search(text, m.end())
+        if m is None and field == "Digital Signature":
+            m = _BARE_SIGNATURE.search(text)
+        if m is None:
+            continue
+        start, end = m.span("value")
+        # Value patterns may swallow leading whitespace / newline (signature)
+        value = text[start:end]
+        start += len(value) - len(value.lstrip())
+        value = value.strip()
+        extractions.append(
+            lx.data.Extraction(
+                field,
+                value,
+                char_interval=lx.data.CharInterval(start_pos=start, end_pos=start + len(value)),
+                alignment_status=lx.data.AlignmentStatus.MATCH_EXACT,
+                extraction_index=len(extractions) + 1,
+                attributes={"source": "rules"},
+            )
+        )
+
+    found = {x.extraction_class for x in extractions}
+    for field, start, value in _first_item_row(text):
+        if field in found:
+            continue
+        extractions.append(
+            lx.data.Extraction(
+                field,
+                value,
+                char_interval=lx.data.CharInterval(start_pos=start, end_pos=start + len(value)),
+                alignment_status=lx.data.AlignmentStatus.MATCH_EXACT,
+                extraction_index=len(extractions) + 1,
+                attributes={"source": "rules"},
+            )
+        )
+    return extractions
+
+
+def _cells(line: str, offset: int):
+    """Split a pipe-delimited row into (start, stripped text) cells."""
+    cells = []
+    pos = 0
+    for raw in line.split("|"):
+        stripped = raw.strip()
+        cells.append((offset + pos + (raw.find(stripped) if stripped else 0), stripped))
+        pos += len(raw) + 1
+    return cells
+
+
+def item_header_columns(line: str):
+    """
+    Mandatory field of each cell of `line` (None for unknown columns) if it is
+    the header row of a pipe-delimited line-item table, else None.
+    """
+    if "|" not in line:
+        return None
+    names = [_ITEM_COLUMNS.get(c.strip().lower().strip("* ")) for c in line.split("|")]
+    return names if sum(1 for n in names if n) >= 3 else None
+
+
+def _first_item_row(text: str):
+    """
+    Find the first pipe-delimited line-item table and yield (field, start, value)
+    for each recognised column of its first data row.
+    """
+    offset = 0
+    columns = None
+    for line in text.splitlines(keepends=True):
+        if "|" in line:
+            cells = _cells(line.rstrip("\r\n"), offset)
+            if columns is None:
+                columns = item_header_columns(line.rstrip("\r\n"))
+            elif not set(line.strip()) <= set("|-: "):  # skip the markdown rule row
+                for name, (start, value) in zip(columns, cells):
+                    if name and value.lower() not in _EMPTY_CELLS:
+                        yield name, start, value
+                return
+        offset += len(line)
+
+
+def missing_fields(extractions: Iterable, fields: Iterable[str], text: str = None) -> List[str]:
+    """
+    Fields (in their original order) that have no non-empty extraction.
+
+    When `text` is given, "where applicable" fields whose keyword doesn't occur
+    anywhere in the text are left out too: the LLM can't find them either.
+    """
+    found: Set[str] = {
+        resolve_field(x.extraction_class) for x in extractions if getattr(x, "extraction_text", None)
+    }
+    missing = [f for f in fields if f not in found]
+    if text is not None:
+        lowered = text.lower()
+        missing = [
+            f for f in missing
+            if f not in _CONDITIONAL_KEYWORDS or _CONDITIONAL_KEYWORDS[f] in lowered
+        ]
+    return missing
@@ -0,0 +1,47 @@
+# fastjson.py
+"""
+JSON encoding for responses, cache entries and stored artifacts.
+
+Uses orjson when it is installed (several times faster than the stdlib and
+than FastAPI's jsonable_encoder, and it handles dataclasses / enums such as
+langextract's Extraction directly), and falls back to the stdlib otherwise.
+Either way the output is compact UTF-8 bytes with the same shape.
+"""
+import dataclasses
+import enum
+import json
+from pathlib import PurePath
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib fallback gives the same output, slower
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        # Same as orjson: public fields only
+        return {f.name: getattr(value, f.name) for f in dataclasses.fields(value) if not f.name.startswith("_")}
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, PurePath):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def to_jsonable(value: Any) -> Any:
+    """Plain dicts / lists / scalars for `value` (what jsonable_encoder gives, much faster)."""
+    return loads(dumps(value))
@@ -1,6 +1,14 @@
+import asyncio
+import copy
+import hashlib
 import os
 import textwrap
-import langextract as lx
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+
+from invoice_schema import MANDATORY_FIELDS, resolve_field
+from metrics import EXTRACT_BATCH_DOCS, FALLBACKS
+from scheduler import FATAL, classify, scheduler
 
 PROMPT = textwrap.dedent(
     """\
@@ -11,150 +19,189 @@ PROMPT = textwrap.dedent(
     Strictly, Only return unique classes/fields once and do not repeat
 """
 )
-# total 33 fields
-mandatory_fields = [
-    "Supplier TIN",
-    "Supplier Registration Number",
-    "Supplier SST ID",
-    "Supplier MSIC code",
-    "Supplier business activity description",
-    "E-Invoice Type",
-    "E-Invoice Version",
-    "E-Invoice Code",
-    "Original Invoice Reference No.",
-    "Invoice Date and Time",
-    "Buyer TIN",
-    "Buyer Contact Number",
-    "Buyer SST Registration ID",
-    "Buyer Registration Number",
-    "Buyer Address",
-    "Quantity",
-    "Unit Price",
-    "Tax Rate",
-    "Subtotal",
-    "Total excluding Tax",
-    "Total Including Tax",
-    "Total Payable Amount",
-    "Supplier Tourism Tax Registration Number",
-    "Supplier Address",
-    "Supplier Contact Number",
-    "Invoice Currency Code",
-    "Currency Exchange Rate",
-    "Digital Signature",
-    "Classification",
-    "Description of Product or Service",
-    "Tax Type",
-    "Details of Tax Exemption",
-    "Amount Exempted from Tax",
-    "Measurement",
-]
-
-
-EXAMPLES = [
-    lx.data.ExampleData(
-        text=textwrap.dedent(
-            """\
-            Hibiscus Mart Sdn Bhd
-            Lot 66, Bangunan Merdeka, Persiaran Jaya, 50480, Kuala Lumpur
-            60312346789
-            hibiscus@mart.com
-
-            Supplier TIN: C321456789120
-            Supplier Registration Number: 660901111122
-            Supplier SST ID: M10-123-45678901
-            Supplier MSIC code: 47112
-            Supplier business activity description: Supermarket
-
-            E-INVOICE
-            e-Invoice Type: 01 - Invoice
-            e-Invoice version: 1.0
-            e-Invoice code: INV00006
-            Unique Identifier No: 123456789-2023-7654321
-            Original Invoice Ref. No.: Not Applicable
-            Invoice Date and Time: 2024-10-01 20:17:16
-
-            Buyer TIN: EI00000000010
-            Buyer Contact Number: NA
-            Buyer SST Registration ID: NA
-            Buyer Registration Number: NA
-            Buyer Address: NA
-
-            Classification | Description | Quantity | Unit Price | Amount | Disc | Tax Rate | Tax Amount | Total Price
-            004 | 1110 - 1112 | 1 | RM 3,000.00 | RM 3,000.00 | - | - | - | RM 3,000.00
-            004 | 1114 | 1 | RM 100.00 | RM 100.00 | - | - | - | RM 100.00
-            004 | 1116 - 2450 | 1 | RM 34,900.00 | RM 34,900.00 | - | - | - | RM 34,900.00
-            004 | 2452 - 2459 | 1 | RM 4,500.00 | RM 4,500.00 | - | - | - | RM 4,500.00
-            004 | 2461 - 3107 | 1 | RM 22,250.00 | RM 22,250.00 | - | - | - | RM 22,250.00
-            004 | 3109 - 3114 | 1 | RM 250.00 | RM 250.00 | - | - | - | RM 250.00
-
-            Subtotal: RM 65,000.00
-            Total excluding tax: RM 65,000.00
-            Tax amount: RM 0.00
-            Total including tax: RM 65,000.00
-            Total payable amount: RM 65,000.00
-
-            Digital Signature:
-            8e83e05bbf9b5db17ac0deec3b7ce6cba983f6dc50531c7a91f28d5fb3696c3
-        """
-        ),
-        extractions=[
-            lx.data.Extraction("Supplier TIN", "C321456789120"),
-            lx.data.Extraction("Supplier Registration Number", "660901111122"),
-            lx.data.Extraction("Supplier SST ID", "M10-123-45678901"),
-            lx.data.Extraction("Supplier MSIC code", "47112"),
-            lx.data.Extraction("Supplier business activity description", "Supermarket"),
-            lx.data.Extraction("E-Invoice Type", "01 - Invoice"),
-            lx.data.Extraction("E-Invoice Version", "1.0"),
-            lx.data.Extraction("E-Invoice Code", "INV-2024-0006"),
-            lx.data.Extraction("Original Invoice Reference No.", "Not Applicable"),
-            lx.data.Extraction("Invoice Date and Time", "2024-10-01 20:17:16"),
-            lx.data.Extraction("Buyer TIN", "EI00000000010"),
-            lx.data.Extraction("Buyer Contact Number", "+60 12-345 6789"),
-            lx.data.Extraction("Buyer SST Registration ID", "1234567890"),
-            lx.data.Extraction("Buyer Registration Number", "201901234567"),
-            lx.data.Extraction(
-                "Buyer Address", "No. 1, Jalan Kenanga, 50450 Kuala Lumpur"
-            ),
-            lx.data.Extraction("Quantity", "100"),
-            lx.data.Extraction("Unit Price", "RM 650.00"),
-            lx.data.Extraction("Subtotal", "RM 65,000.00"),
-            lx.data.Extraction("Total excluding Tax", "RM 65,000.00"),
-            lx.data.Extraction("Total Including Tax", "RM 65,000.00"),
-            lx.data.Extraction("Total Payable Amount", "RM 65,000.00"),
-            lx.data.Extraction(
-                "Supplier Tourism Tax Registration Number", "128490284090"
-            ),
-            lx.data.Extraction(
-                "Supplier Address",
-                "Lot 66, Bangunan Merdeka, Persiaran Jaya, 50480 Kuala Lumpur",
-            ),
-            lx.data.Extraction("Supplier Contact Number", "+60 3-1234 5678"),
-            lx.data.Extraction("Invoice Currency Code", "MYR"),
-            lx.data.Extraction("Currency Exchange Rate", "1.0000"),
-            lx.data.Extraction(
-                "Digital Signature",
-                "8e83e05bbf9b5db17ac0deec3b7ce6cba983f6dc50531c7a919f28d5fb3696c3",
-            ),
-            lx.data.Extraction("Classification", "Goods"),
-            lx.data.Extraction(
-                "Description of Product or Service", "Retail display shelves"
+# The API's names for the mandatory fields (invoice_schema resolves variants)
+mandatory_fields = MANDATORY_FIELDS
+
+
+@lru_cache(maxsize=None)
+def examples():
+    """
+    Few-shot examples for the extraction prompt. Built on first use because
+    langextract is only imported when an extraction actually runs.
+    """
+    import langextract as lx
+
+    return [
+        lx.data.ExampleData(
+            text=textwrap.dedent(
+                """\
+                Hibiscus Mart Sdn Bhd
+                Lot 66, Bangunan Merdeka, Persiaran Jaya, 50480, Kuala Lumpur
+                60312346789
+                hibiscus@mart.com
+
+                Supplier TIN: C321456789120
+                Supplier Registration Number: 660901111122
+                Supplier SST ID: M10-123-45678901
+                Supplier MSIC code: 47112
+                Supplier business activity description: Supermarket
+
+                E-INVOICE
+                e-Invoice Type: 01 - Invoice
+                e-Invoice version: 1.0
+                e-Invoice code: INV00006
+                Unique Identifier No: 123456789-2023-7654321
+                Original Invoice Ref. No.: Not Applicable
+                Invoice Date and Time: 2024-10-01 20:17:16
+
+                Buyer TIN: EI00000000010
+                Buyer Contact Number: NA
+                Buyer SST Registration ID: NA
+                Buyer Registration Number: NA
+                Buyer Address: NA
+
+                Classification | Description | Quantity | Unit Price | Amount | Disc | Tax Rate | Tax Amount | Total Price
+                004 | 1110 - 1112 | 1 | RM 3,000.00 | RM 3,000.00 | - | - | - | RM 3,000.00
+                004 | 1114 | 1 | RM 100.00 | RM 100.00 | - | - | - | RM 100.00
+                004 | 1116 - 2450 | 1 | RM 34,900.00 | RM 34,900.00 | - | - | - | RM 34,900.00
+                004 | 2452 - 2459 | 1 | RM 4,500.00 | RM 4,500.00 | - | - | - | RM 4,500.00
+                004 | 2461 - 3107 | 1 | RM 22,250.00 | RM 22,250.00 | - | - | - | RM 22,250.00
+                004 | 3109 - 3114 | 1 | RM 250.00 | RM 250.00 | - | - | - | RM 250.00
+
+                Subtotal: RM 65,000.00
+                Total excluding tax: RM 65,000.00
+                Tax amount: RM 0.00
+                Total including tax: RM 65,000.00
+                Total payable amount: RM 65,000.00
+
+                Digital Signature:
+                8e83e05bbf9b5db17ac0deec3b7ce6cba983f6dc50531c7a91f28d5fb3696c3
+            """
             ),
-            lx.data.Extraction("Tax Type", "SST-Exempt"),
-            lx.data.Extraction("Tax Rate", "0%"),
-            lx.data.Extraction("Details of Tax Exemption", "Exempt supply (Schedule)"),
-            lx.data.Extraction("Amount Exempted from Tax", "RM 65,000.00"),
-            lx.data.Extraction("Measurement", "pcs"),
-        ],
+            extractions=[
+                lx.data.Extraction("Supplier TIN", "C321456789120"),
+                lx.data.Extraction("Supplier Registration Number", "660901111122"),
+                lx.data.Extraction("Supplier SST ID", "M10-123-45678901"),
+                lx.data.Extraction("Supplier MSIC code", "47112"),
+                lx.data.Extraction("Supplier business activity description", "Supermarket"),
+                lx.data.Extraction("E-Invoice Type", "01 - Invoice"),
+                lx.data.Extraction("E-Invoice Version", "1.0"),
+                lx.data.Extraction("E-Invoice Code", "INV-2024-0006"),
+                lx.data.Extraction("Original Invoice Reference No.", "Not Applicable"),
+                lx.data.Extraction("Invoice Date and Time", "2024-10-01 20:17:16"),
+                lx.data.Extraction("Buyer TIN", "EI00000000010"),
+                lx.data.Extraction("Buyer Contact Number", "+60 12-345 6789"),
+                lx.data.Extraction("Buyer SST Registration ID", "1234567890"),
+                lx.data.Extraction("Buyer Registration Number", "201901234567"),
+                lx.data.Extraction(
+                    "Buyer Address", "No. 1, Jalan Kenanga, 50450 Kuala Lumpur"
+                ),
+                lx.data.Extraction("Quantity", "100"),
+                lx.data.Extraction("Unit Price", "RM 650.00"),
+                lx.data.Extraction("Subtotal", "RM 65,000.00"),
+                lx.data.Extraction("Total excluding Tax", "RM 65,000.00"),
+                lx.data.Extraction("Total Including Tax", "RM 65,000.00"),
+                lx.data.Extraction("Total Payable Amount", "RM 65,000.00"),
+                lx.data.Extraction(
+                    "Supplier Tourism Tax Registration Number", "128490284090"
+                ),
+                lx.data.Extraction(
+                    "Supplier Address",
+                    "Lot 66, Bangunan Merdeka, Persiaran Jaya, 50480 Kuala Lumpur",
+                ),
+                lx.data.Extraction("Supplier Contact Number", "+60 3-1234 5678"),
+                lx.data.Extraction("Invoice Currency Code", "MYR"),
+                lx.data.Extraction("Currency Exchange Rate", "1.0000"),
+                lx.data.Extraction(
+                    "Digital Signature",
+                    "8e83e05bbf9b5db17ac0deec3b7ce6cba983f6dc50531c7a919f28d5fb3696c3",
+                ),
+                lx.data.Extraction("Classification", "Goods"),
+                lx.data.Extraction(
+                    "Description of Product or Service", "Retail display shelves"
+                ),
+                lx.data.Extraction("Tax Type", "SST-Exempt"),
+                lx.data.Extraction("Tax Rate", "0%"),
+                lx.data.Extraction("Details of Tax Exemption", "Exempt supply (Schedule)"),
+                lx.data.Extraction("Amount Exempted from Tax", "RM 65,000.00"),
+                lx.data.Extraction("Measurement", "pcs"),
+            ],
+        )
+    ]
+
+
+MODEL_ID = "gemini-2.5-flash"
+
+# lx.extract tuning: parallel model calls (for models passed in; the API's
+# Gemini requests run as the "gemini" scheduler allows), chunks per inference
+# batch and characters per chunk (every chunk re-sends PROMPT + examples()).
+IE_MAX_WORKERS = int(os.getenv("IE_MAX_WORKERS", "10"))
+IE_BATCH_LENGTH = int(os.getenv("IE_BATCH_LENGTH", "10"))
+IE_MAX_CHAR_BUFFER = int(os.getenv("IE_MAX_CHAR_BUFFER", "1000"))
+
+
+@lru_cache(maxsize=None)
+def extraction_version() -> str:
+    """
+    Identifies the prompt/examples/model combination that produced a result,
+    so cached extractions are invalidated whenever any of them change.
+    """
+    return hashlib.sha256(
+        "\n".join([MODEL_ID, PROMPT, repr(examples()), str(IE_MAX_CHAR_BUFFER)]).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+@lru_cache(maxsize=256)
+def prompt_and_examples_for(fields: tuple):
+    """
+    PROMPT / examples() narrowed down to `fields`, used when the fast path
+    already resolved the other mandatory fields.
+    """
+    import langextract as lx
+
+    prompt = (
+        "Extract only the following fields from the invoice: "
+        + ", ".join(fields)
+        + ".\n\n"
+        + PROMPT.split("\n\n", 1)[1]
     )
-]
+    narrowed = [
+        lx.data.ExampleData(
+            text=ex.text,
+            extractions=[x for x in ex.extractions if x.extraction_class in fields],
+        )
+        for ex in examples()
+    ]
+    return prompt, narrowed
 
 
-def run_ie(text):
+def _prompt_and_examples(fields):
+    if fields is not None and set(fields) != set(mandatory_fields):
+        return prompt_and_examples_for(tuple(fields))
+    return PROMPT, examples()
+
+
+def run_ie(text, fields=None, model=None):
+    """
+    Run the LLM extraction over `text`. When `fields` is given, only those
+    mandatory fields are asked for. `model` overrides MODEL_ID with a
+    langextract model instance (e.g. a ScheduledModel, or a local stub for
+    benchmarks), which brings its own schema constraints.
+    """
+    import langextract as lx
+
+    prompt, few_shot = _prompt_and_examples(fields)
     return lx.extract(
         text_or_documents=text,
-        prompt_description=PROMPT,
-        examples=EXAMPLES,
-        model_id="gemini-2.5-flash",
+        prompt_description=prompt,
+        examples=few_shot,
+        model_id=MODEL_ID,
+        model=model,
+        use_schema_constraints=model is None,
+        max_workers=IE_MAX_WORKERS,
+        batch_length=IE_BATCH_LENGTH,
+        max_char_buffer=IE_MAX_CHAR_BUFFER,
+        show_progress=False,
         # model_id="gemini-2.5-pro",
         # model_id="gpt-4o",
         # api_key=os.environ.get("OPENAI_API_KEY"),
@@ -163,19 +210,330 @@ def run_ie(text):
     )
 
 
-def generate_visualization_files(result, output_name_stem: str) -> str:
+def run_ie_batch(
+    texts,
+    fields=None,
+    model=None,
+    max_workers=None,
+    batch_length=None,
+    max_char_buffer=None,
+):
+    """
+    Extract many invoices in a single lx.extract call.
+
+    `texts` maps a caller-chosen id (e.g. the upload filename) to the invoice
+    text. Chunks of all documents are scheduled together, so the model sees
+    full batches instead of one small invoice at a time. Returns
+    {id: AnnotatedDocument}; ids langextract returned nothing for are absent.
+    """
+    if not texts:
+        return {}
+    import langextract as lx
+
+    prompt, few_shot = _prompt_and_examples(fields)
+    # langextract needs its own ids; keep a mapping back to the caller's
+    ids = list(texts)
+    documents = [
+        lx.data.Document(text=texts[doc_id], document_id=f"doc_{i}")
+        for i, doc_id in enumerate(ids)
+    ]
+    results = lx.extract(
+        text_or_documents=documents,
+        prompt_description=prompt,
+        examples=few_shot,
+        model_id=MODEL_ID,
+        model=model,
+        use_schema_constraints=model is None,
+        max_workers=max_workers or IE_MAX_WORKERS,
+        batch_length=batch_length or IE_BATCH_LENGTH,
+        max_char_buffer=max_char_buffer or IE_MAX_CHAR_BUFFER,
+        show_progress=False,
+    )
+    by_doc_id = {f"doc_{i}": doc_id for i, doc_id in enumerate(ids)}
+    return {by_doc_id[r.document_id]: r for r in results if r.document_id in by_doc_id}
+
+
+@lru_cache(maxsize=64)
+def provider_model(fields=None):
+    """
+    The model lx.extract would build for MODEL_ID and `fields` (a tuple, or
+    None for all), schema constraints from the few-shot examples included,
+    but without retries of its own: the "gemini" scheduler does those.
     """
-    Save annotated JSONL into the default `test_output/` folder and
-    return the HTML visualization string.
+    import langextract as lx
+
+    _, few_shot = _prompt_and_examples(fields)
+    return lx.factory.create_model(
+        lx.factory.ModelConfig(model_id=MODEL_ID, provider_kwargs={"max_retries": 0}),
+        examples=few_shot,
+        use_schema_constraints=True,
+    )
+
 
-    - JSONL path will be: test_output/{output_name_stem}.jsonl
-    - Returned HTML can be written by the caller to any desired location.
+def warm_up() -> None:
     """
+    Do what the first extraction would otherwise pay for: import langextract,
+    build the few-shot examples and load the model provider (google-genai).
+    Raises if the model can't be created (e.g. no API key configured).
+    """
+    extraction_version()
+    provider_model()
+
+
+# lx.extract is blocking (and waits on its model requests), so the API runs it
+# on this pool instead of the event loop. The Gemini requests themselves run
+# on _model_executor, at most as many as the "gemini" limiter lets through.
+IE_WORKERS = int(os.getenv("IE_WORKERS", "8"))
+_ie_executor = ThreadPoolExecutor(max_workers=IE_WORKERS, thread_name_prefix="run_ie")
+_model_executor = ThreadPoolExecutor(
+    max_workers=scheduler.providers["gemini"].limiter.maximum, thread_name_prefix="gemini"
+)
+
+
+def _scheduled_model(fields):
+    from scheduled_model import ScheduledModel
+
+    if fields is not None and set(fields) != set(mandatory_fields):
+        create = partial(provider_model, tuple(fields))
+    else:
+        create = provider_model
+    return ScheduledModel(create, asyncio.get_running_loop(), _model_executor)
+
+
+async def _run_extract(run, *args, fields=None, **kwargs):
+    model = _scheduled_model(fields)
+    loop = asyncio.get_running_loop()
     try:
-        lx.io.save_annotated_documents(
-            [result], output_name=f"{output_name_stem}.jsonl"
+        return await loop.run_in_executor(
+            _ie_executor, partial(run, *args, fields=fields, model=model, **kwargs)
         )
-        html = lx.visualize(f"test_output/{output_name_stem}.jsonl")
-        return html
+    except asyncio.CancelledError:
+        # The lx.extract thread carries on; keep it from sending more requests
+        model.cancel()
+        raise
+
+
+async def arun_ie(text, fields=None):
+    """
+    Async version of run_ie, executed on the extraction worker pool. Every
+    model request goes through the "gemini" outbound scheduler (rate limit,
+    adaptive concurrency, retries) on its own.
+    """
+    return await _run_extract(run_ie, text, fields=fields)
+
+
+async def arun_ie_batch(texts, fields=None, **kwargs):
+    """Async version of run_ie_batch, executed like arun_ie."""
+    return await _run_extract(run_ie_batch, texts, fields=fields, **kwargs)
+
+
+class ExtractionBatcher:
+    """
+    Micro-batches concurrent extraction requests into run_ie_batch calls.
+
+    Requests that arrive within `max_wait` seconds of each other (up to
+    `max_batch` of them) share one lx.extract call, whatever fields each one
+    still needs: the batch asks for all of them and every document's result
+    is cut back to its own fields. Used by the upload path, where files of a
+    batch upload reach the extraction stage at about the same time.
+    """
+
+    def __init__(self, max_batch: int = 16, max_wait: float = 0.05):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        # [(text, fields, future)] waiting for the next batch, and its flush timer
+        self._pending = []
+        self._timer = None
+        # (fields_key, text hash) -> future, so identical requests share a slot
+        self._in_flight = {}
+        # future -> number of extract() calls waiting on it
+        self._waiters = {}
+        self._seq = 0
+
+    async def extract(self, text, fields=None):
+        request_key = (fields_key(fields), hashlib.sha256(text.encode("utf-8")).hexdigest())
+        shared = self._in_flight.get(request_key)
+        if shared is not None:
+            return await self._join(shared)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._in_flight[request_key] = future
+        future.add_done_callback(lambda _: self._in_flight.pop(request_key, None))
+        if not self._pending:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        self._pending.append((text, fields, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        return await self._join(future)
+
+    async def _join(self, future):
+        """
+        Wait for a (possibly shared) request. If the last waiter is cancelled
+        before its batch has been sent, the request is taken out of the batch.
+        """
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters[future] == 1:
+                self._withdraw(future)
+            raise
+        finally:
+            self._waiters[future] -= 1
+            if not self._waiters[future]:
+                del self._waiters[future]
+
+    def _withdraw(self, future) -> None:
+        # Already sent if it isn't pending: let it finish, an identical
+        # request may still use it
+        for i, (_, _, pending) in enumerate(self._pending):
+            if pending is future:
+                del self._pending[i]
+                future.cancel()
+                break
+        if not self._pending and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _flush(self) -> None:
+        waiting, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if waiting:
+            asyncio.ensure_future(self._run(waiting))
+
+    async def _run(self, waiting) -> None:
+        texts = {}
+        for text, fields, future in waiting:
+            self._seq += 1
+            texts[str(self._seq)] = (text, fields, future)
+
+        outcomes = {}
+        if len(texts) > 1:
+            try:
+                batch = await arun_ie_batch(
+                    {doc_id: text for doc_id, (text, _, _) in texts.items()},
+                    fields=union_fields(fields for _, fields, _ in texts.values()),
+                )
+                EXTRACT_BATCH_DOCS.observe(len(texts))
+                outcomes = {
+                    doc_id: only_fields(batch.get(doc_id), fields)
+                    for doc_id, (_, fields, _) in texts.items()
+                }
+            except Exception as e:
+                if classify(e) != FATAL:
+                    # Provider trouble (already retried by the scheduler):
+                    # splitting the batch up would only add load
+                    outcomes = {doc_id: e for doc_id in texts}
+                else:
+                    # One bad document shouldn't fail the rest: retry individually
+                    FALLBACKS.inc(kind="batch_extract")
+                    outcomes = {}
+        if not outcomes:
+            singles = await asyncio.gather(
+                *(arun_ie(text, fields=fields) for text, fields, _ in texts.values()),
+                return_exceptions=True,
+            )
+            for outcome in singles:
+                if not isinstance(outcome, Exception):
+                    EXTRACT_BATCH_DOCS.observe(1)
+            outcomes = dict(zip(texts, singles))
+
+        for doc_id, (_, _, future) in texts.items():
+            if future.done():
+                continue
+            outcome = outcomes.get(doc_id)
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+
+def union_fields(field_sets):
+    """Fields to ask a batch for: every one any of `field_sets` needs (None = all)."""
+    wanted = set()
+    for fields in field_sets:
+        if fields is None:
+            return None
+        wanted.update(fields)
+    return [f for f in mandatory_fields if f in wanted] + sorted(wanted - set(mandatory_fields))
+
+
+def only_fields(result, fields):
+    """
+    `result` without the mandatory-field extractions outside `fields`, as if
+    it had been asked for just those. None (a document the batch returned
+    nothing for) is left as is.
+    """
+    if result is None or fields is None:
+        return result
+    # None: extractions that aren't a mandatory field are kept
+    wanted = {resolve_field(f) for f in fields} | {None}
+    result.extractions = [
+        x for x in (result.extractions or [])
+        if resolve_field(x.extraction_class) in wanted
+    ]
+    return result
+
+
+def fields_key(fields) -> str:
+    """Short stable id for a set of requested fields (part of cache keys)."""
+    if fields is None or set(fields) == set(mandatory_fields):
+        return "all"
+    return hashlib.sha256("\n".join(sorted(fields)).encode("utf-8")).hexdigest()[:12]
+
+
+def merge_results(text, fast_extractions, ie_result=None):
+    """
+    Combine fast-path (and structured-data) extractions with an LLM result
+    into one AnnotatedDocument over `text`. Fields resolved by the fast path
+    win over LLM duplicates, whatever name the LLM used for them. LLM
+    extractions are tagged {"source": "llm"} like the others carry theirs.
+    """
+    import langextract as lx
+
+    found = {resolve_field(x.extraction_class) for x in fast_extractions}
+    llm_extractions = [
+        x for x in (getattr(ie_result, "extractions", None) or [])
+        if resolve_field(x.extraction_class) not in found
+    ]
+    for x in llm_extractions:
+        if not (x.attributes or {}).get("source"):
+            x.attributes = {**(x.attributes or {}), "source": "llm"}
+    return lx.data.AnnotatedDocument(
+        text=text, extractions=list(fast_extractions) + llm_extractions
+    )
+
+
+def result_to_dict(result) -> dict:
+    """Serialize an AnnotatedDocument into a JSON-safe dict (for caching)."""
+    import langextract as lx
+
+    return lx.data_lib.annotated_document_to_dict(result)
+
+
+def result_from_dict(data: dict, owned: bool = False):
+    """
+    Inverse of result_to_dict. `data` is left untouched (it may be a cached
+    object) unless `owned`, for a dict just decoded that nobody else holds.
+    """
+    import langextract as lx
+
+    return lx.data_lib.dict_to_annotated_document(data if owned else copy.deepcopy(data))
+
+
+def render_visualization(result) -> str:
+    """
+    Render the highlighted-extractions HTML for an AnnotatedDocument, straight
+    from memory (no JSONL round-trip through test_output/).
+    """
+    import langextract as lx
+
+    try:
+        html = lx.visualize(result)
+        # lx.visualize returns an IPython HTML object inside notebooks
+        return getattr(html, "data", html)
     except Exception as e:
         return f"Failed to generate visualization: {str(e)}"
@@ -0,0 +1,274 @@
+# invoice_schema.py
+"""
+Field vocabularies of the e-invoice and the alias index between them.
+
+- SUPPLIER_FIELDS ... ITEM_COLUMNS: the official field names by section, as
+  to_structured / validate_invoice use them
+- MANDATORY_FIELDS: the names the API reports and the extractor is prompted
+  with (invoice_runner.mandatory_fields)
+- resolve_field: any of those names, or a variant the model emits
+  ("Supplier's TIN", "e-Invoice Version", "Quantitiy"), -> the mandatory
+  field, through an index of canonicalized names built once at import
+- select_fields: the best extraction per mandatory field
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional
+
+# Define the 33 mandatory e-invoice fields
+SUPPLIER_FIELDS = [
+    "Supplier's TIN",
+    "Supplier's Registration / Identification Number / Passport Number",
+    "Supplier's SST Registration Number [Mandatory for SST-registrant]",
+    "Supplier's Tourism Tax Registration Number [Mandatory for tourism tax registrant]",
+    "Supplier's Malaysia Standard Industrial Classification (MSIC) Code",
+    "Supplier's Business Activity Description",
+    "Supplier's Address",
+    "Supplier's Contact Number",
+]
+
+BUYER_FIELDS = [
+    "Buyer's TIN",
+    "Buyer's Registration / Identification Number / Passport Number",
+    "Buyer's SST Registration Number [Mandatory for SST-registrant]",
+    "Buyer's Address",
+    "Buyer's Contact Number",
+]
+
+INVOICE_FIELDS = [
+    "e-Invoice Version",
+    "e-Invoice Type",
+    "e-Invoice Code / Number",
+    "Original e-Invoice Reference Number [Mandatory, where applicable]",
+    "e-Invoice Date and Time",
+    "Issuer's Digital Signature",
+    "Invoice Currency Code",
+    "Currency Exchange Rate [Mandatory, where applicable]",
+    "Supplier's Contact Number",
+]
+
+ITEM_COLUMNS = [
+    "Classification",
+    "Description of Product or Service",
+    "Unit Price",
+    "Tax Type",
+    "Tax Rate [Mandatory, where applicable]",
+    "Details of Tax Exemption [Mandatory if tax exemption is applicable]",
+    "Amount Exempted from Tax [Mandatory if tax exemption is applicable]",
+    "Subtotal",
+    "Total Excluding Tax",
+    "Total Including Tax",
+    "Total Payable Amount",
+    "Quantity",
+    "Measurement",
+]
+
+ALL_MANDATORY_FIELDS = SUPPLIER_FIELDS + BUYER_FIELDS + INVOICE_FIELDS + ITEM_COLUMNS
+
+
+# total 33 fields
+MANDATORY_FIELDS = [
+    "Supplier TIN",
+    "Supplier Registration Number",
+    "Supplier SST ID",
+    "Supplier MSIC code",
+    "Supplier business activity description",
+    "E-Invoice Type",
+    "E-Invoice Version",
+    "E-Invoice Code",
+    "Original Invoice Reference No.",
+    "Invoice Date and Time",
+    "Buyer TIN",
+    "Buyer Contact Number",
+    "Buyer SST Registration ID",
+    "Buyer Registration Number",
+    "Buyer Address",
+    "Quantity",
+    "Unit Price",
+    "Tax Rate",
+    "Subtotal",
+    "Total excluding Tax",
+    "Total Including Tax",
+    "Total Payable Amount",
+    "Supplier Tourism Tax Registration Number",
+    "Supplier Address",
+    "Supplier Contact Number",
+    "Invoice Currency Code",
+    "Currency Exchange Rate",
+    "Digital Signature",
+    "Classification",
+    "Description of Product or Service",
+    "Tax Type",
+    "Details of Tax Exemption",
+    "Amount Exempted from Tax",
+    "Measurement",
+]
+
+# Mandatory field -> (its official name, other names it goes by)
+FIELD_NAMES = {
+    "Supplier TIN": ("Supplier's TIN", "Supplier Tax Identification Number", "Seller TIN", "Supplier TIN No."),
+    "Supplier Registration Number": (
+        "Supplier's Registration / Identification Number / Passport Number",
+        "Supplier BRN", "Supplier Business Registration Number", "Supplier Registration ID",
+    ),
+    "Supplier SST ID": (
+        "Supplier's SST Registration Number [Mandatory for SST-registrant]",
+        "Supplier SST Number", "Supplier SST Registration ID", "Supplier SST",
+    ),
+    "Supplier MSIC code": (
+        "Supplier's Malaysia Standard Industrial Classification (MSIC) Code", "MSIC Code", "MSIC", "Supplier MSIC",
+    ),
+    "Supplier business activity description": (
+        "Supplier's Business Activity Description", "Business Activity Description", "Business Activity",
+    ),
+    "Supplier Tourism Tax Registration Number": (
+        "Supplier's Tourism Tax Registration Number [Mandatory for tourism tax registrant]",
+        "Tourism Tax Registration Number",
+    ),
+    "Supplier Address": ("Supplier's Address", "Seller Address"),
+    "Supplier Contact Number": (
+        "Supplier's Contact Number", "Supplier Phone Number", "Seller Contact Number", "Supplier Tel.",
+    ),
+    "Buyer TIN": ("Buyer's TIN", "Buyer Tax Identification Number", "Customer TIN"),
+    "Buyer Registration Number": (
+        "Buyer's Registration / Identification Number / Passport Number",
+        "Buyer BRN", "Buyer Business Registration Number", "Buyer Registration ID",
+    ),
+    "Buyer SST Registration ID": (
+        "Buyer's SST Registration Number [Mandatory for SST-registrant]", "Buyer SST ID", "Buyer SST Number",
+    ),
+    "Buyer Address": ("Buyer's Address", "Customer Address", "Bill To"),
+    "Buyer Contact Number": (
+        "Buyer's Contact Number", "Buyer Phone Number", "Customer Contact Number", "Buyer Tel.",
+    ),
+    "E-Invoice Version": ("e-Invoice Version", "Invoice Version"),
+    "E-Invoice Type": ("e-Invoice Type", "Invoice Type"),
+    "E-Invoice Code": (
+        "e-Invoice Code / Number", "e-Invoice Number", "Invoice Code", "Invoice Number",
+    ),
+    "Original Invoice Reference No.": (
+        "Original e-Invoice Reference Number [Mandatory, where applicable]",
+        "Original Invoice Reference", "Original Invoice Ref No",
+    ),
+    "Invoice Date and Time": ("e-Invoice Date and Time", "Invoice Date", "e-Invoice Date", "e-Invoice Date & Time"),
+    "Digital Signature": ("Issuer's Digital Signature", "Signature"),
+    "Invoice Currency Code": ("Invoice Currency Code", "Currency Code", "Currency"),
+    "Currency Exchange Rate": ("Currency Exchange Rate [Mandatory, where applicable]", "Exchange Rate"),
+    "Classification": ("Classification", "Classification Code"),
+    "Description of Product or Service": (
+        "Description of Product or Service", "Description", "Product Description", "Item Description",
+    ),
+    "Unit Price": ("Unit Price", "Price per Unit", "Unit Cost"),
+    "Tax Type": ("Tax Type",),
+    "Tax Rate": ("Tax Rate [Mandatory, where applicable]", "Tax %"),
+    "Details of Tax Exemption": (
+        "Details of Tax Exemption [Mandatory if tax exemption is applicable]", "Tax Exemption Details",
+    ),
+    "Amount Exempted from Tax": (
+        "Amount Exempted from Tax [Mandatory if tax exemption is applicable]", "Tax Exempted Amount",
+    ),
+    "Subtotal": ("Subtotal", "Sub Total", "Sub-total"),
+    "Total excluding Tax": ("Total Excluding Tax", "Total before Tax", "Total Exclusive of Tax"),
+    "Total Including Tax": ("Total Including Tax", "Total after Tax", "Total Inclusive of Tax"),
+    "Total Payable Amount": ("Total Payable Amount", "Amount Payable", "Total Payable", "Amount Due"),
+    "Quantity": ("Quantity", "Quantitiy", "Quantities"),
+    "Measurement": ("Measurement", "Unit of Measurement", "UOM"),
+}
+
+# Mandatory field -> to_structured section ("supplier", "buyer", "invoice", "items")
+FIELD_SECTIONS = {}
+for _section, _names in (
+    ("supplier", SUPPLIER_FIELDS), ("buyer", BUYER_FIELDS), ("invoice", INVOICE_FIELDS), ("items", ITEM_COLUMNS),
+):
+    for _field, (_official, *_) in FIELD_NAMES.items():
+        if _official in _names:
+            FIELD_SECTIONS.setdefault(_field, _section)
+
+OFFICIAL_NAMES = {field: official for field, (official, *_) in FIELD_NAMES.items()}
+
+_NOTES = re.compile(r"\[[^\]]*\]|\([^)]*\)")
+_POSSESSIVE = re.compile(r"'s\b")
+_NON_WORD = re.compile(r"[^a-z0-9%]+")
+_E_INVOICE = re.compile(r"\be invoice\b")
+# Word-level spellings folded together
+_WORDS = {
+    "no": "number", "num": "number", "nbr": "number", "ref": "reference", "reg": "registration",
+    "qty": "quantity", "amt": "amount", "desc": "description", "excl": "excluding", "incl": "including",
+    "phone": "contact", "tel": "contact", "telephone": "contact", "seller": "supplier", "customer": "buyer",
+}
+
+
+def canonical_name(name: str) -> str:
+    """
+    "Supplier's SST Registration Number [Mandatory for SST-registrant]" ->
+    "supplier sst registration number": case, quotes, possessives, bracketed
+    notes, punctuation and common abbreviations folded away.
+    """
+    name = name.replace("\u2019", "'").lower()
+    name = _POSSESSIVE.sub("", _NOTES.sub(" ", name))
+    name = _E_INVOICE.sub("einvoice", _NON_WORD.sub(" ", name))
+    return " ".join(_WORDS.get(word, word) for word in name.split())
+
+
+def _build_alias_index() -> Dict[str, str]:
+    index = {}
+    for field in MANDATORY_FIELDS:
+        for name in (field, *FIELD_NAMES[field]):
+            key = canonical_name(name)
+            if index.setdefault(key, field) != field:
+                raise ValueError(f"{name!r} is an alias of both {index[key]!r} and {field!r}")
+    return index
+
+
+# canonical name -> mandatory field
+ALIAS_INDEX = _build_alias_index()
+
+
+@lru_cache(maxsize=4096)
+def resolve_field(name: Optional[str]) -> Optional[str]:
+    """The mandatory field `name` refers to, or None."""
+    if not name:
+        return None
+    if name in FIELD_NAMES:
+        return name
+    return ALIAS_INDEX.get(canonical_name(name))
+
+
+# lx.data.AlignmentStatus values. Higher is more trustworthy; unaligned
+# extractions (no char_interval) rank last
+_ALIGNMENT_RANK = {
+    "match_exact": 3,
+    "match_greater": 2,
+    "match_lesser": 2,
+    "match_fuzzy": 1,
+}
+
+
+def confidence(extraction: Any) -> int:
+    if getattr(extraction, "char_interval", None) is None:
+        return 0
+    return _ALIGNMENT_RANK.get(getattr(extraction.alignment_status, "value", None), 1)
+
+
+def extraction_score(extraction: Any, field: str) -> tuple:
+    """Which of several extractions of `field` to keep: alignment, then exact name, then length."""
+    text = (getattr(extraction, "extraction_text", None) or "").strip()
+    return confidence(extraction), extraction.extraction_class == field, len(text)
+
+
+def select_fields(extractions: Optional[Iterable[Any]]) -> Dict[str, Any]:
+    """
+    {mandatory field: its best non-empty extraction}, whatever name each
+    extraction used for it. Extractions of unknown classes are skipped.
+    """
+    best = {}
+    for extraction in extractions or []:
+        if not getattr(extraction, "extraction_text", None):
+            continue
+        field = resolve_field(getattr(extraction, "extraction_class", None))
+        if field is None:
+            continue
+        score = extraction_score(extraction, field)
+        if field not in best or score > best[field][0]:
+            best[field] = (score, extraction)
+    return {field: extraction for field, (_, extraction) in best.items()}
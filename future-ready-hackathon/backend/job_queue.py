@@ -0,0 +1,319 @@
+# job_queue.py
+"""
+SQLite-backed job queue shared by several API and extraction worker processes.
+
+With JOB_QUEUE=sqlite the API processes put the files of a /jobs upload in
+`items` here, and worker.py processes claim them, run the upload pipeline
+and write the results back; any API process can then answer status and
+stream requests for any job. The database (JOB_DB) has to be on a local
+disk of the host all of them run on; the uploads they read from PDF_DIR
+and the cache under CACHE_DIR can be shared the same way.
+
+A claimed item is leased to its worker for `lease_seconds`. Workers renew
+the leases of everything they hold by heartbeat; an item whose lease ran
+out (worker killed, host gone) goes back to the queue, and after
+`max_attempts` claims it is completed with an error result instead. A
+worker completing an item it no longer holds is ignored, so an item's
+result is written once.
+"""
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import fastjson
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL,
+    finished_at REAL,
+    total       INTEGER NOT NULL,
+    completed   INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs(finished_at);
+
+CREATE TABLE IF NOT EXISTS items (
+    id            INTEGER PRIMARY KEY,
+    job_id        TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    idx           INTEGER NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'queued',
+    payload       BLOB,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    result        BLOB,
+    -- position in the job's completion order, from 1
+    seq           INTEGER,
+    completed_at  REAL,
+    UNIQUE (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS items_claim ON items(status, lease_expires);
+CREATE INDEX IF NOT EXISTS items_seq ON items(job_id, seq);
+CREATE INDEX IF NOT EXISTS items_completed_at ON items(completed_at);
+"""
+
+# (item id, job id, index in the job, payload)
+Claim = Tuple[int, str, int, Any]
+
+
+class JobExpired(LookupError):
+    """A job was pruned (retention ran out) before all its results were read."""
+
+
+class JobQueue:
+    def __init__(
+        self,
+        path: Path,
+        lease_seconds: float = 60,
+        max_attempts: int = 3,
+        retention_seconds: float = 3600,
+    ):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention_seconds = retention_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per thread (asyncio.to_thread runs on a pool)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, fn):
+        """Run fn(conn) in one IMMEDIATE transaction, so other processes queue behind it."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            out = fn(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return out
+
+    @staticmethod
+    def _finish(conn: sqlite3.Connection, item_id: int, job_id: str, result: bytes, now: float) -> None:
+        seq = conn.execute(
+            "UPDATE jobs SET completed = completed + 1,"
+            " finished_at = CASE WHEN completed + 1 = total THEN ? END"
+            " WHERE id = ? RETURNING completed",
+            (now, job_id),
+        ).fetchone()[0]
+        conn.execute(
+            "UPDATE items SET status = 'done', result = ?, seq = ?, completed_at = ?, payload = NULL,"
+            " lease_owner = NULL, lease_expires = NULL WHERE id = ?",
+            (result, seq, now, item_id),
+        )
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop jobs (and their items) finished more than `retention_seconds` ago."""
+        conn.execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - self.retention_seconds,)
+        )
+
+    # ---- producers (API) ----
+
+    def submit(self, items: List[Any]) -> Dict[str, Any]:
+        """Queue one job of JSON-serializable items; returns {"job_id", "total"}."""
+        job_id = uuid4().hex
+        now = time.time()
+
+        def insert(conn):
+            conn.execute("INSERT INTO jobs (id, created_at, total) VALUES (?, ?, ?)", (job_id, now, len(items)))
+            conn.executemany(
+                "INSERT INTO items (job_id, idx, payload) VALUES (?, ?, ?)",
+                [(job_id, index, fastjson.dumps(item)) for index, item in enumerate(items)],
+            )
+
+            self._prune(conn, now)
+
+        self._write(insert)
+        return {"job_id": job_id, "total": len(items)}
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job as jobs.Job.to_dict() has it, or None if unknown (or pruned)."""
+        conn = self._conn()
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+        results: List[Optional[Dict[str, Any]]] = [None] * job["total"]
+        for row in conn.execute("SELECT idx, result FROM items WHERE job_id = ? AND seq IS NOT NULL", (job_id,)):
+            results[row["idx"]] = fastjson.loads(row["result"])
+        completed = job["completed"]
+        return {
+            "job_id": job_id,
+            "status": "done" if completed == job["total"] else ("running" if completed else "queued"),
+            "total": job["total"],
+            "completed": completed,
+            "created_at": job["created_at"],
+            "finished_at": job["finished_at"],
+            "results": results,
+        }
+
+    def events(self, job_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        """{"index", "result"} of the items completed after the first `after`, in completion order."""
+        return [
+            {"index": row["idx"], "result": fastjson.loads(row["result"])}
+            for row in self._conn().execute(
+                "SELECT idx, result FROM items WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            )
+        ]
+
+    def completed(self, job_id: str) -> Optional[int]:
+        """Items of the job completed so far, or None if unknown (or pruned)."""
+        row = self._conn().execute("SELECT completed FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else row["completed"]
+
+    def backlog(self) -> int:
+        """Items queued or being worked on, across all jobs."""
+        return self._conn().execute("SELECT COUNT(*) FROM items WHERE status != 'done'").fetchone()[0]
+
+    def drain_rate(self, window_seconds: float = 60) -> float:
+        """Items completed per second over the last `window_seconds`."""
+        done = self._conn().execute(
+            "SELECT COUNT(*) FROM items WHERE completed_at > ?", (time.time() - window_seconds,)
+        ).fetchone()[0]
+        return done / window_seconds
+
+    def retry_after(self, excess: int, max_seconds: int = 120) -> int:
+        """Seconds until roughly `excess` more items have drained, at the recent rate."""
+        rate = self.drain_rate()
+        return max(1, min(max_seconds, math.ceil(excess / rate))) if rate else max_seconds
+
+    # ---- consumers (workers) ----
+
+    def claim(self, owner: str, limit: int = 1) -> List[Claim]:
+        """
+        Lease up to `limit` items to `owner`, oldest first, whether queued
+        or with an expired lease. Expired items out of attempts are
+        completed with an error result instead.
+        """
+        now = time.time()
+
+        def take(conn):
+            for row in conn.execute(
+                "SELECT id, job_id, attempts FROM items WHERE status = 'leased' AND lease_expires < ?"
+                " AND attempts >= ?",
+                (now, self.max_attempts),
+            ).fetchall():
+                error = {"error": f"Job error: worker lost {row['attempts']} times, giving up"}
+                self._finish(conn, row["id"], row["job_id"], fastjson.dumps(error), now)
+            rows = conn.execute(
+                "UPDATE items SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?"
+                " WHERE id IN (SELECT id FROM items WHERE status = 'queued'"
+                "              OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT ?)"
+                " RETURNING id, job_id, idx, payload",
+                (owner, now + self.lease_seconds, now, limit),
+            ).fetchall()
+            return sorted((row["id"], row["job_id"], row["idx"], fastjson.loads(row["payload"])) for row in rows)
+
+        return self._write(take)
+
+    def heartbeat(self, owner: str) -> int:
+        """Renew the leases of everything `owner` holds; returns how many it still holds."""
+        expires = time.time() + self.lease_seconds
+        return self._write(lambda conn: conn.execute(
+            "UPDATE items SET lease_expires = ? WHERE status = 'leased' AND lease_owner = ?", (expires, owner)
+        ).rowcount)
+
+    def complete(self, owner: str, item_id: int, result: Dict[str, Any]) -> bool:
+        """Store the result of a leased item; False if `owner` lost the lease in the meantime."""
+        data = fastjson.dumps(result)
+
+        def finish(conn):
+            row = conn.execute(
+                "SELECT job_id FROM items WHERE id = ? AND status = 'leased' AND lease_owner = ?", (item_id, owner)
+            ).fetchone()
+            if row is None:
+                return False
+            self._finish(conn, item_id, row["job_id"], data, time.time())
+            return True
+
+        return self._write(finish)
+
+    def release(self, owner: str) -> int:
+        """Put everything `owner` holds back in the queue (on shutdown), without counting the attempt."""
+        return self._write(lambda conn: conn.execute(
+            "UPDATE items SET status = 'queued', attempts = attempts - 1, lease_owner = NULL, lease_expires = NULL"
+            " WHERE status = 'leased' AND lease_owner = ?",
+            (owner,),
+        ).rowcount)
+
+
+class SharedJob:
+    """A job in the queue, as the /jobs endpoints use jobs.Job."""
+
+    def __init__(self, queue: JobQueue, status: Dict[str, Any], poll_seconds: float):
+        self.queue = queue
+        self.id = status["job_id"]
+        self.total = status["total"]
+        self._status = status
+        self.poll_seconds = poll_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._status
+
+    async def stream(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield {"index", "result"} events in completion order until the job is
+        done. Raises JobExpired if the job is pruned before that.
+        """
+        sent = 0
+        while sent < self.total:
+            events = await asyncio.to_thread(self.queue.events, self.id, sent)
+            for event in events:
+                yield event
+            sent += len(events)
+            if not events:
+                completed = await asyncio.to_thread(self.queue.completed, self.id)
+                # Only finished jobs are pruned, so None is the one sign it's gone
+                if completed is None:
+                    raise JobExpired(self.id)
+                # Otherwise an item may have completed since the events read
+                if completed == sent:
+                    await asyncio.sleep(self.poll_seconds)
+
+
+class SharedJobs:
+    """
+    jobs.JobManager's interface over a JobQueue, for API processes that only
+    submit and read jobs; worker.py processes them.
+    """
+
+    def __init__(self, queue: JobQueue, poll_seconds: float = 0.5):
+        self.queue = queue
+        self.poll_seconds = poll_seconds
+        self._backlog = 0
+
+    async def asubmit(self, items: List[Any]) -> SharedJob:
+        submitted = await asyncio.to_thread(self.queue.submit, items)
+        return SharedJob(self.queue, {**submitted, "status": "queued", "completed": 0}, self.poll_seconds)
+
+    async def aget(self, job_id: str) -> Optional[SharedJob]:
+        status = await asyncio.to_thread(self.queue.status, job_id)
+        return SharedJob(self.queue, status, self.poll_seconds) if status is not None else None
+
+    async def abacklog(self) -> int:
+        self._backlog = await asyncio.to_thread(self.queue.backlog)
+        return self._backlog
+
+    def queued(self) -> int:
+        # Last count seen by abacklog; /metrics collectors can't wait on the database
+        return self._backlog
+
+    async def stop(self) -> None:
+        pass
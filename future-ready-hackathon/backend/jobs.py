@@ -0,0 +1,143 @@
+# jobs.py
+"""
+In-process background job queue for batch uploads.
+
+A job is a list of work items (one per uploaded file). Items are processed by
+a fixed pool of asyncio workers; each result is published as soon as it is
+ready so clients can stream them instead of waiting for the whole batch.
+
+API processes run with JOB_QUEUE=sqlite use job_queue.SharedJobs instead,
+which has the same interface over a queue shared with worker.py processes.
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from uuid import uuid4
+
+
+class Job:
+    def __init__(self, items: List[Any]):
+        self.id = uuid4().hex
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.total = len(items)
+        self.items = items
+        # Slot per input file (input order) plus the order results completed in
+        self.results: List[Optional[Dict[str, Any]]] = [None] * self.total
+        self.completion_order: List[int] = []
+        self._changed = asyncio.Condition()
+
+    @property
+    def completed(self) -> int:
+        return len(self.completion_order)
+
+    @property
+    def status(self) -> str:
+        if self.completed == self.total:
+            return "done"
+        return "running" if self.completed else "queued"
+
+    async def publish(self, index: int, result: Dict[str, Any]) -> None:
+        async with self._changed:
+            self.results[index] = result
+            self.completion_order.append(index)
+            if self.completed == self.total:
+                self.finished_at = time.time()
+                # Drop the inputs, only results are needed from here on
+                self.items = []
+            self._changed.notify_all()
+
+    async def stream(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield {"index", "result"} events in completion order until the job is done."""
+        sent = 0
+        while sent < self.total:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.completed > sent)
+                pending = self.completion_order[sent:]
+            for index in pending:
+                yield {"index": index, "result": self.results[index]}
+            sent += len(pending)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "results": self.results,
+        }
+
+
+class JobManager:
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[Dict[str, Any]]],
+        workers: int = 8,
+        retention_seconds: float = 3600,
+    ):
+        self.process = process
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _ensure_started(self) -> None:
+        # Workers are started lazily so they bind to the running event loop
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self) -> None:
+        while True:
+            job, index = await self._queue.get()
+            try:
+                result = await self.process(job.items[index])
+            except Exception as e:
+                result = {"error": f"Job error: {str(e)}"}
+            try:
+                await job.publish(index, result)
+            finally:
+                self._queue.task_done()
+
+    def _prune(self) -> None:
+        now = time.time()
+        expired = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.finished_at and now - job.finished_at > self.retention_seconds
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def submit(self, items: List[Any]) -> Job:
+        self._ensure_started()
+        self._prune()
+        job = Job(items)
+        self.jobs[job.id] = job
+        for index in range(job.total):
+            self._queue.put_nowait((job, index))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    # Same interface as job_queue.SharedJobs, which has to wait on its database
+
+    async def asubmit(self, items: List[Any]) -> Job:
+        return self.submit(items)
+
+    async def aget(self, job_id: str) -> Optional[Job]:
+        return self.get(job_id)
+
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
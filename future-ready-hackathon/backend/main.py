@@ -1,278 +1,791 @@
-import json
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
 from zlib import MAX_WBITS
-import uvicorn
 from fastapi import FastAPI
-from fastapi import UploadFile, File, HTTPException
+from fastapi import Query, Request, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.datastructures import Headers, MutableHeaders
 from pydantic import BaseModel
 from typing import List
 from pathlib import Path
 from uuid import uuid4
-from parse import aparse_file
+import parse
+from parse import LOCAL_PARSE_ENABLED, aparse_file
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Literal, Optional
 from pathlib import PurePath
 import aiofiles
 
 
-from invoice_runner import run_ie, generate_visualization_files, mandatory_fields
-
-# Define the 33 mandatory e-invoice fields
-SUPPLIER_FIELDS = [
-    "Supplier's TIN",
-    "Supplier's Registration / Identification Number / Passport Number",
-    "Supplier's SST Registration Number [Mandatory for SST-registrant]",
-    "Supplier's Tourism Tax Registration Number [Mandatory for tourism tax registrant]",
-    "Supplier's Malaysia Standard Industrial Classification (MSIC) Code",
-    "Supplier's Business Activity Description",
-    "Supplier's Address",
-    "Supplier's Contact Number",
-]
-
-BUYER_FIELDS = [
-    "Buyer's TIN",
-    "Buyer's Registration / Identification Number / Passport Number",
-    "Buyer's SST Registration Number [Mandatory for SST-registrant]",
-    "Buyer's Address",
-    "Buyer's Contact Number",
-]
-
-INVOICE_FIELDS = [
-    "e-Invoice Version",
-    "e-Invoice Type",
-    "e-Invoice Code / Number",
-    "Original e-Invoice Reference Number [Mandatory, where applicable]",
-    "e-Invoice Date and Time",
-    "Issuer's Digital Signature",
-    "Invoice Currency Code",
-    "Currency Exchange Rate [Mandatory, where applicable]",
-    "Supplier's Contact Number",
-]
-
-ITEM_COLUMNS = [
-    "Classification",
-    "Description of Product or Service",
-    "Unit Price",
-    "Tax Type",
-    "Tax Rate [Mandatory, where applicable]",
-    "Details of Tax Exemption [Mandatory if tax exemption is applicable]",
-    "Amount Exempted from Tax [Mandatory if tax exemption is applicable]",
-    "Subtotal",
-    "Total Excluding Tax",
-    "Total Including Tax",
-    "Total Payable Amount",
-    "Quantity",
-    "Measurement",
-]
-
-ALL_MANDATORY_FIELDS = SUPPLIER_FIELDS + BUYER_FIELDS + INVOICE_FIELDS + ITEM_COLUMNS
-
-
-
-def create_mandatory_fields_structure_simple(extractions):
-    """
-    Simple direct comparison approach: Compare extracted field names 
-    directly with mandatory_fields from invoice_runner.py
-    """
-    # Debug: Print what we're working with
-    print(f"DEBUG: Processing {len(extractions) if extractions else 0} extractions")
-    
-    # Collect extracted field names (extraction_class values)
-    extracted_field_names = set()
-    extracted_fields_map = {}
-    
-    if extractions:
-        for extraction in extractions:
-            if hasattr(extraction, 'extraction_class') and hasattr(extraction, 'extraction_text'):
-                class_name = extraction.extraction_class
-                text_value = extraction.extraction_text
-                if class_name and text_value:
-                    extracted_field_names.add(class_name)
-                    extracted_fields_map[class_name] = {
-                        "value": text_value,
-                        "present": True
-                    }
-                    print(f"  Extracted: '{class_name}' = '{text_value}'")
-    
-    print(f"DEBUG: Total unique extracted fields: {len(extracted_field_names)}")
-    print(f"DEBUG: Extracted field names: {list(extracted_field_names)}")
-    print(f"DEBUG: Mandatory fields count: {len(mandatory_fields)}")
-    
-    # Create simple structure with all mandatory fields
-    structured_data = {
-        "mandatory_fields": {},
-        "summary": {}
-    }
-    
-    # Check each mandatory field against extracted fields (exact match only)
-    fields_present = 0
-    matched_fields = []
-    
-    for mandatory_field in mandatory_fields:
-        is_present = mandatory_field in extracted_field_names
-        if is_present:
-            fields_present += 1
-            matched_fields.append(mandatory_field)
-            print(f"  MATCH: '{mandatory_field}' found in extractions")
-            
-        structured_data["mandatory_fields"][mandatory_field] = {
-            "required": True,
-            "present": is_present,
-            "value": extracted_fields_map.get(mandatory_field, {}).get("value", None),
-            "extracted_as": mandatory_field if is_present else None
-        }
-    
-    print(f"DEBUG: Fields present: {fields_present}")
-    print(f"DEBUG: Matched fields: {matched_fields}")
-    
-    # Add summary statistics
-    total_fields = len(mandatory_fields)
-    fields_missing = total_fields - fields_present
-    completion_percentage = round((fields_present / total_fields) * 100, 2)
-    
-    structured_data["summary"] = {
-        "total_mandatory_fields": total_fields,
-        "fields_present": fields_present,
-        "fields_missing": fields_missing,
-        "completion_percentage": completion_percentage,
-        "total_extracted_fields": len(extracted_field_names)  # Add this for frontend
-    }
-    
-    print(f"DEBUG: Summary - Present: {fields_present}, Missing: {fields_missing}, Percentage: {completion_percentage}%")
-    
-    return structured_data
+import invoice_runner
+from invoice_runner import (
+    ExtractionBatcher,
+    extraction_version,
+    fields_key,
+    mandatory_fields,
+    merge_results,
+    render_visualization,
+    result_from_dict,
+    result_to_dict,
+)
+from admission import ADMISSION_REJECTED, BUSY_DETAIL, AdmissionController, AdmissionMiddleware
+from cache import ResultCache
+from compact import COMPACT_VERSION, compact
+import fastjson
+from fast_extract import missing_fields, pre_extract
+from job_queue import JobExpired, JobQueue, SharedJobs
+from jobs import JobManager
+from page_extract import PAGE_MODE_MIN_PAGES, extract_pages, join_pages
+from payload import CompressionMiddleware, FastJSONResponse, parse_fields, shape_result
+from rescore import Rescorer
+from scheduler import api_share, scheduler
+from scoring import SCORE_VERSION, score
+from store import ResultsStore
+from structured_extract import structured_extract
+from metrics import (
+    CACHE_LOOKUPS,
+    FALLBACKS,
+    FIELD_SOURCES,
+    FILES_TOTAL,
+    JOBS_QUEUED,
+    REGISTRY,
+    STAGE_TIMEOUTS,
+    request_id,
+    stage,
+)
+
+# Stage lines are INFO; the per-field dumps are DEBUG and off unless LOG_LEVEL=DEBUG
+logging.basicConfig(format="%(message)s")
+logging.getLogger("invoice").setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger("invoice.api")
+
 
 # Manual fallback functions removed - LLM-only approach for better accuracy
 
 
 # Define base dirs once, reuse them everywhere
 BASE_DIR = Path(__file__).parent
-PDF_DIR = BASE_DIR / "pdf"
-OUT_DIR = BASE_DIR / "output"
+# Shared by every API and worker.py process (uploads have unique names)
+PDF_DIR = Path(os.getenv("PDF_DIR", BASE_DIR / "pdf"))
 
 # Make sure they exist
 PDF_DIR.mkdir(parents=True, exist_ok=True)
-OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # Self define max bytes limit
 MAX_BYTES = 200 * 1024 * 1024  # 200 MB per file
 
-app = FastAPI()
+# Parse / extraction results keyed by PDF content hash, so re-uploads of the
+# same invoice skip both LlamaParse and Gemini.
+cache = ResultCache(
+    root=Path(os.getenv("CACHE_DIR", BASE_DIR / "cache")),
+    max_memory_bytes=int(os.getenv("CACHE_MAX_MEMORY_BYTES", 64 * 1024 * 1024)),
+    max_disk_bytes=int(os.getenv("CACHE_MAX_DISK_BYTES", 1024 * 1024 * 1024)),
+    ttl_seconds=float(os.getenv("CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+)
+
+
+# Queryable results (indexed TIN / e-Invoice Code / date / completion) plus
+# the compressed raw artifacts, which expire after ARTIFACT_TTL_SECONDS
+store = ResultsStore(
+    path=Path(os.getenv("RESULTS_DB", BASE_DIR / "results.db")),
+    artifact_ttl_seconds=float(os.getenv("ARTIFACT_TTL_SECONDS", 30 * 24 * 3600)),
+)
+
+# Re-scores stored rows after a rule change (POST /rescore), in spawned
+# processes so the API's own stays responsive
+rescorer = Rescorer(store, workers=int(os.getenv("RESCORE_WORKERS", "2")))
+_rescore_task: Optional[asyncio.Task] = None
+
+
+async def cache_get(namespace: str, key: str):
+    """cache.aget that also feeds the /metrics cache counters"""
+    value = await cache.aget(namespace, key)
+    CACHE_LOOKUPS.inc(namespace=namespace, result="miss" if value is None else "hit")
+    return value
+
+# Concurrency limits for the upload pipeline. The per-request limit keeps one
+# large batch from hogging every slot, the global one caps in-flight files
+# across all requests (and so the parallel LlamaParse / Gemini calls).
+MAX_CONCURRENT_FILES_PER_REQUEST = int(os.getenv("MAX_CONCURRENT_FILES_PER_REQUEST", "8"))
+MAX_CONCURRENT_FILES = int(os.getenv("MAX_CONCURRENT_FILES", "32"))
+
+_global_file_slots = asyncio.Semaphore(MAX_CONCURRENT_FILES)
+
+# Files admitted (queued or in flight, uploads and job items together) before
+# new uploads get 503 + Retry-After instead of an ever-growing wait
+MAX_QUEUED_FILES = int(os.getenv("MAX_QUEUED_FILES", MAX_CONCURRENT_FILES * 4))
+admission = AdmissionController(MAX_QUEUED_FILES, concurrency=MAX_CONCURRENT_FILES)
+
+# Per-stage deadlines (0 = none). Timed-out work is cancelled, including the
+# upstream call unless another request is waiting on the same one.
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", 300)) or None
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 180)) or None
+# How often /upload-pdf checks whether the client is still there
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", 1))
+
+
+class RequestIdMiddleware:
+    """Tag every request (and its stage log lines) with an id, echoed back in X-Request-ID"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rid = Headers(scope=scope).get("x-request-id") or uuid4().hex[:16]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)["X-Request-ID"] = rid
+            await send(message)
+
+        token = request_id.set(rid)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+# Uvicorn worker processes `python main.py` starts. More than one needs
+# JOB_QUEUE=sqlite, or a job's status would only be known to the process
+# that took the upload.
+API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+
+
+# Heavy dependencies (langextract, llama-index), the API clients and the
+# local-parse workers are set up by the first request that needs them, or
+# ahead of time by this warm-up, which runs in the background from startup
+# (WARM_UP=0 skips it). /health answers 503 until it has finished.
+WARM_UP = os.getenv("WARM_UP", "1") != "0"
+startup: Dict[str, Any] = {"ready": not WARM_UP, "warm_up": {}}
+
+
+def warm_up() -> Dict[str, Any]:
+    """Run the warm-up steps in order; returns how long each took (and any error)."""
+    steps = {}
+    for name, step in (("parse", parse.warm_up), ("extract", invoice_runner.warm_up)):
+        started = time.perf_counter()
+        try:
+            step()
+            steps[name] = {"seconds": round(time.perf_counter() - started, 3)}
+        except Exception as e:
+            # e.g. no API key configured: requests report it per file instead
+            logger.warning("warm-up step %s failed: %s", name, e)
+            steps[name] = {"seconds": round(time.perf_counter() - started, 3), "error": str(e).splitlines()[0]}
+    return steps
+
+
+async def _warm_up_in_background() -> None:
+    startup["warm_up"] = await asyncio.to_thread(warm_up)
+    startup["ready"] = True
+    logger.info("warm-up finished: %s", startup["warm_up"])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One of several processes calling the providers with the same API keys:
+    # the other API processes, and queue workers with JOB_QUEUE=sqlite
+    share = api_share(JOB_QUEUE) / API_WORKERS
+    if share < 1:
+        for provider in scheduler.providers.values():
+            provider.scale(share)
+    warming = asyncio.create_task(_warm_up_in_background()) if WARM_UP else None
+    try:
+        yield
+    finally:
+        if warming is not None:
+            warming.cancel()
+        await jobs.stop()
+        parse.shutdown()
+
+
+# Responses skip jsonable_encoder and go out through fastjson (orjson)
+app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
 
 origins = ["http://localhost:5173"]
 
+# Plain ASGI middleware only: @app.middleware("http") (BaseHTTPMiddleware)
+# hides client disconnects from the endpoints. Last added runs first, so
+# every response, 503s included, gets CORS headers and a request id.
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(AdmissionMiddleware, admission=admission, paths=["/upload-pdf", "/jobs"])
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Request-ID"],
 )
+app.add_middleware(RequestIdMiddleware)
+
+
+class StageTimeout(Exception):
+    """A pipeline stage ran past its deadline."""
+
+
+async def with_timeout(name: str, awaitable, timeout: Optional[float]):
+    """Await `awaitable`, cancelling it and raising StageTimeout after `timeout` seconds."""
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        STAGE_TIMEOUTS.inc(stage=name)
+        raise StageTimeout(f"{name} timed out after {timeout:g}s") from None
+
+
+# Files reaching the LLM stage together share one batched lx.extract call
+ie_batcher = ExtractionBatcher(
+    max_batch=int(os.getenv("IE_BATCH_MAX_DOCS", "16")),
+    max_wait=float(os.getenv("IE_BATCH_WAIT_MS", "50")) / 1000,
+)
+
+
+async def save_upload(file: UploadFile, file_path: Path) -> str:
+    """
+    Stream an uploaded file to disk in 1 MB chunks, enforcing MAX_BYTES.
+    Returns the SHA-256 of the content, computed while streaming.
+    """
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        async with aiofiles.open(file_path, "wb") as out_file:
+            while True:
+                chunk = await file.read(1024 * 1024)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="File too large")
+                digest.update(chunk)
+                await out_file.write(chunk)
+    finally:
+        await file.close()
+    return digest.hexdigest()
+
+
+async def store_upload(file: UploadFile) -> Dict[str, Any]:
+    """
+    Validate and save one uploaded file to PDF_DIR. Returns the saved upload
+    ({"unique_filename", "file_path", "content_hash"}) or an error result.
+    """
+    if file.content_type not in ("application/pdf", "application/octet-stream"):
+        await file.close()
+        return {"filename": file.filename, "error": "Not a PDF"}
+
+    safe_name = PurePath(file.filename).name or "unnamed.pdf"
+    unique_filename = f"{uuid4().hex}_{safe_name}"
+    file_path = PDF_DIR / unique_filename
+
+    try:
+        with stage("save", file=unique_filename):
+            content_hash = await save_upload(file, file_path)
+    except HTTPException as e:
+        file_path.unlink(missing_ok=True)
+        return {"filename": file.filename, "error": e.detail}
+    except asyncio.CancelledError:
+        file_path.unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        file_path.unlink(missing_ok=True)
+        return {"filename": file.filename, "error": f"Save error: {str(e)}"}
+
+    return {
+        "unique_filename": unique_filename,
+        "file_path": file_path,
+        "content_hash": content_hash,
+    }
+
+
+async def process_saved_upload(saved: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse and extract a file saved by store_upload; never raises."""
+    if "error" in saved:
+        return saved
+
+    unique_filename = saved["unique_filename"]
+    file_path = saved["file_path"]
+    content_hash = saved["content_hash"]
+
+    try:
+        parsed = await cache_get("parsed", content_hash)
+        if parsed is None:
+            with stage("parse", file=unique_filename):
+                parsed = await with_timeout(
+                    "parse", aparse_file(str(file_path), key=content_hash), PARSE_TIMEOUT_SECONDS
+                )
+            if parsed.get("parser") == "llamaparse" and LOCAL_PARSE_ENABLED:
+                FALLBACKS.inc(kind="local_parse")
+            if not parsed.get("error"):
+                await cache.aset("parsed", content_hash, parsed)
+
+        # Pass parsed text to invoice_runner
+        pages = parsed.get("markdown_pages") or []
+        # Long documents are extracted page by page, over the joined page text
+        page_mode = len(pages) >= PAGE_MODE_MIN_PAGES
+        if page_mode:
+            text_input, _ = join_pages(pages)
+        else:
+            text_input = parsed.get("text") or parsed.get("markdown") or "\n\n".join(pages)
+        ie_result = None
+        extraction_error = None
+        compaction = None
+        page_report = None
+        if text_input:
+            # Rule-based fast path first, then LlamaParse's structured output;
+            # the LLM only gets what both missed
+            with stage("fast_extract", file=unique_filename):
+                fast_extractions = pre_extract(text_input)
+            if parsed.get("structured_data"):
+                with stage("structured_extract", file=unique_filename) as info:
+                    mapped = structured_extract(
+                        parsed["structured_data"], text_input, skip={x.extraction_class for x in fast_extractions}
+                    )
+                    info.update(fields=len(mapped))
+                    fast_extractions += mapped
+            llm_fields = missing_fields(fast_extractions, mandatory_fields, text=text_input)
+            llm_result = None
+            if llm_fields:
+                if not page_mode:
+                    # Strip boilerplate before the LLM; intervals are mapped back below
+                    with stage("compact", file=unique_filename) as info:
+                        compacted = compact(text_input)
+                        compaction = compacted.report()
+                        info.update(compaction)
+                mode = "pages" if page_mode else "full"
+                ie_key = f"{content_hash}-{extraction_version()}-{COMPACT_VERSION}-{mode}-{fields_key(llm_fields)}"
+                cached = await cache_get("extraction", ie_key)
+                if cached is not None:
+                    llm_result = result_from_dict(cached)
+                else:
+                    try:
+                        if page_mode:
+                            # Pages are compacted one by one inside extract_pages
+                            with stage("llm", file=unique_filename, fields=len(llm_fields)) as info:
+                                llm_result, page_report = await with_timeout(
+                                    "llm", extract_pages(pages, llm_fields, ie_batcher.extract), LLM_TIMEOUT_SECONDS
+                                )
+                                info.update(page_report)
+                            compaction = {
+                                "tokens_before": page_report["tokens_before"],
+                                "tokens_after": page_report["tokens_after"],
+                            }
+                        else:
+                            with stage("llm", file=unique_filename, fields=len(llm_fields)):
+                                llm_result = compacted.to_original(await with_timeout(
+                                    "llm", ie_batcher.extract(compacted.text, fields=llm_fields), LLM_TIMEOUT_SECONDS
+                                ))
+                    except Exception as e:
+                        # Provider still failing after the scheduler's retries,
+                        # or past the deadline: keep the fast-path result and
+                        # say what's missing
+                        extraction_error = str(e)
+                    if llm_result is not None:
+                        await cache.aset("extraction", ie_key, result_to_dict(llm_result))
+            if fast_extractions or llm_result is not None:
+                ie_result = merge_results(text_input, fast_extractions, llm_result)
+
+        # Keep the result so /visualization/{filename} can render it on demand
+        result_dict = result_to_dict(ie_result) if ie_result is not None else None
+        if result_dict is not None:
+            await cache.aset("result", unique_filename, result_dict)
+
+        # Get extractions and create structured data
+        extractions = []
+        if ie_result:
+            if isinstance(ie_result, dict):
+                extractions = ie_result.get("extractions", [])
+            else:
+                extractions = getattr(ie_result, "extractions", [])
+
+        # Match extractions to mandatory_fields from invoice_runner.py (aliases
+        # included) and validate them; rescore.py redoes this from the artifacts
+        with stage("score", file=unique_filename):
+            mandatory_fields_structure, summary = score(extractions)
+        for entry in mandatory_fields_structure["mandatory_fields"].values():
+            if entry["present"]:
+                FIELD_SOURCES.inc(source=entry["source"] or "unknown")
+
+        # Save the result row (and raw artifacts) to the results store
+        with stage("write_output", file=unique_filename):
+            stored = await store.asave(
+                unique_filename,
+                content_hash,
+                mandatory_fields_structure,
+                summary=summary,
+                artifacts={"parsed": parsed, "result": result_dict},
+                score_version=SCORE_VERSION,
+            )
+
+        FILES_TOTAL.inc(outcome="ok")
+        result = {
+            "filename": unique_filename,
+            "summary": summary,
+            "markdown_pages": parsed.get("markdown_pages"),
+            "structured_data": mandatory_fields_structure,
+            "extractions": extractions,
+            "visualization_url": f"/visualization/{unique_filename}" if ie_result is not None else None,
+            "compaction": compaction,
+            "duplicate_of": stored["duplicate_of"],
+        }
+        if page_report is not None:
+            result["page_extraction"] = page_report
+        if parsed.get("error"):
+            result["parse_error"] = parsed["error"]
+        if extraction_error:
+            result["extraction_error"] = extraction_error
+        return result
+    except asyncio.CancelledError:
+        # Client gone: nobody will read the result, so drop the upload too
+        # (unless a worker.py process is putting it back in the job queue)
+        FILES_TOTAL.inc(outcome="cancelled")
+        if not saved.get("keep_upload"):
+            file_path.unlink(missing_ok=True)
+        raise
+    except Exception as e:
+        FILES_TOTAL.inc(outcome="error")
+        # Cleanup uploaded file on parse failure
+        try:
+            file_path.unlink()
+        except Exception:
+            pass
+        return {"filename": unique_filename, "error": f"Parse error: {str(e)}"}
+
+
+def admit(files: int, endpoint: str) -> None:
+    """Reserve admission for `files` files or raise 413 / 503."""
+    if files > admission.max_queued:
+        raise HTTPException(status_code=413, detail=f"Too many files in one request (max {admission.max_queued})")
+    if not admission.try_admit(files):
+        ADMISSION_REJECTED.inc(endpoint=endpoint)
+        raise HTTPException(
+            status_code=503, detail=BUSY_DETAIL, headers={"Retry-After": str(admission.retry_after(files))}
+        )
+
+
+async def cancel_on_disconnect(request: Request, work: asyncio.Future) -> bool:
+    """
+    Wait for `work`, cancelling it if the client disconnects first.
+    Returns False when it was cancelled.
+    """
+    try:
+        while True:
+            done, _ = await asyncio.wait({work}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return True
+            if await request.is_disconnected():
+                logger.info("client disconnected, cancelling request %s", request_id.get())
+                work.cancel()
+                # Let the cancelled files clean up before returning
+                await asyncio.gather(work, return_exceptions=True)
+                return False
+    except asyncio.CancelledError:
+        work.cancel()
+        raise
+
+
+ResultView = Literal["full", "compact", "summary"]
 
 
 @app.post("/upload-pdf")
-async def upload_pdf(files: List[UploadFile] = File(...)):
+async def upload_pdf(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    view: ResultView = "full",
+    fields: Optional[str] = None,
+):
+    """
+    Parse and extract the uploaded PDFs. `view=compact` drops the markdown
+    pages and returns the field table and extractions column by column,
+    `view=summary` only the counts; `fields=summary,structured_data` keeps
+    just those keys of each result.
+    """
     if not files:
         raise HTTPException(status_code=400, detail="No file(s) provided")
 
-    results: List[Dict[str, Any]] = []
+    admit(len(files), "/upload-pdf")
+    try:
+        request_slots = asyncio.Semaphore(MAX_CONCURRENT_FILES_PER_REQUEST)
+
+        async def bounded(file: UploadFile) -> Dict[str, Any]:
+            async with request_slots, _global_file_slots:
+                started = time.perf_counter()
+                result = await process_saved_upload(await store_upload(file))
+                admission.observe(time.perf_counter() - started)
+                return result
+
+        # gather() keeps results in the same order as the uploaded files
+        work = asyncio.ensure_future(asyncio.gather(*(bounded(f) for f in files)))
+        if not await cancel_on_disconnect(request, work):
+            # Nobody is listening; 499 is what proxies log for this
+            return Response(status_code=499)
+        results: List[Dict[str, Any]] = work.result()
+    finally:
+        admission.release(len(files))
+
+    projection = parse_fields(fields)
+    return FastJSONResponse({"results": [shape_result(r, view, projection) for r in results]})
+
+
+async def run_job_item(saved: Dict[str, Any]) -> Dict[str, Any]:
+    """A job item's result; also what worker.py runs for queued items."""
+    # Workers outlive the request, so restore its id for the stage logs
+    token = request_id.set(saved.get("request_id", "-"))
+    try:
+        result = await process_saved_upload(saved)
+    finally:
+        request_id.reset(token)
+    # Encode once here so status polls and streams don't re-encode extractions
+    return fastjson.to_jsonable(result)
+
+
+async def process_job_item(saved: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        async with _global_file_slots:
+            started = time.perf_counter()
+            result = await run_job_item(saved)
+            admission.observe(time.perf_counter() - started)
+    finally:
+        admission.release()
+    return result
+
+
+# JOB_QUEUE=sqlite puts job items in a queue in JOB_DB that every API process
+# shares and worker.py processes work (job_queue.py); by default they run
+# on this process's event loop
+JOB_QUEUE = os.getenv("JOB_QUEUE", "memory")
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", 3600))
+# Items waiting in the shared queue (all jobs) before /jobs answers 503
+JOB_QUEUE_MAX_ITEMS = int(os.getenv("JOB_QUEUE_MAX_ITEMS", 10000))
+
+if JOB_QUEUE == "sqlite":
+    jobs = SharedJobs(
+        JobQueue(Path(os.getenv("JOB_DB", BASE_DIR / "jobs.db")), retention_seconds=JOB_RETENTION_SECONDS),
+        poll_seconds=float(os.getenv("JOB_POLL_SECONDS", 0.5)),
+    )
+else:
+    jobs = JobManager(
+        process=process_job_item,
+        workers=int(os.getenv("JOB_WORKERS", MAX_CONCURRENT_FILES)),
+        retention_seconds=JOB_RETENTION_SECONDS,
+    )
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(files: List[UploadFile] = File(...)):
+    """
+    Save the uploaded files and queue them for background processing.
+    Returns immediately with a job id; poll /jobs/{id} or read /jobs/{id}/stream.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No file(s) provided")
 
-    for file in files:
-        if file.content_type not in ("application/pdf", "application/octet-stream"):
-            results.append({"filename": file.filename, "error": "Not a PDF"})
-            continue
+    shared = isinstance(jobs, SharedJobs)
+    if shared:
+        backlog = await jobs.abacklog()
+        if backlog + len(files) > JOB_QUEUE_MAX_ITEMS:
+            ADMISSION_REJECTED.inc(endpoint="/jobs")
+            retry_after = await asyncio.to_thread(jobs.queue.retry_after, backlog + len(files) - JOB_QUEUE_MAX_ITEMS)
+            raise HTTPException(status_code=503, detail=BUSY_DETAIL, headers={"Retry-After": str(retry_after)})
+
+    # Each item gives its admission back once processed (process_job_item),
+    # or with the shared queue once it is queued
+    admit(len(files), "/jobs")
+    try:
+        # Files have to be on disk before we return: the upload is gone afterwards
+        saved = [await store_upload(f) for f in files]
+        for item in saved:
+            item["request_id"] = request_id.get()
+        job = await jobs.asubmit(saved)
+    except BaseException:
+        admission.release(len(files))
+        raise
+    if shared:
+        admission.release(len(files))
+    return {
+        "job_id": job.id,
+        "total": job.total,
+        "status_url": f"/jobs/{job.id}",
+        "stream_url": f"/jobs/{job.id}/stream",
+    }
 
-        safe_name = PurePath(file.filename).name or "unnamed.pdf"
-        unique_filename = f"{uuid4().hex}_{safe_name}"
-        file_path = PDF_DIR / unique_filename
 
-        written = 0
-        try:
-            async with aiofiles.open(file_path, "wb") as out_file:
-                while True:
-                    chunk = await file.read(1024 * 1024)
-                    if not chunk:
-                        break
-                    written += len(chunk)
-                    if written > MAX_BYTES:
-                        raise HTTPException(status_code=413, detail="File too large")
-                    await out_file.write(chunk)
-        except HTTPException as e:
-            results.append({"filename": file.filename, "error": e.detail})
-            continue
-        except Exception as e:
-            results.append(
-                {"filename": file.filename, "error": f"Save error: {str(e)}"}
-            )
-            continue
-        finally:
-            await file.close()
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, view: ResultView = "full", fields: Optional[str] = None):
+    """Job status and the results so far; `view` / `fields` as for /upload-pdf"""
+    job = await jobs.aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    status = job.to_dict()
+    projection = parse_fields(fields)
+    status["results"] = [shape_result(r, view, projection) for r in status["results"]]
+    return FastJSONResponse(status)
+
 
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, view: ResultView = "full", fields: Optional[str] = None):
+    """
+    Stream per-file results as NDJSON, one line per file in completion order:
+    {"index": <input position>, "result": {...}}, then a final {"done": true}
+    (with an "error" if the job expired before all its results were sent).
+    `view` / `fields` as for /upload-pdf.
+    """
+    job = await jobs.aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    projection = parse_fields(fields)
+
+    async def events():
         try:
-            parsed = await aparse_file(str(file_path))
-
-            # Pass parsed text to invoice_runner
-            text_input = parsed.get("text") or parsed.get("markdown") or "\n\n".join(parsed.get("markdown_pages") or [])
-            ie_result = None
-            if text_input:
-                try:
-                    ie_result = run_ie(text_input)
-                except Exception:
-                    ie_result = None
-
-            # Generate visualization files if we have results
-            if ie_result is not None:
-                try:
-                    html = generate_visualization_files(ie_result, output_name_stem="invoice")
-                    html_path = OUT_DIR / f"{unique_filename}.html"
-                    async with aiofiles.open(html_path, "w", encoding="utf-8") as hf:
-                        await hf.write(html if isinstance(html, str) else str(html))
-                except Exception:
-                    pass
-
-            # Save parsed JSON
-            output_path = OUT_DIR / f"{unique_filename}.json"
-            async with aiofiles.open(output_path, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(parsed, ensure_ascii=False, indent=2))
-
-            # Get extractions and create structured data
-            extractions = []
-            if ie_result:
-                if isinstance(ie_result, dict):
-                    extractions = ie_result.get("extractions", [])
-                else:
-                    extractions = getattr(ie_result, "extractions", [])
-            
-            # Simple direct comparison with mandatory_fields from invoice_runner.py
-            mandatory_fields_structure = create_mandatory_fields_structure_simple(extractions)
-            
-            results.append(
-                {
-                    "filename": unique_filename,
-                    "summary": f"Found {mandatory_fields_structure['summary']['fields_present']}/{mandatory_fields_structure['summary']['total_mandatory_fields']} mandatory fields ({mandatory_fields_structure['summary']['completion_percentage']}%)",
-                    "markdown_pages": parsed.get("markdown_pages"),
-                    "structured_data": mandatory_fields_structure,
-                    "extractions": extractions,
-                }
-            )
-        except Exception as e:
-            # Cleanup uploaded file on parse failure
-            try:
-                file_path.unlink()
-            except Exception:
-                pass
-            results.append(
-                {"filename": unique_filename, "error": f"Parse error: {str(e)}"}
-            )
+            async for event in job.stream():
+                event["result"] = shape_result(event["result"], view, projection)
+                yield fastjson.dumps(event) + b"\n"
+        except JobExpired:
+            yield fastjson.dumps({
+                "done": True, "job_id": job.id, "total": job.total, "error": "Job expired before it finished streaming",
+            }) + b"\n"
+            return
+        yield fastjson.dumps({"done": True, "job_id": job.id, "total": job.total}) + b"\n"
 
-    return {"results": results}
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/visualization/{filename}", response_class=HTMLResponse)
+async def get_visualization(filename: str):
+    """
+    Highlighted-extractions view of one upload. Rendered on first request from
+    the stored extraction result, then served from the cache.
+    """
+    html = await cache_get("visualization", filename)
+    if html is None:
+        stored = await cache_get("result", filename)
+        if stored is None:
+            # Evicted from the cache: fall back to the stored artifact
+            stored = await store.aget_artifact(filename, "result")
+        if stored is None:
+            raise HTTPException(status_code=404, detail="No extraction result for this upload")
+        with stage("visualization", file=filename):
+            html = await asyncio.to_thread(render_visualization, result_from_dict(stored))
+        await cache.aset("visualization", filename, html)
+    return HTMLResponse(html)
+
+
+@app.get("/invoices")
+async def list_invoices(
+    supplier_tin: Optional[str] = None,
+    buyer_tin: Optional[str] = None,
+    invoice_code: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    min_completion: Optional[float] = None,
+    max_completion: Optional[float] = None,
+    duplicates_only: bool = False,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[int] = None,
+):
+    """
+    Stored results, newest first, filtered by any of the indexed columns.
+    Pass the returned next_cursor as ?cursor= for the next page.
+    """
+    return await store.aquery(
+        supplier_tin=supplier_tin,
+        buyer_tin=buyer_tin,
+        invoice_code=invoice_code,
+        date_from=date_from,
+        date_to=date_to,
+        min_completion=min_completion,
+        max_completion=max_completion,
+        duplicates_only=duplicates_only,
+        limit=limit,
+        cursor=cursor,
+    )
+
+
+@app.get("/invoices/{filename}")
+async def get_invoice(filename: str, include_parsed: bool = False):
+    """One stored result with its mandatory-field structure (and the parsed document, if still kept)"""
+    item = await store.aget(filename)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    if include_parsed:
+        item["parsed"] = await store.aget_artifact(filename, "parsed")
+    return item
+
+
+def _rescore_done(task: asyncio.Task) -> None:
+    """Log a failed background re-score and report it through GET /rescore."""
+    if task.cancelled() or task.exception() is None:
+        return
+    e = task.exception()
+    logger.error("re-score failed: %s: %s", type(e).__name__, e, exc_info=e)
+    # Rescorer.run records errors itself, but not those raised before it started
+    rescorer.progress = {**rescorer.progress, "running": False, "error": f"{type(e).__name__}: {e}"}
+
+
+@app.post("/rescore", status_code=202)
+async def start_rescore(all: bool = False, dry_run: bool = False):
+    """
+    Recompute the mandatory-field structure, validations and summary of the
+    stored rows scored under older rules (every row with ?all=true) from
+    their artifacts, without parsing or LLM calls. Runs in the background;
+    GET /rescore reports progress. 409 while a run is in progress.
+    """
+    global _rescore_task
+    if _rescore_task is not None and not _rescore_task.done():
+        raise HTTPException(status_code=409, detail="A re-score is already running")
+    _rescore_task = asyncio.create_task(asyncio.to_thread(rescorer.run, everything=all, dry_run=dry_run))
+    _rescore_task.add_done_callback(_rescore_done)
+    return {"status": "started", "score_version": SCORE_VERSION}
+
+
+@app.get("/rescore")
+async def rescore_status():
+    """Progress of the current (or last) re-score and how many rows are on older rules"""
+    return {
+        **rescorer.progress,
+        "score_version": SCORE_VERSION,
+        "stale": await asyncio.to_thread(store.count_stale, SCORE_VERSION),
+    }
+
+
+REGISTRY.add_collector(lambda: JOBS_QUEUED.set(jobs.queued()))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Per-stage latency histograms, error/cache/fallback counters and in-flight gauges (Prometheus text format)"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and sizes of the parse/extraction cache"""
+    return cache.stats()
+
+
+@app.get("/store/stats")
+async def store_stats():
+    """Row / duplicate / artifact counts and size of the results database"""
+    return await asyncio.to_thread(store.stats)
 
 
 @app.get("/health")
 async def health_check():
-    """Simple health check endpoint"""
-    return {"status": "healthy"}
+    """Readiness check: 503 while the startup warm-up is still running"""
+    if not startup["ready"]:
+        return FastJSONResponse({"status": "starting"}, status_code=503)
+    return {"status": "healthy", "warm_up": startup["warm_up"]}
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    import uvicorn
+
+    if API_WORKERS > 1 and JOB_QUEUE != "sqlite":
+        raise SystemExit("API_WORKERS > 1 needs JOB_QUEUE=sqlite (and worker.py processes)")
+    # Several workers have to import the app themselves
+    uvicorn.run("main:app" if API_WORKERS > 1 else app, host="0.0.0.0", port=8000, workers=API_WORKERS)
\ No newline at end of file
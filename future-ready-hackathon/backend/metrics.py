@@ -0,0 +1,205 @@
+# metrics.py
+"""
+Minimal Prometheus-style metrics and per-stage structured logging for the
+upload pipeline.
+
+    with stage("parse"):
+        parsed = await aparse_file(path)
+
+records the duration in invoice_stage_seconds{stage="parse"}, tracks it in
+invoice_stage_in_flight, counts failures in invoice_stage_errors_total and
+logs one JSON line tagged with the current request id. The context manager
+yields the dict of extra log fields, so a stage can add what it measured.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Tuple
+
+logger = logging.getLogger("invoice.pipeline")
+
+# Set per HTTP request (or per job item); ties the stage log lines together
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{n}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (bucket counts, sum, count)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        """{label values: {"count", "sum"}} for every observed series"""
+        with self._lock:
+            return {key: {"count": count, "sum": total} for key, (_, total, count) in self._series.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, c in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_labels(names, key + (f'{bound:g}',))} {c}")
+                lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total:g}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        # Callbacks run at scrape time, for values owned by other components
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect: Callable[[], None]) -> None:
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            collect()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "invoice_stage_seconds", "Time spent per upload pipeline stage", ["stage"]
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "invoice_stage_errors_total", "Failed upload pipeline stages", ["stage"]
+))
+STAGE_TIMEOUTS = REGISTRY.register(Counter(
+    "invoice_stage_timeouts_total", "Upload pipeline stages cut off by their deadline", ["stage"]
+))
+STAGE_IN_FLIGHT = REGISTRY.register(Gauge(
+    "invoice_stage_in_flight", "Upload pipeline stages currently running", ["stage"]
+))
+FILES_TOTAL = REGISTRY.register(Counter(
+    "invoice_files_total", "Processed files by outcome", ["outcome"]
+))
+FALLBACKS = REGISTRY.register(Counter(
+    "invoice_fallbacks_total", "Fast paths that fell back to the slower path", ["kind"]
+))
+FIELD_SOURCES = REGISTRY.register(Counter(
+    "invoice_field_sources_total", "Mandatory fields found, by the stage that found them", ["source"]
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "invoice_cache_lookups_total", "Result cache lookups by namespace and result", ["namespace", "result"]
+))
+EXTRACT_BATCH_DOCS = REGISTRY.register(Histogram(
+    "invoice_llm_batch_documents", "Documents per lx.extract call (batch hit rate)",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+))
+JOBS_QUEUED = REGISTRY.register(Gauge(
+    "invoice_jobs_queued", "Job items waiting for a worker"
+))
+
+
+@contextmanager
+def stage(name: str, **fields):
+    """Time a pipeline stage; see module docstring."""
+    STAGE_IN_FLIGHT.inc(stage=name)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_IN_FLIGHT.dec(stage=name)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                "request_id": request_id.get(),
+                "stage": name,
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 2),
+                **fields,
+            }, default=str))
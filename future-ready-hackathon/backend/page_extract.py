@@ -0,0 +1,128 @@
+# page_extract.py
+"""
+Page-incremental LLM extraction for long invoices.
+
+Header fields are almost always on the first page and totals on the last, so
+instead of extracting over the whole joined document we go page by page in
+priority order (first, last, second, second to last, ...), in waves that
+double in size (2, 4, 8, ... pages, each wave one concurrent / batched round),
+asking every wave only for the fields still missing. Pages that compact to
+almost nothing (blank, terms and conditions) are skipped. Extraction stops as
+soon as nothing is missing, so the number of LLM rounds grows with log(pages)
+at worst and is usually one.
+
+Extractions found on several pages are deduplicated per field, keeping the
+most confident one (alignment quality, then page priority).
+"""
+import asyncio
+import os
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Sequence, Tuple
+
+from compact import compact
+from fast_extract import missing_fields
+from invoice_schema import confidence, resolve_field
+
+if TYPE_CHECKING:  # imported lazily, it is slow to import
+    import langextract as lx
+
+# Same separator both parsers use to build parsed["markdown"]
+PAGE_SEPARATOR = "\n\n---\n\n"
+
+PAGE_MODE_MIN_PAGES = int(os.getenv("PAGE_MODE_MIN_PAGES", "3"))
+PAGE_FIRST_WAVE = int(os.getenv("PAGE_FIRST_WAVE", "2"))
+# Pages with less than this left after compaction (blank pages, terms and
+# conditions) are not worth a round trip
+PAGE_MIN_TOKENS = int(os.getenv("PAGE_MIN_TOKENS", "12"))
+
+Extract = Callable[..., Awaitable["lx.data.AnnotatedDocument"]]
+
+
+def join_pages(pages: Sequence[str]) -> Tuple[str, List[int]]:
+    """(full text, start offset of every page in it)"""
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page) + len(PAGE_SEPARATOR)
+    return PAGE_SEPARATOR.join(pages), offsets
+
+
+def page_order(count: int) -> List[int]:
+    """0, n-1, 1, n-2, ... : header and totals pages first, the middle last"""
+    order = []
+    low, high = 0, count - 1
+    while low <= high:
+        order.append(low)
+        if high != low:
+            order.append(high)
+        low += 1
+        high -= 1
+    return order
+
+
+async def extract_pages(
+    pages: Sequence[str],
+    fields: Sequence[str],
+    extract: Extract,
+) -> Tuple["lx.data.AnnotatedDocument", Dict]:
+    """
+    Extract `fields` from `pages` (see module docstring) with
+    `extract(text, fields=...)`, e.g. ExtractionBatcher.extract.
+
+    Returns an AnnotatedDocument over join_pages(pages) with one extraction
+    per found field, plus a report {"pages", "pages_extracted", "waves",
+    "stopped_early", "tokens_before", "tokens_after"}. Raises the first error
+    only when no page could be extracted at all.
+    """
+    import langextract as lx
+
+    text, offsets = join_pages(pages)
+    compacted = [compact(page) for page in pages]
+    kept = [i for i, c in enumerate(compacted) if c.tokens_after >= PAGE_MIN_TOKENS]
+    order = [kept[j] for j in page_order(len(kept))]
+    best: Dict[str, Tuple[Tuple[int, int], "lx.data.Extraction"]] = {}
+    report = {"pages": len(pages), "pages_extracted": 0, "waves": 0, "stopped_early": False,
+              "tokens_before": 0, "tokens_after": 0}
+    errors = []
+
+    missing = list(fields)
+    wave_size = max(1, PAGE_FIRST_WAVE)
+    position = 0
+    while missing and position < len(order):
+        wave = order[position:position + wave_size]
+        position += len(wave)
+        wave_size *= 2
+        report["waves"] += 1
+
+        outcomes = await asyncio.gather(
+            *(extract(compacted[i].text, fields=missing) for i in wave), return_exceptions=True
+        )
+        for rank, (page, outcome) in enumerate(zip(wave, outcomes), start=position - len(wave)):
+            c = compacted[page]
+            report["tokens_before"] += c.tokens_before
+            report["tokens_after"] += c.tokens_after
+            if isinstance(outcome, Exception):
+                errors.append(outcome)
+                continue
+            report["pages_extracted"] += 1
+            # None: a batch that returned nothing for the page, i.e. found nothing
+            result = c.to_original(outcome, offset=offsets[page])
+            for extraction in getattr(result, "extractions", None) or []:
+                field = resolve_field(extraction.extraction_class)
+                if field not in missing or not extraction.extraction_text:
+                    continue
+                # Prefer better alignment, then the higher-priority page
+                score = (confidence(extraction), -rank)
+                if field not in best or score > best[field][0]:
+                    best[field] = (score, extraction)
+
+        missing = missing_fields([x for _, x in best.values()], missing, text=text)
+
+    report["stopped_early"] = position < len(order)
+    if not best and errors:
+        raise errors[0]
+
+    extractions = [x for _, x in best.values()]
+    for index, extraction in enumerate(extractions, start=1):
+        extraction.extraction_index = index
+    return lx.data.AnnotatedDocument(text=text, extractions=extractions), report
@@ -1,27 +1,216 @@
 # parse.py
-from llama_cloud_services import LlamaParse
-from dotenv import load_dotenv
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
 import os
+import re
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+from scheduler import scheduler
+
+# The local fast path is optional; pdfplumber is only imported by the
+# processes that actually run local parses
+HAS_PDFPLUMBER = importlib.util.find_spec("pdfplumber") is not None
 
 load_dotenv()
 
-parser = LlamaParse(
-    api_key=os.getenv("LLAMA_CLOUD_API_KEY"),
-    num_workers=4,
-    verbose=True,
-    language="en",
-    # Keep tables as Markdown so we don't need rehypeRaw on the frontend
-    output_tables_as_HTML=False,
-    premium_mode=True,
-    extract_structured_data=True,
-    adaptive_long_table=True,
-    outlined_table_extraction=True,
-)
-
-async def aparse_file(pdf_path: str) -> dict:
-    """Async version of parse_file"""
+logger = logging.getLogger("invoice.parse")
+
+# LlamaParse client, built on first use (or by warm_up): importing
+# llama_cloud_services pulls in llama-index and takes about a second
+parser = None
+_parser_lock = threading.Lock()
+
+
+def get_parser():
+    global parser
+    with _parser_lock:
+        if parser is None:
+            from llama_cloud_services import LlamaParse
+
+            parser = LlamaParse(
+                api_key=os.getenv("LLAMA_CLOUD_API_KEY"),
+                num_workers=4,
+                verbose=True,
+                language="en",
+                # Keep tables as Markdown so we don't need rehypeRaw on the frontend
+                output_tables_as_HTML=False,
+                premium_mode=True,
+                extract_structured_data=True,
+                adaptive_long_table=True,
+                outlined_table_extraction=True,
+            )
+    return parser
+
+# Born-digital PDFs already carry a usable text layer; read it locally and
+# only send scanned / broken ones to LlamaParse.
+LOCAL_PARSE_ENABLED = os.getenv("LOCAL_PARSE", "1") != "0" and HAS_PDFPLUMBER
+LOCAL_PARSE_WORKERS = int(os.getenv("LOCAL_PARSE_WORKERS", "2"))
+LOCAL_PARSE_MAX_PAGES = int(os.getenv("LOCAL_PARSE_MAX_PAGES", "200"))
+
+# Quality heuristic thresholds for the local text layer
+MIN_TEXT_CHARS = 200
+MIN_PAGE_COVERAGE = 0.8  # share of pages that must have text
+MIN_ALNUM_RATIO = 0.4
+MAX_GARBAGE_RATIO = 0.02  # (cid:NN) glyphs / replacement chars
+
+_CID = re.compile(r"\(cid:\d+\)")
+
+_local_pool = None
+
+
+def _get_local_pool() -> Executor:
+    global _local_pool
+    if _local_pool is None:
+        # Spawned, not forked: by now the process runs threads (event loop
+        # executors, the warm-up) whose locks a fork could copy mid-use
+        _local_pool = ProcessPoolExecutor(
+            max_workers=LOCAL_PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _local_pool
+
+
+def set_local_pool(executor: Executor) -> None:
+    """
+    Run local parses on `executor` instead of the default process pool, e.g.
+    a thread pool in a process that is already one of several workers.
+    """
+    global _local_pool
+    _local_pool = executor
+
+
+def _warm_worker() -> int:
+    import pdfplumber  # noqa: F401
+
+    return os.getpid()
+
+
+def warm_up() -> None:
+    """
+    Start the local-parse worker processes (they import pdfplumber, not
+    llama-index) and build the LlamaParse client.
+    """
+    if LOCAL_PARSE_ENABLED:
+        pool = _get_local_pool()
+        for future in [pool.submit(_warm_worker) for _ in range(LOCAL_PARSE_WORKERS)]:
+            future.result()
+    get_parser()
+
+
+def shutdown() -> None:
+    """Stop the local-parse workers."""
+    global _local_pool
+    if _local_pool is not None:
+        _local_pool.shutdown(wait=False, cancel_futures=True)
+        _local_pool = None
+
+
+def _table_to_markdown(rows) -> str:
+    rows = [[(cell or "").replace("\n", " ").strip() for cell in row] for row in rows if row]
+    if not rows:
+        return ""
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    lines = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * width]
+    lines += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+    return "\n".join(lines)
+
+
+def local_parse(pdf_path: str) -> dict:
+    """
+    Read the PDF text layer and tables with pdfplumber. Runs in a worker
+    process; returns the same shape as aparse_file.
+    """
+    import pdfplumber
+
+    page_texts = []
+    markdown_pages = []
+    with pdfplumber.open(pdf_path) as pdf:
+        if len(pdf.pages) > LOCAL_PARSE_MAX_PAGES:
+            raise ValueError(f"{len(pdf.pages)} pages is over LOCAL_PARSE_MAX_PAGES")
+        for page in pdf.pages:
+            page_texts.append(page.extract_text() or "")
+
+            tables = page.find_tables()
+            if tables:
+                # Render tables as Markdown, the surrounding text as-is
+                bboxes = [t.bbox for t in tables]
+                outside = page.filter(
+                    lambda obj: obj.get("object_type") != "char"
+                    or not any(
+                        x0 <= obj["x0"] and obj["x1"] <= x1 and top <= obj["top"] and obj["bottom"] <= bottom
+                        for x0, top, x1, bottom in bboxes
+                    )
+                )
+                md_parts = [outside.extract_text() or ""]
+                md_parts += [_table_to_markdown(t.extract()) for t in tables]
+                markdown_pages.append("\n\n".join(p for p in md_parts if p))
+            else:
+                markdown_pages.append(page_texts[-1])
+
+    return {
+        "text": "\n\n".join(page_texts),
+        "markdown": "\n\n---\n\n".join(markdown_pages),
+        "markdown_pages": markdown_pages,
+        "structured_data": [],
+    }
+
+
+def text_layer_problem(parsed: dict):
+    """
+    Quality heuristic for a locally parsed PDF. Returns None when the text
+    layer looks usable, otherwise a short reason for falling back.
+    """
+    text = parsed.get("text") or ""
+    pages = parsed.get("markdown_pages") or []
+    stripped = re.sub(r"\s+", "", text)
+    if len(stripped) < MIN_TEXT_CHARS:
+        return "no text layer"
+    if pages and sum(1 for p in pages if len(p.strip()) >= 20) / len(pages) < MIN_PAGE_COVERAGE:
+        return "pages without text"
+    garbage = len(_CID.findall(text)) + text.count("\ufffd")
+    if garbage / len(stripped) > MAX_GARBAGE_RATIO:
+        return "unmapped glyphs"
+    if sum(c.isalnum() for c in stripped) / len(stripped) < MIN_ALNUM_RATIO:
+        return "low alphanumeric ratio"
+    return None
+
+
+async def aparse_file(pdf_path: str, key: str = None) -> dict:
+    """
+    Parse a PDF into {"text", "markdown", "markdown_pages", "structured_data"}.
+    Tries the local text layer first and falls back to LlamaParse; the path
+    taken is recorded under "parser". `key` (e.g. the content hash) lets
+    concurrent parses of the same PDF share one LlamaParse call.
+    """
+    fallback_reason = "local parsing disabled"
+    if LOCAL_PARSE_ENABLED:
+        try:
+            loop = asyncio.get_running_loop()
+            local = await loop.run_in_executor(_get_local_pool(), local_parse, pdf_path)
+            fallback_reason = text_layer_problem(local)
+            if fallback_reason is None:
+                local["parser"] = "local"
+                return local
+        except Exception as e:
+            fallback_reason = f"local parse failed: {str(e)}"
+
+    parsed = await aparse_remote(pdf_path, key=key)
+    parsed["parser"] = "llamaparse"
+    parsed["local_fallback_reason"] = fallback_reason
+    return parsed
+
+
+async def aparse_remote(pdf_path: str, key: str = None) -> dict:
+    """Parse with LlamaParse (premium mode), through the outbound scheduler"""
     try:
-        result = await parser.aparse(pdf_path)
+        # Building the client imports llama-index: not on the event loop
+        client = await asyncio.to_thread(get_parser)
+        result = await scheduler.call("llamaparse", lambda: client.aparse(pdf_path), key=key)
 
         # text
         text_docs = result.get_text_documents(split_by_page=False)
@@ -47,7 +236,7 @@ async def aparse_file(pdf_path: str) -> dict:
             "structured_data": structured_data,
         }
     except Exception as e:
-        print(f"Error parsing PDF: {str(e)}")
+        logger.warning("Error parsing PDF: %s", e)
         return {
             "text": "",
             "markdown": "",
@@ -0,0 +1,245 @@
+# payload.py
+"""
+Shaping and encoding of upload results on the way out.
+
+- views: "full" is the original per-file result; "compact" drops the markdown
+  pages and encodes the mandatory-field table and the extractions column by
+  column; "summary" keeps only the counts and the links
+- `fields` projects a result onto the listed top-level keys
+- FastJSONResponse encodes with fastjson instead of jsonable_encoder + json
+- CompressionMiddleware compresses responses with zstd when the client
+  accepts it and zstandard is installed, gzip otherwise, flushing every
+  chunk of a streamed body
+"""
+import asyncio
+import os
+import zlib
+from typing import Any, Dict, Iterable, List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+import fastjson
+
+try:
+    import zstandard
+except ImportError:  # optional, responses fall back to gzip
+    zstandard = None
+
+VIEWS = ("full", "compact", "summary")
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 6))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+# Bodies at least this big are compressed off the event loop
+COMPRESS_THREAD_MIN_BYTES = 128 * 1024
+
+# Keys every view keeps, so clients can always match results to files
+_ALWAYS = ("filename", "error")
+_SUMMARY_KEYS = _ALWAYS + (
+    "summary", "visualization_url", "duplicate_of", "parse_error", "extraction_error",
+)
+
+
+def _get(item: Any, name: str, default=None):
+    """Attribute or key: results hold Extraction objects before encoding, dicts after."""
+    if isinstance(item, dict):
+        return item.get(name, default)
+    return getattr(item, name, default)
+
+
+def columnar_fields(structured: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Mandatory-field table as parallel lists. "required" (always true) and
+    "extracted_as" (the field name when present) carry no information and
+    are dropped.
+    """
+    table = structured.get("mandatory_fields") or {}
+    return {
+        "layout": "columnar",
+        "field": list(table),
+        "present": [entry.get("present", False) for entry in table.values()],
+        "value": [entry.get("value") for entry in table.values()],
+        "source": [entry.get("source") for entry in table.values()],
+        "summary": structured.get("summary"),
+        "validation": structured.get("validation"),
+    }
+
+
+def columnar_extractions(extractions: Optional[Iterable[Any]]) -> Dict[str, List[Any]]:
+    """Extractions as parallel lists of class, text and character span (null when unaligned)."""
+    columns = {"class": [], "text": [], "start": [], "end": []}
+    for extraction in extractions or []:
+        interval = _get(extraction, "char_interval")
+        columns["class"].append(_get(extraction, "extraction_class"))
+        columns["text"].append(_get(extraction, "extraction_text"))
+        columns["start"].append(_get(interval, "start_pos") if interval else None)
+        columns["end"].append(_get(interval, "end_pos") if interval else None)
+    return columns
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """"summary, structured_data" -> ["summary", "structured_data"]"""
+    if not fields:
+        return None
+    return [name.strip() for name in fields.split(",") if name.strip()]
+
+
+def shape_result(result: Optional[Dict[str, Any]], view: str = "full", fields: Optional[List[str]] = None):
+    """One per-file result in the requested view, projected onto `fields`."""
+    if not result or (view == "full" and not fields):
+        return result
+    if view == "summary":
+        shaped = {key: result[key] for key in _SUMMARY_KEYS if key in result}
+        structured = result.get("structured_data")
+        if structured is not None:
+            shaped["structured_data"] = {"summary": structured.get("summary")}
+    elif view == "compact":
+        shaped = {key: value for key, value in result.items() if key != "markdown_pages"}
+        if result.get("structured_data") is not None:
+            shaped["structured_data"] = columnar_fields(result["structured_data"])
+        if "extractions" in result:
+            shaped["extractions"] = columnar_extractions(result["extractions"])
+    else:
+        shaped = result
+    if fields:
+        shaped = {key: value for key, value in shaped.items() if key in fields or key in _ALWAYS}
+    return shaped
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with fastjson (orjson when available)."""
+
+    def render(self, content: Any) -> bytes:
+        return fastjson.dumps(content)
+
+
+class CompressionResponder:
+    """
+    Compresses one http response. Standalone rather than a subclass of
+    Starlette's GZipMiddleware responders, whose internals change between
+    releases and which hold streamed bodies back: every chunk here is
+    flushed, so NDJSON job streams reach the client as they are produced.
+    Subclasses set `content_encoding` and the compressor.
+    """
+
+    content_encoding = ""
+
+    def __init__(self, app, minimum_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.send = None
+        self.initial_message = None
+        self.started = False
+        self.passthrough = False
+        self.compressor = None
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    def new_compressor(self):
+        raise NotImplementedError
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        raise NotImplementedError
+
+    async def compress(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= COMPRESS_THREAD_MIN_BYTES:
+            return await asyncio.to_thread(self._compress, body, more_body)
+        return self._compress(body, more_body)
+
+    async def send_with_compression(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Held back until the first body chunk decides whether to compress
+            self.initial_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                # Server-sent events, as GZipMiddleware leaves them
+                or headers.get("content-type", "").startswith("text/event-stream")
+            )
+            return
+        if message_type != "http.response.body" or self.passthrough:
+            if self.initial_message is not None and not self.started:
+                self.started = True
+                await self.send(self.initial_message)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        if not self.started:
+            self.started = True
+            if not more_body and len(body) < self.minimum_size:
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+            self.compressor = self.new_compressor()
+            headers["Content-Encoding"] = self.content_encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+            body = await self.compress(body, more_body)
+            if not more_body:
+                headers["Content-Length"] = str(len(body))
+            await self.send(self.initial_message)
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+        if self.compressor is None:
+            await self.send(message)
+            return
+        body = await self.compress(body, more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+class ZstdResponder(CompressionResponder):
+    content_encoding = "zstd"
+
+    def __init__(self, app, minimum_size: int, level: int = ZSTD_LEVEL):
+        super().__init__(app, minimum_size)
+        self.level = level
+
+    def new_compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        flush = zstandard.COMPRESSOBJ_FLUSH_BLOCK if more_body else zstandard.COMPRESSOBJ_FLUSH_FINISH
+        return self.compressor.compress(body) + self.compressor.flush(flush)
+
+
+class GzipResponder(CompressionResponder):
+    content_encoding = "gzip"
+
+    def __init__(self, app, minimum_size: int, level: int = GZIP_LEVEL):
+        super().__init__(app, minimum_size)
+        self.level = level
+
+    def new_compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def _compress(self, body: bytes, more_body: bool) -> bytes:
+        return self.compressor.compress(body) + self.compressor.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """Compresses responses with zstd when both sides support it, gzip otherwise."""
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES, compresslevel: int = GZIP_LEVEL):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        if zstandard is not None and "zstd" in accepted:
+            await ZstdResponder(self.app, self.minimum_size)(scope, receive, send)
+        elif "gzip" in accepted:
+            await GzipResponder(self.app, self.minimum_size, self.compresslevel)(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
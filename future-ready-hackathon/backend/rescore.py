@@ -0,0 +1,246 @@
+# rescore.py
+"""
+Re-score stored results after a change to the mandatory fields, the alias
+rules or the validations, without parsing or calling the LLM again.
+
+    python rescore.py --db results.db --workers 8
+    python rescore.py --db results.db --dry-run    # count what would change
+    python rescore.py --db results.db --all        # rows on the current rules too
+
+Only rows scored under another scoring.SCORE_VERSION are visited. They are
+read in id order, a batch at a time, with their stored artifacts: the
+extraction result (text plus fast-path and LLM extractions), or for rows
+that never got one the parsed document, which goes through the fast path
+and its structured data as on upload.
+Structure and validations are recomputed with scoring.score_many (one
+validation pass per batch) in `--workers` processes. Rows whose score
+changed are rewritten with their indexed columns; the others only get the
+new version, so a re-run after a crash carries on where it stopped. Rows
+whose artifacts expired (or were never stored) are skipped.
+
+POST /rescore runs the same thing inside the API.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import fastjson
+from page_extract import PAGE_MODE_MIN_PAGES, join_pages
+from scoring import SCORE_VERSION, score_many
+from store import ResultsStore, load_artifact
+
+logger = logging.getLogger("invoice.rescore")
+
+# (id, "changed" / "unchanged" / "skipped" / "error", structured_data, summary or error)
+Outcome = Tuple[int, str, Optional[Dict[str, Any]], Optional[str]]
+
+
+def _parsed_text(parsed: Dict[str, Any]) -> str:
+    """The text process_saved_upload extracts from for a parsed document."""
+    pages = parsed.get("markdown_pages") or []
+    if len(pages) >= PAGE_MODE_MIN_PAGES:
+        return join_pages(pages)[0]
+    return parsed.get("text") or parsed.get("markdown") or "\n\n".join(pages)
+
+
+def _extractions(row: Dict[str, Any]) -> Optional[list]:
+    """The row's stored extractions, or None when there is nothing to re-score from."""
+    if row["result"] is not None:
+        from invoice_runner import result_from_dict
+
+        return result_from_dict(load_artifact(row["result"]), owned=True).extractions
+    if row["parsed"] is not None:
+        from fast_extract import pre_extract
+        from structured_extract import structured_extract
+
+        parsed = load_artifact(row["parsed"])
+        text = _parsed_text(parsed)
+        if not text:
+            return []
+        # Fast path, then LlamaParse's structured output, as process_saved_upload
+        extractions = pre_extract(text)
+        if parsed.get("structured_data"):
+            extractions += structured_extract(
+                parsed["structured_data"], text, skip={x.extraction_class for x in extractions}
+            )
+        return extractions
+    return None
+
+
+def rescore_rows(rows: List[Dict[str, Any]]) -> List[Outcome]:
+    """Re-score a batch of store.stale rows; runs in the worker processes."""
+    outcomes: List[Outcome] = []
+    todo = []
+    for row in rows:
+        try:
+            extractions = _extractions(row)
+        except Exception as e:
+            outcomes.append((row["id"], "error", None, f"{type(e).__name__}: {e}"))
+            continue
+        if extractions is None:
+            outcomes.append((row["id"], "skipped", None, None))
+        else:
+            todo.append((row, extractions))
+
+    try:
+        scored = score_many([extractions for _, extractions in todo])
+    except Exception:
+        # One bad row shouldn't cost the batch: score them one by one
+        scored = []
+        for row, extractions in todo:
+            try:
+                scored.extend(score_many([extractions]))
+            except Exception as e:
+                scored.append(e)
+
+    for (row, _), result in zip(todo, scored):
+        if isinstance(result, Exception):
+            outcomes.append((row["id"], "error", None, f"{type(result).__name__}: {result}"))
+            continue
+        structured_data, summary = result
+        old = fastjson.loads(row["structured_data"]) if row["structured_data"] else None
+        if old == structured_data and row["summary"] == summary:
+            outcomes.append((row["id"], "unchanged", None, None))
+        else:
+            outcomes.append((row["id"], "changed", structured_data, summary))
+    return outcomes
+
+
+class Rescorer:
+    """
+    Runs re-scores against one store and keeps the progress of the current
+    (or last) run in `progress` for GET /rescore.
+    """
+
+    def __init__(self, store: ResultsStore, workers: int = 1, batch_size: int = 200):
+        self.store = store
+        self.workers = workers
+        self.batch_size = batch_size
+        self.progress: Dict[str, Any] = {"running": False}
+        self._lock = threading.Lock()
+
+    def run(self, everything: bool = False, dry_run: bool = False, on_batch=None) -> Dict[str, Any]:
+        """
+        Re-score every stale row (every row with `everything`) and return the
+        final progress. `dry_run` scores without writing. `on_batch(progress)`
+        is called after each batch. Raises RuntimeError if a run is already
+        in progress.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("a re-score is already running")
+        try:
+            version = None if everything else SCORE_VERSION
+            progress = self.progress = {
+                "running": True,
+                "score_version": SCORE_VERSION,
+                "dry_run": dry_run,
+                "total": self.store.count_stale(version),
+                "done": 0, "changed": 0, "unchanged": 0, "skipped": 0, "errors": 0,
+                "started_at": time.time(),
+                "seconds": 0.0,
+            }
+            started = time.perf_counter()
+
+            def finish(outcomes: List[Outcome]) -> None:
+                updates = []
+                for row_id, outcome, structured_data, detail in outcomes:
+                    progress["errors" if outcome == "error" else outcome] += 1
+                    if outcome == "error":
+                        logger.warning("re-scoring row %d failed: %s", row_id, detail)
+                    elif outcome != "skipped":
+                        updates.append((row_id, structured_data, detail))
+                if updates and not dry_run:
+                    self.store.update_scores(updates, SCORE_VERSION)
+                progress["done"] += len(outcomes)
+                progress["seconds"] = round(time.perf_counter() - started, 3)
+                if on_batch is not None:
+                    on_batch(progress)
+
+            def batches():
+                after = 0
+                while True:
+                    rows = self.store.stale(version, after=after, limit=self.batch_size)
+                    if not rows:
+                        return
+                    after = rows[-1]["id"]
+                    yield rows
+
+            if self.workers <= 1:
+                for rows in batches():
+                    finish(rescore_rows(rows))
+            else:
+                # Spawned, not forked: the API process runs threads and an event loop
+                with ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    pending = set()
+                    source = batches()
+                    while True:
+                        # Keep every worker busy with one batch queued behind it
+                        for rows in source:
+                            pending.add(pool.submit(rescore_rows, rows))
+                            if len(pending) >= self.workers * 2:
+                                break
+                        if not pending:
+                            break
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            finish(future.result())
+
+            logger.info(
+                "re-scored %d rows in %.1f s: %d changed, %d unchanged, %d skipped, %d errors",
+                progress["done"], progress["seconds"], progress["changed"], progress["unchanged"],
+                progress["skipped"], progress["errors"],
+            )
+            return progress
+        except Exception as e:
+            self.progress["error"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.progress["running"] = False
+            self._lock.release()
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=os.getenv("RESULTS_DB", Path(__file__).parent / "results.db"),
+                    help="SQLite results store (default: $RESULTS_DB or results.db)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes")
+    ap.add_argument("--batch-size", type=int, default=200, help="rows per batch")
+    ap.add_argument("--all", action="store_true", help="also re-score rows already on the current rules")
+    ap.add_argument("--dry-run", action="store_true", help="score and count, but don't write")
+    ap.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "WARNING"))
+    args = ap.parse_args(argv)
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("invoice").setLevel(args.log_level.upper())
+
+    if not Path(args.db).exists():
+        raise SystemExit(f"{args.db} does not exist")
+    rescorer = Rescorer(ResultsStore(args.db), workers=args.workers, batch_size=args.batch_size)
+    last = 0.0
+
+    def report(progress: Dict[str, Any], final: bool = False) -> None:
+        nonlocal last
+        if not final and (time.monotonic() - last < 1.0 or progress["done"] >= progress["total"]):
+            return
+        last = time.monotonic()
+        rate = progress["done"] / max(progress["seconds"], 1e-9)
+        print(
+            f"{progress['done']}/{progress['total']} done  {rate:.0f}/s  {progress['changed']} changed  "
+            f"{progress['unchanged']} unchanged  {progress['skipped']} skipped  {progress['errors']} errors",
+            file=sys.stderr, flush=True,
+        )
+
+    progress = rescorer.run(everything=args.all, dry_run=args.dry_run, on_batch=report)
+    report(progress, final=True)
+    if progress["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
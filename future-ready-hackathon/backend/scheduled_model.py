@@ -0,0 +1,101 @@
+# scheduled_model.py
+"""
+langextract model that sends each of its requests through the outbound
+scheduler.
+
+One lx.extract call turns into many model requests (one per chunk, up to
+batch_length of them at once), so scheduling whole lx.extract calls lets
+the provider see far more than the rate and concurrency limits. Wrapping
+the model instead puts every request under the "gemini" token bucket,
+adaptive concurrency limit and retries: a 429 retries just that chunk and
+halves the limit for all extractions in the process.
+
+Imported on first use, like langextract itself.
+"""
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import CancelledError
+from functools import partial
+
+from langextract.core import base_model
+
+from scheduler import scheduler
+
+
+class ScheduledModel(base_model.BaseLanguageModel):
+    """
+    Delegates to the model `create_model()` returns (built on first use, in
+    lx.extract's thread), one prompt per request, each one
+    scheduler.call_in_executor(provider, executor, ...) on `loop`. The
+    prompts of one infer() call are in flight together as far as the
+    provider's limits allow; identical prompts in flight share a request.
+
+    cancel() is for an abandoned lx.extract call, whose thread can't be
+    stopped: its waiting prompts are cancelled and later ones fail at once.
+    """
+
+    def __init__(self, create_model, loop, executor, provider="gemini"):
+        super().__init__()
+        self._create_model = create_model
+        self._model = None
+        self.loop = loop
+        self.executor = executor
+        self.provider = provider
+        self._lock = threading.Lock()
+        self._futures = set()
+        self._cancelled = False
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._create_model()
+        return self._model
+
+    @property
+    def schema(self):
+        return self.model.schema
+
+    @property
+    def requires_fence_output(self):
+        return self.model.requires_fence_output
+
+    def parse_output(self, output):
+        return self.model.parse_output(output)
+
+    def _infer_one(self, prompt, kwargs):
+        return list(self.model.infer([prompt], **kwargs))[0]
+
+    def infer(self, batch_prompts, **kwargs):
+        futures = []
+        with self._lock:
+            if self._cancelled:
+                raise CancelledError()
+            for prompt in batch_prompts:
+                future = asyncio.run_coroutine_threadsafe(
+                    scheduler.call_in_executor(
+                        self.provider,
+                        self.executor,
+                        partial(self._infer_one, prompt, kwargs),
+                        key=hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+                    ),
+                    self.loop,
+                )
+                futures.append(future)
+                self._futures.add(future)
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # Also reached when a prompt failed: the rest are no longer needed
+            for future in futures:
+                future.cancel()
+            with self._lock:
+                self._futures.difference_update(futures)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._cancelled = True
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,355 @@
+# scheduler.py
+"""
+Shared scheduler for outbound calls to the parsing / LLM providers.
+
+Every call to a provider goes through `scheduler.call(provider, fn, ...)`,
+which applies, in order:
+
+- coalescing: identical in-flight requests (same `key`) share one call,
+  cancelled once every request waiting for it has been cancelled
+- a token bucket per provider (steady request rate + burst)
+- adaptive concurrency (AIMD): the in-flight limit grows slowly while calls
+  succeed and is halved on 429 / 5xx responses
+- retries with full-jitter exponential backoff, bounded by a deadline
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics import Counter, Gauge, REGISTRY
+
+logger = logging.getLogger("invoice.scheduler")
+
+OUTBOUND_CALLS = REGISTRY.register(Counter(
+    "invoice_outbound_calls_total", "Outbound provider calls by outcome", ["provider", "outcome"]
+))
+OUTBOUND_RETRIES = REGISTRY.register(Counter(
+    "invoice_outbound_retries_total", "Retried outbound calls by reason", ["provider", "reason"]
+))
+OUTBOUND_COALESCED = REGISTRY.register(Counter(
+    "invoice_outbound_coalesced_total", "Calls served by an identical in-flight request", ["provider"]
+))
+OUTBOUND_LIMIT = REGISTRY.register(Gauge(
+    "invoice_outbound_concurrency_limit", "Current adaptive concurrency limit", ["provider"]
+))
+OUTBOUND_IN_FLIGHT = REGISTRY.register(Gauge(
+    "invoice_outbound_in_flight", "Outbound calls currently running", ["provider"]
+))
+
+RATE_LIMITED = "rate_limited"
+SERVER_ERROR = "server_error"
+FATAL = "fatal"
+
+_RATE_LIMIT_TEXT = re.compile(r"\b429\b|resource[_ ]exhausted|rate.?limit|quota|too many requests", re.I)
+_SERVER_ERROR_TEXT = re.compile(r"\b50[0234]\b|unavailable|overloaded|deadline exceeded|timed? ?out", re.I)
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "status", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def classify(exc: BaseException) -> str:
+    """RATE_LIMITED, SERVER_ERROR (both retried) or FATAL for a provider exception."""
+    # Providers wrap the HTTP error (langextract: InferenceRuntimeError.original)
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        status = _status_code(exc)
+        if status == 429:
+            return RATE_LIMITED
+        if status is not None and 500 <= status < 600:
+            return SERVER_ERROR
+        if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+            return SERVER_ERROR
+        message = str(exc)
+        if _RATE_LIMIT_TEXT.search(message):
+            return RATE_LIMITED
+        if _SERVER_ERROR_TEXT.search(message):
+            return SERVER_ERROR
+        exc = getattr(exc, "original", None) or exc.__cause__
+    return FATAL
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+        exc = getattr(exc, "original", None) or exc.__cause__
+    return None
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst`. rate <= 0 disables it."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit with additive increase / multiplicative decrease:
+    +1 per `limit` successes, halved on throttling or server errors (at most
+    once per `cooldown` seconds, so a burst of 429s from one window counts once).
+    """
+
+    def __init__(self, name: str, initial: int, minimum: int = 1, maximum: int = 64, cooldown: float = 1.0):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.cooldown = cooldown
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._changed = asyncio.Condition()
+        OUTBOUND_LIMIT.set(self.limit, provider=name)
+
+    async def __aenter__(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        OUTBOUND_IN_FLIGHT.inc(provider=self.name)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        OUTBOUND_IN_FLIGHT.dec(provider=self.name)
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    async def on_success(self) -> None:
+        async with self._changed:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            OUTBOUND_LIMIT.set(self.limit, provider=self.name)
+            self._changed.notify_all()
+
+    async def on_throttle(self) -> None:
+        async with self._changed:
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self._last_decrease = now
+                self.limit = max(self.minimum, self.limit / 2)
+                OUTBOUND_LIMIT.set(self.limit, provider=self.name)
+                logger.info("%s throttled, concurrency limit now %.1f", self.name, self.limit)
+
+
+class Provider:
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: float,
+        max_concurrency: int,
+        initial_concurrency: Optional[int] = None,
+        max_attempts: int = 5,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        deadline: float = 120.0,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AdaptiveLimiter(name, initial_concurrency or max(1, max_concurrency // 2), maximum=max_concurrency)
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.in_flight: Dict[Any, "_Shared"] = {}
+
+    def scale(self, share: float) -> None:
+        """
+        Keep only `share` of the rate, burst and concurrency, for one of several
+        processes calling the provider with the same API key.
+        """
+        self.bucket.rate *= share
+        self.bucket.burst = self.bucket._tokens = max(1.0, self.bucket.burst * share)
+        limiter = self.limiter
+        limiter.maximum = max(limiter.minimum, int(limiter.maximum * share))
+        limiter.limit = max(float(limiter.minimum), min(limiter.limit * share, limiter.maximum))
+        OUTBOUND_LIMIT.set(limiter.limit, provider=self.name)
+
+
+class _Shared:
+    """
+    One upstream call awaited by every coalesced request. Waiters can be
+    cancelled (timeouts, client disconnects) without affecting the others;
+    when the last one gives up the call itself is cancelled.
+    """
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.waiters = 0
+
+    async def join(self) -> Any:
+        self.waiters += 1
+        try:
+            return await asyncio.shield(self.future)
+        except asyncio.CancelledError:
+            if self.waiters == 1 and not self.future.done():
+                self.future.cancel()
+            raise
+        finally:
+            self.waiters -= 1
+
+
+class OutboundScheduler:
+    def __init__(self):
+        self.providers: Dict[str, Provider] = {}
+
+    def add_provider(self, provider: Provider) -> Provider:
+        self.providers[provider.name] = provider
+        return provider
+
+    async def call(
+        self,
+        provider_name: str,
+        fn: Callable[[], Awaitable[Any]],
+        key: Any = None,
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """
+        Run `fn()` (a coroutine factory, called once per attempt) under the
+        provider's limits. Requests with the same non-None `key` that overlap
+        in time share a single execution. Raises the last error when the call
+        is not retryable, attempts run out or the deadline would be missed.
+        """
+        provider = self.providers[provider_name]
+        if key is None:
+            return await self._call(provider, fn, deadline)
+
+        shared = provider.in_flight.get(key)
+        if shared is not None and not shared.future.done():
+            OUTBOUND_COALESCED.inc(provider=provider.name)
+            return await shared.join()
+
+        shared = _Shared(asyncio.ensure_future(self._call(provider, fn, deadline)))
+        provider.in_flight[key] = shared
+        shared.future.add_done_callback(
+            lambda _: provider.in_flight.pop(key, None) if provider.in_flight.get(key) is shared else None
+        )
+        return await shared.join()
+
+    async def call_in_executor(
+        self,
+        provider_name: str,
+        executor: Executor,
+        fn: Callable[[], Any],
+        key: Any = None,
+        deadline: Optional[float] = None,
+    ) -> Any:
+        """
+        `call` for a blocking `fn()`, run on `executor`. A thread can't be
+        stopped: a cancelled (or timed out) caller returns at once, but the
+        attempt keeps its concurrency slot until the thread has finished, so
+        the provider never sees more requests than the limit allows.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def attempt():
+            future = loop.run_in_executor(executor, fn)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                while not future.done():
+                    try:
+                        await asyncio.wait([future])
+                    except asyncio.CancelledError:
+                        pass
+                raise
+
+        # Always shared, so cancelling the caller never waits for the thread
+        return await self.call(provider_name, attempt, key=object() if key is None else key, deadline=deadline)
+
+    async def _call(self, provider: Provider, fn, deadline: Optional[float]) -> Any:
+        give_up_at = time.monotonic() + (deadline if deadline is not None else provider.deadline)
+        attempt = 0
+        while True:
+            attempt += 1
+            await provider.bucket.acquire()
+            try:
+                async with provider.limiter:
+                    result = await fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                kind = classify(e)
+                if kind in (RATE_LIMITED, SERVER_ERROR):
+                    await provider.limiter.on_throttle()
+                if kind == FATAL or attempt >= provider.max_attempts:
+                    OUTBOUND_CALLS.inc(provider=provider.name, outcome="error" if kind == FATAL else "exhausted")
+                    raise
+                # Full jitter; an explicit Retry-After from the provider wins
+                backoff = _retry_after(e) or random.uniform(
+                    0, min(provider.max_backoff, provider.base_backoff * 2 ** (attempt - 1))
+                )
+                if time.monotonic() + backoff > give_up_at:
+                    OUTBOUND_CALLS.inc(provider=provider.name, outcome="deadline")
+                    raise
+                OUTBOUND_RETRIES.inc(provider=provider.name, reason=kind)
+                logger.info("%s call failed (%s), retry %d in %.2fs: %s", provider.name, kind, attempt, backoff, e)
+                await asyncio.sleep(backoff)
+                continue
+            await provider.limiter.on_success()
+            OUTBOUND_CALLS.inc(provider=provider.name, outcome="ok")
+            return result
+
+
+def _env_provider(name: str, prefix: str, rate: float, burst: float, concurrency: int) -> Provider:
+    return Provider(
+        name,
+        rate=float(os.getenv(f"{prefix}_RPS", rate)),
+        burst=float(os.getenv(f"{prefix}_BURST", burst)),
+        max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", concurrency)),
+        max_attempts=int(os.getenv(f"{prefix}_MAX_ATTEMPTS", 5)),
+        deadline=float(os.getenv(f"{prefix}_DEADLINE_SECONDS", 120)),
+    )
+
+
+def api_share(job_queue: str) -> float:
+    """
+    Share of each provider's quota for the API processes together
+    (PROVIDER_SHARE). With JOB_QUEUE=sqlite the worker.py processes call the
+    same providers with the same API keys and split the rest, so it defaults
+    to half; otherwise the API processes are the only callers.
+    """
+    share = float(os.getenv("PROVIDER_SHARE", 0.5 if job_queue == "sqlite" else 1))
+    if not 0 < share <= 1:
+        raise ValueError(f"PROVIDER_SHARE must be in (0, 1], got {share}")
+    return share
+
+
+scheduler = OutboundScheduler()
+scheduler.add_provider(_env_provider("llamaparse", "LLAMAPARSE", rate=2, burst=5, concurrency=8))
+scheduler.add_provider(_env_provider("gemini", "GEMINI", rate=5, burst=10, concurrency=16))
@@ -0,0 +1,149 @@
+# scoring.py
+"""
+Scoring an extraction result: the mandatory-field structure, the line-item
+validations and the summary line, as the API, bulk mode and rescore.py
+store them.
+
+SCORE_VERSION fingerprints every rule that goes into a score (the mandatory
+fields, their aliases and sections, the validation columns and tolerance).
+Each stored row records the version it was scored with, so after a rule
+change rescore.py only has to revisit the rows scored under another one.
+"""
+import hashlib
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+from invoice_runner import mandatory_fields
+from invoice_schema import ALIAS_INDEX, FIELD_NAMES, FIELD_SECTIONS, select_fields
+from utils.invoice_utils import NUMERIC_COLUMNS, TOLERANCE_CENTS, TOTAL_COLUMNS, to_structured, validate_invoices
+
+logger = logging.getLogger("invoice.score")
+
+# Bump when the matching or validation code changes in a way the tables
+# below don't show
+SCORE_RULES_REVISION = 2
+
+SCORE_VERSION = hashlib.sha256(repr((
+    SCORE_RULES_REVISION,
+    list(mandatory_fields),
+    sorted(FIELD_NAMES.items()),
+    sorted(FIELD_SECTIONS.items()),
+    sorted(ALIAS_INDEX.items()),
+    sorted(NUMERIC_COLUMNS.items()),
+    TOTAL_COLUMNS,
+    TOLERANCE_CENTS,
+)).encode("utf-8")).hexdigest()[:12]
+
+
+def create_mandatory_fields_structure_simple(extractions):
+    """
+    Match extractions to mandatory_fields from invoice_runner.py through the
+    alias index in invoice_schema, so variants of a field name ("Supplier's
+    TIN", "Quantitiy") count; a field extracted more than once keeps its best
+    value.
+    """
+    # Debug logging is off by default (LOG_LEVEL=DEBUG turns it on)
+    debug = logger.isEnabledFor(logging.DEBUG)
+    if debug:
+        logger.debug("Processing %d extractions", len(extractions) if extractions else 0)
+
+    # Collect extracted field names (extraction_class values)
+    extracted_field_names = set()
+
+    if extractions:
+        for extraction in extractions:
+            if hasattr(extraction, 'extraction_class') and hasattr(extraction, 'extraction_text'):
+                class_name = extraction.extraction_class
+                text_value = extraction.extraction_text
+                if class_name and text_value:
+                    extracted_field_names.add(class_name)
+                    if debug:
+                        logger.debug("  Extracted: '%s' = '%s'", class_name, text_value)
+    matched = select_fields(extractions)
+
+    if debug:
+        logger.debug("Total unique extracted fields: %d", len(extracted_field_names))
+        logger.debug("Extracted field names: %s", list(extracted_field_names))
+        logger.debug("Mandatory fields count: %d", len(mandatory_fields))
+
+    # Create simple structure with all mandatory fields
+    structured_data = {
+        "mandatory_fields": {},
+        "summary": {}
+    }
+
+    # Check each mandatory field against the matched extractions
+    fields_present = 0
+    matched_fields = []
+
+    for mandatory_field in mandatory_fields:
+        extraction = matched.get(mandatory_field)
+        is_present = extraction is not None
+        if is_present:
+            fields_present += 1
+            matched_fields.append(mandatory_field)
+            if debug:
+                logger.debug("  MATCH: '%s' found as '%s'", mandatory_field, extraction.extraction_class)
+
+        structured_data["mandatory_fields"][mandatory_field] = {
+            "required": True,
+            "present": is_present,
+            "value": extraction.extraction_text if is_present else None,
+            "extracted_as": extraction.extraction_class if is_present else None,
+            # Which stage found it: "rules" (fast path), "structured_data" (LlamaParse) or "llm"
+            "source": (getattr(extraction, "attributes", None) or {}).get("source") if is_present else None,
+        }
+
+    if debug:
+        logger.debug("Fields present: %d", fields_present)
+        logger.debug("Matched fields: %s", matched_fields)
+
+    # Add summary statistics
+    total_fields = len(mandatory_fields)
+    fields_missing = total_fields - fields_present
+    completion_percentage = round((fields_present / total_fields) * 100, 2)
+
+    structured_data["summary"] = {
+        "total_mandatory_fields": total_fields,
+        "fields_present": fields_present,
+        "fields_missing": fields_missing,
+        "completion_percentage": completion_percentage,
+        "total_extracted_fields": len(extracted_field_names)  # Add this for frontend
+    }
+
+    if debug:
+        logger.debug(
+            "Summary - Present: %d, Missing: %d, Percentage: %s%%",
+            fields_present, fields_missing, completion_percentage,
+        )
+
+    return structured_data
+
+
+def summary_line(structured_data: Dict[str, Any]) -> str:
+    stats = structured_data["summary"]
+    return (
+        f"Found {stats['fields_present']}/{stats['total_mandatory_fields']} "
+        f"mandatory fields ({stats['completion_percentage']}%)"
+    )
+
+
+def score_many(extraction_lists: Sequence[Any]) -> List[Tuple[Dict[str, Any], str]]:
+    """
+    (structured_data, summary) for each list of extractions. structured_data
+    is create_mandatory_fields_structure_simple's plus a "validation" entry
+    (validate_invoice on the to_structured view); all invoices are validated
+    in one batch.
+    """
+    structures = [create_mandatory_fields_structure_simple(extractions) for extractions in extraction_lists]
+    validations = validate_invoices([to_structured(extractions) for extractions in extraction_lists])
+    scored = []
+    for structured_data, validation in zip(structures, validations):
+        structured_data["validation"] = validation
+        scored.append((structured_data, summary_line(structured_data)))
+    return scored
+
+
+def score(extractions) -> Tuple[Dict[str, Any], str]:
+    """score_many for a single extraction list."""
+    return score_many([extractions])[0]
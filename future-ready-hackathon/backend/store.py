@@ -0,0 +1,456 @@
+# store.py
+"""
+SQLite store for upload results.
+
+One row per processed file in `invoices`, with the fields people search by
+pulled out into indexed columns (supplier / buyer TIN, e-Invoice Code,
+invoice date, completion) next to the full mandatory-field structure. The
+bulky raw artifacts (parsed document, extraction result) live zlib-compressed
+in `artifacts` and expire after `artifact_ttl_seconds` (checked on insert at
+most every `expire_interval_seconds`); the invoice rows stay.
+
+Duplicates are flagged at insert time: a file whose content hash, or whose
+supplier TIN + e-Invoice Code, matches an earlier row gets `duplicate_of`
+pointing at it.
+
+Each row records the `score_version` (scoring.SCORE_VERSION) its structure
+was computed with; `stale` / `update_scores` let rescore.py recompute the
+rows scored under older rules from their artifacts.
+"""
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import fastjson
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id              INTEGER PRIMARY KEY,
+    filename        TEXT NOT NULL UNIQUE,
+    content_hash    TEXT,
+    created_at      REAL NOT NULL,
+    supplier_tin    TEXT,
+    buyer_tin       TEXT,
+    invoice_code    TEXT,
+    invoice_date    TEXT,
+    completion      REAL,
+    fields_present  INTEGER,
+    summary         TEXT,
+    structured_data TEXT,
+    duplicate_of    INTEGER REFERENCES invoices(id),
+    duplicate_reason TEXT,
+    score_version   TEXT
+);
+CREATE INDEX IF NOT EXISTS invoices_supplier_tin ON invoices(supplier_tin);
+CREATE INDEX IF NOT EXISTS invoices_buyer_tin ON invoices(buyer_tin);
+CREATE INDEX IF NOT EXISTS invoices_invoice_code ON invoices(invoice_code, supplier_tin);
+CREATE INDEX IF NOT EXISTS invoices_invoice_date ON invoices(invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_completion ON invoices(completion);
+CREATE INDEX IF NOT EXISTS invoices_content_hash ON invoices(content_hash);
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    invoice_id  INTEGER NOT NULL REFERENCES invoices(id) ON DELETE CASCADE,
+    kind        TEXT NOT NULL,
+    created_at  REAL NOT NULL,
+    data        BLOB NOT NULL,
+    PRIMARY KEY (invoice_id, kind)
+);
+CREATE INDEX IF NOT EXISTS artifacts_created_at ON artifacts(created_at);
+"""
+
+# Columns returned by list queries (structured_data only on single lookups)
+LIST_COLUMNS = (
+    "id", "filename", "content_hash", "created_at", "supplier_tin", "buyer_tin", "invoice_code",
+    "invoice_date", "completion", "fields_present", "summary", "duplicate_of", "duplicate_reason",
+)
+
+# Mandatory field -> indexed column
+INDEXED_FIELDS = {
+    "Supplier TIN": "supplier_tin",
+    "Buyer TIN": "buyer_tin",
+    "E-Invoice Code": "invoice_code",
+    "Invoice Date and Time": "invoice_date",
+}
+
+# Columns added after the first release: name -> declaration
+_ADDED_COLUMNS = {"score_version": "TEXT"}
+
+# What rescore.py overwrites on a re-scored row
+_SCORE_COLUMNS = (
+    "supplier_tin", "buyer_tin", "invoice_code", "invoice_date", "completion", "fields_present",
+    "summary", "structured_data",
+)
+
+_DATE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+    "%d/%m/%Y %H:%M:%S", "%d/%m/%Y %H:%M", "%d/%m/%Y", "%d-%m-%Y",
+)
+_TZ_SUFFIX = re.compile(r"(?:Z|[+-]\d{2}:?\d{2})$")
+
+
+def normalize_date(value: Optional[str]) -> Optional[str]:
+    """ISO "YYYY-MM-DD HH:MM:SS" for the usual invoice date formats, else the stripped input."""
+    if not value:
+        return None
+    text = _TZ_SUFFIX.sub("", value.strip()).strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+    return value.strip()
+
+
+def _normalize_id(value: Optional[str]) -> Optional[str]:
+    """TINs and invoice codes compare without spaces and case"""
+    return re.sub(r"\s+", "", value).upper() if value else None
+
+
+def load_artifact(data: bytes) -> Any:
+    """Decode an `artifacts.data` blob."""
+    return fastjson.loads(zlib.decompress(data))
+
+
+def _score_columns(structured_data: Dict[str, Any], summary: Optional[str]) -> Dict[str, Any]:
+    """The _SCORE_COLUMNS values of a mandatory-field structure."""
+    fields = structured_data.get("mandatory_fields", {})
+    values = {column: (fields.get(field) or {}).get("value") for field, column in INDEXED_FIELDS.items()}
+    stats = structured_data.get("summary", {})
+    return {
+        "supplier_tin": _normalize_id(values["supplier_tin"]),
+        "buyer_tin": _normalize_id(values["buyer_tin"]),
+        "invoice_code": _normalize_id(values["invoice_code"]),
+        "invoice_date": normalize_date(values["invoice_date"]),
+        "completion": stats.get("completion_percentage"),
+        "fields_present": stats.get("fields_present"),
+        "summary": summary,
+        "structured_data": fastjson.dumps(structured_data).decode("utf-8"),
+    }
+
+
+def _find_duplicate(conn: sqlite3.Connection, filename: str, content_hash: Optional[str], columns: Dict[str, Any]):
+    """(row, reason) of the earliest other file this one duplicates, or (None, None)."""
+    if content_hash:
+        duplicate = conn.execute(
+            "SELECT id, filename FROM invoices WHERE content_hash = ? AND filename != ? ORDER BY id LIMIT 1",
+            (content_hash, filename),
+        ).fetchone()
+        if duplicate is not None:
+            return duplicate, "same file"
+    if columns["invoice_code"] and columns["supplier_tin"]:
+        duplicate = conn.execute(
+            "SELECT id, filename FROM invoices WHERE invoice_code = ? AND supplier_tin = ?"
+            " AND filename != ? ORDER BY id LIMIT 1",
+            (columns["invoice_code"], columns["supplier_tin"], filename),
+        ).fetchone()
+        if duplicate is not None:
+            return duplicate, "same supplier TIN and e-Invoice Code"
+    return None, None
+
+
+class ResultsStore:
+    def __init__(
+        self,
+        path: Path,
+        artifact_ttl_seconds: float = 30 * 24 * 3600,
+        expire_interval_seconds: float = 3600,
+    ):
+        self.path = Path(path)
+        self.artifact_ttl_seconds = artifact_ttl_seconds
+        self.expire_interval_seconds = expire_interval_seconds
+        self._last_expiry = 0.0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per thread (asyncio.to_thread runs on a pool)
+        self._local = threading.local()
+        # Inserts check for duplicates first; serialize them within the process
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        # 2 = INCREMENTAL. A file created without it is converted once, by a full VACUUM
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        conn.executescript(SCHEMA)
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(invoices)")}
+        for column, declaration in _ADDED_COLUMNS.items():
+            if column not in existing:
+                conn.execute(f"ALTER TABLE invoices ADD COLUMN {column} {declaration}")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            # Lets expiry hand pages back cheaply. Only takes effect on a new
+            # database, before anything (WAL mode included) has written to it
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    # ---- writes ----
+
+    def save(
+        self,
+        filename: str,
+        content_hash: Optional[str],
+        structured_data: Dict[str, Any],
+        summary: Optional[str] = None,
+        artifacts: Optional[Dict[str, Any]] = None,
+        score_version: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Insert (or replace) the result for `filename`. `artifacts` maps a kind
+        ("parsed", "result") to a JSON-serializable value stored compressed.
+        Returns {"id", "duplicate_of": {"id", "filename", "reason"} or None}.
+        """
+        columns = _score_columns(structured_data, summary)
+        now = time.time()
+
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                duplicate, reason = _find_duplicate(conn, filename, content_hash, columns)
+                row_id = conn.execute(
+                    """
+                    INSERT INTO invoices (
+                        filename, content_hash, created_at, supplier_tin, buyer_tin, invoice_code,
+                        invoice_date, completion, fields_present, summary, structured_data,
+                        duplicate_of, duplicate_reason, score_version
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(filename) DO UPDATE SET
+                        content_hash = excluded.content_hash, created_at = excluded.created_at,
+                        supplier_tin = excluded.supplier_tin, buyer_tin = excluded.buyer_tin,
+                        invoice_code = excluded.invoice_code, invoice_date = excluded.invoice_date,
+                        completion = excluded.completion, fields_present = excluded.fields_present,
+                        summary = excluded.summary, structured_data = excluded.structured_data,
+                        duplicate_of = excluded.duplicate_of, duplicate_reason = excluded.duplicate_reason,
+                        score_version = excluded.score_version
+                    RETURNING id
+                    """,
+                    (
+                        filename, content_hash, now, columns["supplier_tin"], columns["buyer_tin"],
+                        columns["invoice_code"], columns["invoice_date"], columns["completion"],
+                        columns["fields_present"], summary, columns["structured_data"],
+                        duplicate["id"] if duplicate else None, reason, score_version,
+                    ),
+                ).fetchone()[0]
+                for kind, value in (artifacts or {}).items():
+                    if value is None:
+                        continue
+                    conn.execute(
+                        "INSERT OR REPLACE INTO artifacts (invoice_id, kind, created_at, data) VALUES (?, ?, ?, ?)",
+                        (row_id, kind, now, zlib.compress(fastjson.dumps(value), 6)),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        if now - self._last_expiry >= self.expire_interval_seconds:
+            self.expire_artifacts()
+
+        return {
+            "id": row_id,
+            "duplicate_of": (
+                {"id": duplicate["id"], "filename": duplicate["filename"], "reason": reason}
+                if duplicate else None
+            ),
+        }
+
+    def update_scores(self, updates: List[Tuple[int, Optional[Dict[str, Any]], Optional[str]]], score_version: str) -> int:
+        """
+        Write re-scored rows: `updates` holds (id, structured_data, summary),
+        with structured_data None for rows whose score didn't change (only
+        their score_version moves on). Indexed columns and the duplicate flag
+        follow the new structure. Returns the number of rows rewritten.
+        """
+        conn = self._conn()
+        rewritten = 0
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for row_id, structured_data, summary in updates:
+                    if structured_data is None:
+                        conn.execute("UPDATE invoices SET score_version = ? WHERE id = ?", (score_version, row_id))
+                        continue
+                    row = conn.execute("SELECT filename, content_hash FROM invoices WHERE id = ?", (row_id,)).fetchone()
+                    if row is None:
+                        continue
+                    columns = _score_columns(structured_data, summary)
+                    duplicate, reason = _find_duplicate(conn, row["filename"], row["content_hash"], columns)
+                    conn.execute(
+                        f"UPDATE invoices SET {', '.join(f'{c} = ?' for c in _SCORE_COLUMNS)},"
+                        " duplicate_of = ?, duplicate_reason = ?, score_version = ? WHERE id = ?",
+                        (
+                            *(columns[c] for c in _SCORE_COLUMNS),
+                            duplicate["id"] if duplicate else None, reason, score_version, row_id,
+                        ),
+                    )
+                    rewritten += 1
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return rewritten
+
+    def expire_artifacts(self, older_than: Optional[float] = None) -> int:
+        """Drop raw artifacts past the TTL and give the space back. Returns rows removed."""
+        self._last_expiry = time.time()
+        ttl = self.artifact_ttl_seconds if older_than is None else older_than
+        if ttl <= 0:
+            return 0
+        conn = self._conn()
+        with self._write_lock:
+            removed = conn.execute("DELETE FROM artifacts WHERE created_at < ?", (time.time() - ttl,)).rowcount
+            if removed:
+                # Frees one page per step, and execute() (or fetchall() on it,
+                # the pragma returns no rows) only takes one: run it to the end
+                conn.executescript("PRAGMA incremental_vacuum")
+        return removed
+
+    # ---- reads ----
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM invoices WHERE filename = ?", (filename,)).fetchone()
+        if row is None:
+            return None
+        item = dict(row)
+        item["structured_data"] = fastjson.loads(item["structured_data"]) if item["structured_data"] else None
+        return item
+
+    def get_artifact(self, filename: str, kind: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT a.data FROM artifacts a JOIN invoices i ON i.id = a.invoice_id WHERE i.filename = ? AND a.kind = ?",
+            (filename, kind),
+        ).fetchone()
+        return load_artifact(row[0]) if row else None
+
+    def stale(self, score_version: Optional[str], after: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        The next `limit` rows after id `after` not scored with `score_version`
+        (every row when it is None), in id order, as {"id", "filename",
+        "structured_data", "summary", "result", "parsed"}. The artifacts are
+        left compressed (load_artifact) and "parsed" is only fetched for rows
+        without a "result"; both are None once expired.
+        """
+        sql = """
+            SELECT i.id, i.filename, i.structured_data, i.summary,
+                   r.data AS result, CASE WHEN r.data IS NULL THEN p.data END AS parsed
+            FROM invoices i
+            LEFT JOIN artifacts r ON r.invoice_id = i.id AND r.kind = 'result'
+            LEFT JOIN artifacts p ON p.invoice_id = i.id AND p.kind = 'parsed'
+            WHERE i.id > ?"""
+        params: List[Any] = [after]
+        if score_version is not None:
+            sql += " AND i.score_version IS NOT ?"
+            params.append(score_version)
+        sql += " ORDER BY i.id LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._conn().execute(sql, params).fetchall()]
+
+    def count_stale(self, score_version: Optional[str]) -> int:
+        if score_version is None:
+            return self._conn().execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM invoices WHERE score_version IS NOT ?", (score_version,)
+        ).fetchone()[0]
+
+    def query(
+        self,
+        supplier_tin: Optional[str] = None,
+        buyer_tin: Optional[str] = None,
+        invoice_code: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        min_completion: Optional[float] = None,
+        max_completion: Optional[float] = None,
+        duplicates_only: bool = False,
+        limit: int = 50,
+        cursor: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Newest first, keyset-paginated: pass the returned `next_cursor` back
+        as `cursor` for the next page.
+        """
+        where: List[str] = []
+        params: List[Any] = []
+        for column, value in (
+            ("supplier_tin", _normalize_id(supplier_tin)),
+            ("buyer_tin", _normalize_id(buyer_tin)),
+            ("invoice_code", _normalize_id(invoice_code)),
+        ):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if date_from:
+            where.append("invoice_date >= ?")
+            params.append(normalize_date(date_from))
+        if date_to:
+            end = normalize_date(date_to)
+            if len(date_to.strip()) <= 10:
+                # A bare date means up to the end of that day
+                end = end[:10] + " 23:59:59"
+            where.append("invoice_date <= ?")
+            params.append(end)
+        if min_completion is not None:
+            where.append("completion >= ?")
+            params.append(min_completion)
+        if max_completion is not None:
+            where.append("completion <= ?")
+            params.append(max_completion)
+        if duplicates_only:
+            where.append("duplicate_of IS NOT NULL")
+        if cursor is not None:
+            where.append("id < ?")
+            params.append(cursor)
+
+        sql = f"SELECT {', '.join(LIST_COLUMNS)} FROM invoices"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = [dict(r) for r in self._conn().execute(sql, params).fetchall()]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {"items": rows, "next_cursor": rows[-1]["id"] if has_more else None}
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        invoices, duplicates = conn.execute(
+            "SELECT COUNT(*), COUNT(duplicate_of) FROM invoices"
+        ).fetchone()
+        artifacts, artifact_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM artifacts").fetchone()
+        return {
+            "invoices": invoices,
+            "duplicates": duplicates,
+            "artifacts": artifacts,
+            "artifact_bytes": artifact_bytes,
+            "db_bytes": self.path.stat().st_size if self.path.exists() else 0,
+        }
+
+    # ---- async wrappers (sqlite3 blocks) ----
+
+    async def asave(self, *args, **kwargs) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.save, *args, **kwargs)
+
+    async def aget(self, filename: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, filename)
+
+    async def aget_artifact(self, filename: str, kind: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get_artifact, filename, kind)
+
+    async def aquery(self, **filters) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.query, **filters)
+
+    async def aexpire_artifacts(self) -> int:
+        return await asyncio.to_thread(self.expire_artifacts)
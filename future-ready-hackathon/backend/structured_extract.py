@@ -0,0 +1,188 @@
+# structured_extract.py
+"""
+Mandatory-field extractions from LlamaParse's structured output.
+
+With extract_structured_data=True every parsed page may come back with a
+JSON object of whatever the parser recognised on it ({"supplier": {"tin":
+...}, "line_items": [{"quantity": ...}], "invoice_date": ...}); parse.py
+keeps those under parsed["structured_data"]. structured_extract() walks them
+and resolves each key path through the alias index in invoice_schema, so
+fields it covers don't have to be asked from the LLM. Values are aligned to
+the document text where they occur in it; each extraction records where it
+came from in its attributes ({"source": "structured_data", "path":
+"supplier.tin"}).
+"""
+import json
+import re
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from invoice_schema import FIELD_SECTIONS, canonical_name, resolve_field
+
+if TYPE_CHECKING:  # imported lazily, it is slow to import
+    import langextract as lx
+
+_CAMEL = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+# Key words naming the party a nested object belongs to, beyond the ones
+# canonical_name already folds (seller, customer)
+_PARTIES = {
+    "supplier": "supplier", "vendor": "supplier", "merchant": "supplier", "issuer": "supplier",
+    "buyer": "buyer", "purchaser": "buyer", "recipient": "buyer", "client": "buyer", "bill to": "buyer",
+    "billed to": "buyer",
+}
+_EMPTY = {"", "-", "--", "na", "n/a", "nil", "none", "null", "not applicable"}
+# Path segment standing for the (first) row of a list of objects
+_ROW = "[0]"
+# Per-line fields, taken only from a row or under a key with one of these
+# words ("line_items", "products"): a vendor's "description" or a page's
+# "quantity" of something else is not a line item's. The totals can be
+# anywhere.
+_ITEM_FIELDS = {
+    field for field, section in FIELD_SECTIONS.items()
+    if section == "items" and not (field == "Subtotal" or field.startswith("Total"))
+}
+_ITEM_WORDS = {"item", "items", "line", "lines", "product", "products", "service", "services", "goods"}
+
+
+def _segment(key: str) -> str:
+    """"supplierTIN" / "supplier_tin" / "Supplier TIN" -> "supplier tin", parties folded."""
+    name = canonical_name(_CAMEL.sub(" ", str(key)))
+    return _PARTIES.get(name, name)
+
+
+def _scalar(value: Any) -> Optional[str]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        value = value.strip()
+        return value if value.lower() not in _EMPTY else None
+    return None
+
+
+def _leaves(value: Any, path: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], str]]:
+    """
+    (key path, text) of every scalar; only the first row of a list of
+    objects (line items), under a _ROW segment.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from _leaves(item, path + (str(key),))
+    elif isinstance(value, list):
+        rows = [item for item in value if isinstance(item, dict)]
+        if rows:
+            yield from _leaves(rows[0], path + (_ROW,))
+        else:
+            texts = [text for text in map(_scalar, value) if text]
+            if texts:
+                yield path, "; ".join(texts)
+    else:
+        text = _scalar(value)
+        if text and path:
+            yield path, text
+
+
+def resolve_path(path: Sequence[str]) -> Optional[str]:
+    """
+    The mandatory field a key path names: the longest suffix the alias index
+    knows ("invoice.supplier.tin" -> "supplier tin"), also with "number"
+    added ("supplier.phone" -> "supplier contact number"). A shorter suffix
+    isn't taken when a dropped key names the other party
+    ("buyer.business_activity" is not the supplier's business activity).
+    Line item fields need a row or an items-like key on the path
+    ("line_items[0].description", "item_description"; not
+    "vendor.description").
+    """
+    segments = [_segment(key) for key in path if key != _ROW]
+    for start in range(len(segments)):
+        name = " ".join(segments[start:])
+        field = resolve_field(name) or resolve_field(f"{name} number")
+        if field is None:
+            continue
+        dropped = set(segments[:start]) & {"supplier", "buyer"}
+        section = FIELD_SECTIONS.get(field)
+        if section in ("supplier", "buyer") and dropped - {section}:
+            return None
+        if field in _ITEM_FIELDS and _ROW not in path and not _ITEM_WORDS.intersection(
+            word for segment in segments for word in segment.split()
+        ):
+            return None
+        return field
+    return None
+
+
+def _pages(structured_data: Any) -> List[Any]:
+    """parsed["structured_data"] as a list of objects (pages may hold JSON strings)."""
+    pages = structured_data if isinstance(structured_data, list) else [structured_data]
+    objects = []
+    for page in pages:
+        if isinstance(page, str):
+            try:
+                page = json.loads(page)
+            except ValueError:
+                continue
+        if isinstance(page, (dict, list)):
+            objects.append(page)
+    return objects
+
+
+def _dotted(path: Sequence[str]) -> str:
+    """("line_items", _ROW, "quantity") -> "line_items[0].quantity"."""
+    return ".".join(path).replace("." + _ROW, _ROW)
+
+
+def _align(text: str, value: str):
+    """
+    (start, end, exact) of `value` in `text` as a whole token ("289.0" is
+    not in "289.00"); not exact when only found with other whitespace or
+    case. None if absent.
+    """
+    words = value.split()
+    if not words:
+        return None
+    for pattern, flags, exact in (
+        (re.escape(value), 0, True),
+        (r"\s+".join(map(re.escape, words)), re.IGNORECASE, False),
+    ):
+        m = re.search(rf"(?<![\w.,]){pattern}(?![\w]|[.,]\d)", text, flags)
+        if m:
+            return m.start(), m.end(), exact
+    return None
+
+
+def structured_extract(
+    structured_data: Any, text: str = "", skip: Iterable[str] = ()
+) -> List["lx.data.Extraction"]:
+    """
+    One Extraction per mandatory field found in `structured_data` (first
+    page / first key wins), leaving out the fields in `skip`. Values found
+    in `text` get its char interval; the rest stay unaligned.
+    """
+    pages = _pages(structured_data)
+    if not pages:
+        return []
+
+    import langextract as lx
+
+    found = set(skip)
+    extractions = []
+    for page in pages:
+        for path, value in _leaves(page):
+            field = resolve_path(path)
+            if field is None or field in found:
+                continue
+            found.add(field)
+            span = _align(text, value) if text else None
+            extractions.append(lx.data.Extraction(
+                field,
+                value,
+                char_interval=lx.data.CharInterval(start_pos=span[0], end_pos=span[1]) if span else None,
+                alignment_status=(
+                    (lx.data.AlignmentStatus.MATCH_EXACT if span[2] else lx.data.AlignmentStatus.MATCH_FUZZY)
+                    if span else None
+                ),
+                extraction_index=len(extractions) + 1,
+                attributes={"source": "structured_data", "path": _dotted(path)},
+            ))
+    return extractions
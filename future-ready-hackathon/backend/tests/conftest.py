@@ -0,0 +1,11 @@
+# tests/conftest.py
+"""
+The backend is a flat set of modules run from its own directory; make them
+importable however pytest is started.
+"""
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+if str(BACKEND) not in sys.path:
+    sys.path.insert(0, str(BACKEND))
@@ -0,0 +1,11 @@
+# tests/test_cache.py
+from cache import ResultCache
+
+
+def test_overwriting_an_entry_keeps_the_disk_size_exact(tmp_path):
+    cache = ResultCache(tmp_path)
+    cache.set("parsed", "a" * 64, {"text": "first"})
+    for i in range(20):
+        cache.set("parsed", "a" * 64, {"text": f"version {i}"})
+    cache.set("parsed", "b" * 64, {"text": "other"})
+    assert cache._disk_bytes == cache._scan_disk_bytes()
@@ -0,0 +1,36 @@
+# tests/test_compact.py
+from compact import COMPACT_ITEM_ROWS, compact
+
+from benchmarks.synthetic import paginate
+
+HEADER = "| No | Description | Quantity | Unit Price | Total |\n|---|---|---|---|---|"
+
+
+def item_rows(n, first=1):
+    return "\n".join(f"| {i} | Widget {i} | 1 | 10.00 | 10.00 |" for i in range(first, first + n))
+
+
+def test_same_width_table_after_the_items_is_kept():
+    text = "\n".join([
+        "Invoice No: INV-001",
+        HEADER,
+        item_rows(COMPACT_ITEM_ROWS + 2),
+        "",
+        "| Subtotal | | | | 50.00 |",
+        "| Tax | | | | 3.00 |",
+        "| Total Payable | | | | 53.00 |",
+    ])
+    compacted = compact(text).text
+    assert f"Widget {COMPACT_ITEM_ROWS + 1}" not in compacted
+    assert "| Subtotal | | | | 50.00 |" in compacted
+    assert "| Total Payable | | | | 53.00 |" in compacted
+
+
+def test_item_rows_continued_on_the_next_page_are_trimmed():
+    body = "\n".join(["Invoice No: INV-002", HEADER, item_rows(20), "", "Total Payable: 200.00"])
+    text = paginate(body, lines_per_page=12, header="Hibiscus Trading Sdn Bhd | Invoice INV-002")
+    compacted = compact(text).text
+    assert "Widget 1 " in compacted
+    # Rows after the page break, without a header, still count as items
+    assert "Widget 15" not in compacted
+    assert "Total Payable: 200.00" in compacted
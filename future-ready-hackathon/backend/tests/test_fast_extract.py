@@ -0,0 +1,51 @@
+# tests/test_fast_extract.py
+import pytest
+
+from fast_extract import pre_extract
+
+
+def fields(text):
+    return {x.extraction_class: x.extraction_text for x in pre_extract(text)}
+
+
+@pytest.mark.parametrize("text, value", [
+    ("Total Payable Amount: 1500.00", "1500.00"),
+    ("Total Payable Amount: 1,500.00", "1,500.00"),
+    ("Total Payable Amount: RM 1,234,567.89", "RM 1,234,567.89"),
+    ("Total Payable Amount: 150", "150"),
+    ("Total Payable Amount: 1234567", "1234567"),
+])
+def test_amounts_are_taken_whole(text, value):
+    assert fields(text)["Total Payable Amount"] == value
+
+
+@pytest.mark.parametrize("text", [
+    "Total Payable Amount: 1500.005",
+    "Total Payable Amount: 1,50",
+    "Total Payable Amount: 12.345",
+])
+def test_amounts_are_not_cut_short(text):
+    # A partial number is a wrong value, not a miss: leave it to the LLM
+    assert "Total Payable Amount" not in fields(text)
+
+
+@pytest.mark.parametrize("text, field", [
+    ("Buyer Address: NA", "Buyer Address"),
+    ("Buyer Address: N/A", "Buyer Address"),
+    ("Supplier Address: Nil", "Supplier Address"),
+    ("Business Activity: n/a", "Supplier business activity description"),
+])
+def test_placeholder_free_text_is_left_to_the_llm(text, field):
+    assert field not in fields(text)
+
+
+def test_placeholder_is_skipped_for_a_later_real_value():
+    text = "Buyer Address: NA\nBuyer Address: 12 Jalan Ampang, 50450 Kuala Lumpur"
+    assert fields(text)["Buyer Address"] == "12 Jalan Ampang, 50450 Kuala Lumpur"
+
+
+def test_extraction_is_aligned_to_the_text():
+    text = "Invoice\nSubtotal: 2500.00\n"
+    (x,) = [x for x in pre_extract(text) if x.extraction_class == "Subtotal"]
+    assert text[x.char_interval.start_pos:x.char_interval.end_pos] == "2500.00"
+    assert x.attributes["source"] == "rules"
@@ -0,0 +1,55 @@
+# tests/test_invoice_runner.py
+import asyncio
+
+import langextract as lx
+
+import invoice_runner
+from invoice_runner import ExtractionBatcher
+from metrics import EXTRACT_BATCH_DOCS
+
+
+def test_batcher_shares_calls_across_field_sets(monkeypatch):
+    calls = []
+
+    def fake_batch(texts, fields=None, **kwargs):
+        calls.append((sorted(texts.values()), fields))
+        return {
+            doc_id: lx.data.AnnotatedDocument(
+                text=text,
+                extractions=[lx.data.Extraction(f, text) for f in fields] + [lx.data.Extraction("Notes", text)],
+            )
+            for doc_id, text in texts.items()
+        }
+
+    monkeypatch.setattr(invoice_runner, "run_ie_batch", fake_batch)
+    before = EXTRACT_BATCH_DOCS.snapshot().get((), {"count": 0, "sum": 0})
+
+    async def run():
+        batcher = ExtractionBatcher(max_batch=8, max_wait=0.05)
+        return await asyncio.gather(
+            batcher.extract("a", fields=["Buyer TIN"]),
+            batcher.extract("b", fields=["Supplier TIN", "Invoice Date and Time"]),
+            batcher.extract("c", fields=["Supplier TIN"]),
+        )
+
+    a, b, c = asyncio.run(run())
+    # One call, asking for everything any of them needs
+    assert calls == [(["a", "b", "c"], ["Supplier TIN", "Invoice Date and Time", "Buyer TIN"])]
+    # ... and each gets its own fields back (plus non-mandatory extras)
+    assert [x.extraction_class for x in a.extractions] == ["Buyer TIN", "Notes"]
+    assert [x.extraction_class for x in b.extractions] == ["Supplier TIN", "Invoice Date and Time", "Notes"]
+    assert [x.extraction_class for x in c.extractions] == ["Supplier TIN", "Notes"]
+    assert {x.extraction_text for x in b.extractions} == {"b"}
+
+    after = EXTRACT_BATCH_DOCS.snapshot()[()]
+    assert (after["count"] - before["count"], after["sum"] - before["sum"]) == (1, 3)
+
+
+def test_batcher_keeps_documents_the_batch_left_out(monkeypatch):
+    monkeypatch.setattr(invoice_runner, "run_ie_batch", lambda texts, fields=None, **kwargs: {})
+
+    async def run():
+        batcher = ExtractionBatcher(max_batch=2, max_wait=1)
+        return await asyncio.gather(batcher.extract("a", fields=["Buyer TIN"]), batcher.extract("b"))
+
+    assert asyncio.run(run()) == [None, None]
@@ -0,0 +1,30 @@
+# tests/test_invoice_schema.py
+import pytest
+
+from invoice_schema import resolve_field
+
+from benchmarks.synthetic import _LABELS
+
+# A bare "Address" is left unresolved: it would claim every unqualified
+# address (delivery, bank) for the supplier
+SYNTHETIC_LABELS = [
+    (label, field) for field, labels in _LABELS.items() for label in labels if label != "Address"
+]
+
+# Label spellings fast_extract's rules accept
+FAST_PATH_LABELS = [
+    ("MSIC", "Supplier MSIC code"),
+    ("Supplier MSIC", "Supplier MSIC code"),
+    ("Supplier Tel.", "Supplier Contact Number"),
+    ("Supplier Tel", "Supplier Contact Number"),
+    ("Supplier Phone", "Supplier Contact Number"),
+    ("Buyer Tel.", "Buyer Contact Number"),
+    ("Buyer Phone No.", "Buyer Contact Number"),
+    ("Supplier TIN No.", "Supplier TIN"),
+    ("e-Invoice Date & Time", "Invoice Date and Time"),
+]
+
+
+@pytest.mark.parametrize("label, field", SYNTHETIC_LABELS + FAST_PATH_LABELS)
+def test_labels_the_repo_emits_resolve(label, field):
+    assert resolve_field(label) == field
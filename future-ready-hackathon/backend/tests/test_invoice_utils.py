@@ -0,0 +1,63 @@
+# tests/test_invoice_utils.py
+import random
+
+import pytest
+
+from utils.invoice_utils import MONEY_SCALE, QUANTITY_SCALE, RATE_SCALE, UNIT_PRICE_SCALE, parse_column, parse_number
+
+MIXED = [
+    "RM 1,500.00", "1,50", "12,5", "1,234,567.89", "-1,000", "1234,567", "1.234,567", ",500", "1,000,00",
+    "MYR 3,000", "RM", "RM RM 5", "12RM", "5 RM", "(1,000.00)", "RM nan", "nan", "-nan", "N/A", "", None,
+    "12.5", "0.005", ".5", "5.", "+5", "2 pcs", "10%", "%10", "5 %", "Exempt", "1e5", " 7 ", 5, 1.5,
+    "99999999999999999999999",
+]
+
+
+SCALES = pytest.mark.parametrize("scale, kind", [
+    (MONEY_SCALE, "money"), (UNIT_PRICE_SCALE, "money"), (QUANTITY_SCALE, "quantity"), (RATE_SCALE, "rate"),
+])
+
+
+def expected(values, scale, kind):
+    # parse_column reports what doesn't fit int64 as invalid
+    return [(0, 2) if abs(v) >= 2 ** 63 else (v, s) for v, s in (parse_number(x, scale, kind) for x in values)]
+
+
+def random_cell(rng):
+    """A cell built from the pieces real (and broken) amounts are made of."""
+    if rng.random() < 0.05:
+        return rng.choice([None, rng.randint(-10 ** 6, 10 ** 6), rng.uniform(-1e6, 1e6)])
+    digits = str(rng.randint(0, 10 ** rng.randint(1, 22)))
+    if rng.random() < 0.5:
+        # Thousands separators, sometimes misplaced
+        groups = rng.choice([3, 3, 3, 2, 4])
+        head = len(digits) % groups or groups
+        digits = ",".join([digits[:head]] + [digits[i:i + groups] for i in range(head, len(digits), groups)])
+    if rng.random() < 0.6:
+        digits += "." + "".join(rng.choice("0123456789") for _ in range(rng.randint(0, 6)))
+    prefix = rng.choice(["", "", "RM", "RM ", "MYR ", "rm ", "$", "-", "+", "(", "RM -", " ", "x"])
+    suffix = rng.choice(["", "", "", "%", " %", " pcs", " RM", ")", "x", " ", ","])
+    return prefix + digits + suffix
+
+
+@SCALES
+def test_parse_column_matches_parse_number_on_random_cells(scale, kind):
+    # parse_number is the reference parser; parse_column's bulk path must never differ from it
+    rng = random.Random(scale)
+    column = [random_cell(rng) for _ in range(20000)]
+    values, status = parse_column(column, scale, kind)
+    assert list(zip(values.tolist(), status.tolist())) == expected(column, scale, kind)
+
+
+@SCALES
+def test_parse_column_matches_parse_number(scale, kind):
+
+    values, status = parse_column(MIXED, scale, kind)
+    assert list(zip(values.tolist(), status.tolist())) == expected(MIXED, scale, kind)
+
+    # A single odd cell must not change the others
+    rng = random.Random(0)
+    clean = [f"RM {rng.randint(0, 10 ** 6):,}.{rng.randint(0, 99):02d}" for _ in range(200)]
+    for column in (clean, clean + ["1,50"], clean + [""] * 3, ["12.5%", "8%", ""]):
+        values, status = parse_column(column, scale, kind)
+        assert list(zip(values.tolist(), status.tolist())) == expected(column, scale, kind)
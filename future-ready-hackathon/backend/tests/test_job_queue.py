@@ -0,0 +1,51 @@
+# tests/test_job_queue.py
+import asyncio
+
+import pytest
+
+from job_queue import JobExpired, JobQueue, SharedJobs
+
+
+def test_stream_stops_when_the_job_is_pruned(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db")
+    shared = SharedJobs(queue, poll_seconds=0.01)
+
+    async def run():
+        job = await shared.asubmit([{"n": 0}, {"n": 1}])
+        (item_id, _, index, _), = queue.claim("worker", limit=1)
+        queue.complete("worker", item_id, {"n": index})
+        received = []
+
+        async def read():
+            async for event in job.stream():
+                received.append(event)
+                # Pruned while the second item is still outstanding
+                queue._write(lambda conn: conn.execute("DELETE FROM jobs WHERE id = ?", (job.id,)))
+
+        with pytest.raises(JobExpired):
+            await asyncio.wait_for(read(), 5)
+        return received
+
+    assert asyncio.run(run()) == [{"index": 0, "result": {"n": 0}}]
+
+
+def test_item_completed_between_polls_is_streamed(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db")
+    shared = SharedJobs(queue, poll_seconds=0.01)
+    events = queue.events
+
+    def events_then_complete(job_id, after=0):
+        found = events(job_id, after)
+        # A worker finishes an item after the (empty) events read, before completed()
+        for item_id, _, index, _ in queue.claim("worker", limit=1):
+            queue.complete("worker", item_id, {"n": index})
+        return found
+
+    async def run():
+        job = await shared.asubmit([{"n": 0}, {"n": 1}])
+        queue.events = events_then_complete
+        return [event async for event in job.stream()]
+
+    received = asyncio.run(asyncio.wait_for(run(), 5))
+    assert sorted(event["index"] for event in received) == [0, 1]
+
@@ -0,0 +1,26 @@
+# tests/test_page_extract.py
+import asyncio
+
+import langextract as lx
+
+from page_extract import extract_pages
+
+PAGES = [
+    "Supplier TIN: C21638015020 issued to the buyer named on the following page of this invoice",
+    "Buyer TIN: EI00000000010 for the goods and services listed in the table of line items below",
+]
+
+
+def test_pages_the_batch_returned_nothing_for_count_as_empty():
+    async def extract(text, fields=None):
+        if not text.startswith("Buyer"):
+            # ExtractionBatcher resolves documents its batch left out to None
+            return None
+        start = text.index("EI")
+        return lx.data.AnnotatedDocument(text=text, extractions=[lx.data.Extraction(
+            "Buyer TIN", "EI00000000010", char_interval=lx.data.CharInterval(start, start + 13),
+        )])
+
+    result, report = asyncio.run(extract_pages(PAGES, ["Supplier TIN", "Buyer TIN"], extract))
+    assert [(x.extraction_class, x.extraction_text) for x in result.extractions] == [("Buyer TIN", "EI00000000010")]
+    assert report["pages_extracted"] == 2
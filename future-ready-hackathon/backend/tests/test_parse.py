@@ -0,0 +1,88 @@
+# tests/test_parse.py
+"""Local text-layer parsing and the fallback to LlamaParse (stubbed)."""
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import parse
+from benchmarks.stubs import LatencyModel, StubParser
+from benchmarks.synthetic import make_invoice, make_pdf
+
+
+@pytest.fixture
+def stub_parser(monkeypatch):
+    parser = StubParser(LatencyModel(median=0), known_pages={})
+    monkeypatch.setattr(parse, "parser", parser)
+    monkeypatch.setattr(parse, "LOCAL_PARSE_ENABLED", True)
+    # Local parses on a thread: no worker processes in the test run
+    monkeypatch.setattr(parse, "_local_pool", ThreadPoolExecutor(max_workers=1))
+    yield parser
+    parse.shutdown()
+
+
+def write_pdf(tmp_path, data: bytes, name="invoice.pdf") -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def invoice_text(seed=0) -> str:
+    return make_invoice(seed, line_items=5)[0]
+
+
+def parse_file(path):
+    return asyncio.run(parse.aparse_file(path))
+
+
+def test_born_digital_pdf_is_read_locally(tmp_path, stub_parser):
+    text = invoice_text()
+    parsed = parse_file(write_pdf(tmp_path, make_pdf(text)))
+    assert parsed["parser"] == "local"
+    assert stub_parser.calls == 0
+    assert "Supplier TIN" in parsed["text"]
+    assert len(parsed["markdown_pages"]) == 1
+
+
+def test_scanned_pdf_falls_back(tmp_path, stub_parser):
+    # No text operators at all, as with a page that is only an image
+    data = make_pdf("")
+    stub_parser.known_pages[hashlib.sha256(data).hexdigest()] = ["OCR text"]
+    path = write_pdf(tmp_path, data)
+    parsed = parse_file(path)
+    assert parsed["parser"] == "llamaparse"
+    assert parsed["local_fallback_reason"] == "no text layer"
+    assert parsed["markdown_pages"] == ["OCR text"]
+    assert stub_parser.calls == 1
+
+
+def test_mostly_empty_pages_fall_back(tmp_path, stub_parser):
+    # One page of text followed by four empty ones (scanned pages appended)
+    text = "\n".join(invoice_text().splitlines()[:60]) + "\n" * 240
+    parsed = parse_file(write_pdf(tmp_path, make_pdf(text, lines_per_page=60)))
+    assert parsed["parser"] == "llamaparse"
+    assert parsed["local_fallback_reason"] == "pages without text"
+
+
+def test_unreadable_pdf_falls_back(tmp_path, stub_parser):
+    parsed = parse_file(write_pdf(tmp_path, b"%PDF-1.4\nnot really a pdf"))
+    assert parsed["parser"] == "llamaparse"
+    assert parsed["local_fallback_reason"].startswith("local parse failed")
+
+
+def test_local_parsing_disabled(tmp_path, stub_parser, monkeypatch):
+    monkeypatch.setattr(parse, "LOCAL_PARSE_ENABLED", False)
+    parsed = parse_file(write_pdf(tmp_path, make_pdf(invoice_text())))
+    assert parsed["parser"] == "llamaparse"
+    assert parsed["local_fallback_reason"] == "local parsing disabled"
+
+
+@pytest.mark.parametrize("text, problem", [
+    ("", "no text layer"),
+    ("(cid:12)(cid:7) " * 40 + "Invoice " * 30, "unmapped glyphs"),
+    ("... --- ||| " * 40 + "Invoice 1", "low alphanumeric ratio"),
+    ("Supplier TIN C1234567890 " * 20, None),
+])
+def test_text_layer_problem(text, problem):
+    assert parse.text_layer_problem({"text": text, "markdown_pages": [text]}) == problem
@@ -0,0 +1,121 @@
+# tests/test_payload.py
+import asyncio
+import gzip
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from payload import CompressionMiddleware
+
+zstandard = pytest.importorskip("zstandard")
+
+BODY = "invoice line\n" * 1000
+
+
+def get_raw(path, encoding):
+    """Status, headers and the body as sent, before the client decodes it."""
+    with make_client().stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return response.status_code, response.headers, b"".join(response.iter_raw())
+
+
+def make_client():
+    async def big(request):
+        return PlainTextResponse(BODY)
+
+    async def small(request):
+        return PlainTextResponse("ok")
+
+    async def streamed(request):
+        async def chunks():
+            for _ in range(10):
+                yield "invoice line\n" * 100
+
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app = Starlette(routes=[Route("/big", big), Route("/small", small), Route("/streamed", streamed)])
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app)
+
+
+def decode_zstd(raw: bytes) -> str:
+    return zstandard.ZstdDecompressor().decompressobj().decompress(raw).decode()
+
+
+def test_zstd_when_accepted():
+    status, headers, raw = get_raw("/big", "zstd")
+    assert status == 200
+    assert headers["content-encoding"] == "zstd"
+    assert "Accept-Encoding" in headers["vary"]
+    assert int(headers["content-length"]) == len(raw)
+    assert decode_zstd(raw) == BODY
+
+
+def test_zstd_streamed_response():
+    _, headers, raw = get_raw("/streamed", "zstd")
+    assert headers["content-encoding"] == "zstd"
+    assert decode_zstd(raw) == BODY
+
+
+def test_small_responses_are_left_alone():
+    _, headers, raw = get_raw("/small", "zstd")
+    assert "content-encoding" not in headers
+    assert raw == b"ok"
+
+
+def test_gzip_otherwise():
+    _, headers, raw = get_raw("/big", "gzip")
+    assert headers["content-encoding"] == "gzip"
+    assert gzip.decompress(raw).decode() == BODY
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+def test_streamed_ndjson_is_flushed_per_chunk(encoding):
+    decoder = (
+        zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip"
+        else zstandard.ZstdDecompressor().decompressobj()
+    )
+
+    async def run():
+        job_done = asyncio.Event()
+        received = []
+
+        async def events():
+            yield b'{"index": 0}\n'
+            # The rest of the job only finishes once the client has the first event
+            await job_done.wait()
+            yield b'{"done": true}\n'
+
+        async def stream(request):
+            return StreamingResponse(events(), media_type="application/x-ndjson")
+
+        app = CompressionMiddleware(Starlette(routes=[Route("/stream", stream)]))
+        scope = {
+            "type": "http", "method": "GET", "path": "/stream", "raw_path": b"/stream", "query_string": b"",
+            "root_path": "", "scheme": "http", "http_version": "1.1", "server": ("test", 80), "client": None,
+            "headers": [(b"accept-encoding", encoding.encode())],
+        }
+        disconnected = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body":
+                received.append(decoder.decompress(message.get("body", b"")))
+                if b"".join(received).startswith(b'{"index": 0}\n'):
+                    job_done.set()
+
+        await asyncio.wait_for(app(scope, receive, send), 2)
+        return b"".join(received)
+
+    assert asyncio.run(run()) == b'{"index": 0}\n{"done": true}\n'
@@ -0,0 +1,22 @@
+# tests/test_rescore.py
+import json
+import zlib
+from pathlib import Path
+
+import fastjson
+from rescore import rescore_rows
+
+FIXTURE = Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "llamaparse" / "nested_camel.json"
+
+
+def test_parsed_only_rows_use_structured_data_like_an_upload():
+    fixture = json.loads(FIXTURE.read_text(encoding="utf-8"))
+    parsed = {"markdown_pages": fixture["markdown_pages"], "structured_data": fixture["structured_data"]}
+    row = {
+        "id": 1, "result": None, "parsed": zlib.compress(fastjson.dumps(parsed)),
+        "structured_data": None, "summary": None,
+    }
+    (row_id, outcome, structured_data, _), = rescore_rows([row])
+    assert (row_id, outcome) == (1, "changed")
+    fields = structured_data["mandatory_fields"]
+    assert all(fields[field]["present"] for field in fixture["expected"])
@@ -0,0 +1,159 @@
+# tests/test_scheduler.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+from langextract.core import base_model, types
+
+from benchmarks.fake_upstream import FakeUpstream
+from benchmarks.stubs import StubUpstreamError
+from scheduled_model import ScheduledModel
+from scheduler import OutboundScheduler, Provider, api_share, scheduler
+
+
+def fake_provider(concurrency, max_attempts=10):
+    return Provider(
+        "fake", rate=0, burst=1, max_concurrency=concurrency, initial_concurrency=concurrency,
+        max_attempts=max_attempts, base_backoff=0.01, max_backoff=0.05, deadline=30,
+    )
+
+
+class UpstreamModel(base_model.BaseLanguageModel):
+    """Answers each prompt with a request to a FakeUpstream."""
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url
+
+    def infer(self, batch_prompts, **kwargs):
+        for prompt in batch_prompts:
+            httpx.post(f"{self.base_url}/v1/work", json={"prompt": prompt}).raise_for_status()
+            yield [types.ScoredOutput(score=1.0, output=prompt)]
+
+
+def test_retries_throttled_calls_and_backs_off():
+    async def run():
+        outbound = OutboundScheduler()
+        provider = outbound.add_provider(fake_provider(concurrency=8))
+        server = FakeUpstream(rps=100, concurrency=2, latency=0.05)
+        async with server.running() as base_url, httpx.AsyncClient(base_url=base_url) as client:
+
+            async def post():
+                response = await client.post("/v1/work")
+                response.raise_for_status()
+                return response.json()
+
+            results = await asyncio.gather(*(outbound.call("fake", post) for _ in range(12)))
+        return provider, server, results
+
+    provider, server, results = asyncio.run(run())
+    assert results == [{"ok": True}] * 12
+    assert server.accepted == 12
+    assert server.throttled > 0
+    # Halved (at most once per cooldown) from 8
+    assert provider.limiter.limit < 8
+
+
+def test_retries_server_errors_but_not_fatal_ones():
+    attempts = []
+
+    async def flaky(status, failures):
+        attempts.append(status)
+        if len(attempts) <= failures:
+            raise StubUpstreamError(status)
+        return "ok"
+
+    async def run(status, failures):
+        outbound = OutboundScheduler()
+        outbound.add_provider(fake_provider(concurrency=2, max_attempts=3))
+        return await outbound.call("fake", lambda: flaky(status, failures))
+
+    assert asyncio.run(run(503, 2)) == "ok"
+    assert attempts == [503] * 3
+
+    attempts.clear()
+    with pytest.raises(StubUpstreamError):
+        asyncio.run(run(503, 3))
+    assert len(attempts) == 3
+
+    attempts.clear()
+    with pytest.raises(StubUpstreamError):
+        asyncio.run(run(400, 1))
+    assert attempts == [400]
+
+
+def test_server_errors_back_off():
+    async def run():
+        outbound = OutboundScheduler()
+        provider = outbound.add_provider(fake_provider(concurrency=8))
+        failures = iter([503, 503])
+
+        async def unavailable():
+            status = next(failures, None)
+            if status:
+                raise StubUpstreamError(status)
+            return "ok"
+
+        return provider, await outbound.call("fake", unavailable)
+
+    provider, result = asyncio.run(run())
+    assert result == "ok"
+    # Halved once (both 503s fall in one cooldown), then +1/limit for the success
+    assert provider.limiter.limit < 5
+
+
+def test_scheduled_model_limits_and_retries_each_request(monkeypatch):
+    async def run():
+        # Allows more at once than the upstream, until the first 429s halve it
+        monkeypatch.setitem(scheduler.providers, "fake", fake_provider(concurrency=4))
+        server = FakeUpstream(rps=100, concurrency=2, latency=0.05)
+        with ThreadPoolExecutor(4) as executor:
+            async with server.running() as base_url:
+                model = ScheduledModel(
+                    lambda: UpstreamModel(base_url), asyncio.get_running_loop(), executor, provider="fake"
+                )
+                prompts = [f"chunk {i}" for i in range(10)]
+                outputs = await asyncio.to_thread(lambda: list(model.infer(prompts)))
+        return server, prompts, outputs
+
+    server, prompts, outputs = asyncio.run(run())
+    assert [output[0].output for output in outputs] == prompts
+    # Only the throttled requests were sent again, not the whole batch
+    assert server.accepted == len(prompts)
+    assert server.throttled > 0
+
+
+def test_cancelled_call_keeps_its_slot_until_the_thread_is_done():
+    async def run():
+        outbound = OutboundScheduler()
+        provider = outbound.add_provider(fake_provider(concurrency=1))
+        with ThreadPoolExecutor(1) as executor:
+            started = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(outbound.call_in_executor("fake", executor, lambda: time.sleep(0.3)), 0.05)
+            timed_out = time.monotonic() - started
+            held = provider.limiter.in_flight
+            await asyncio.sleep(0.4)
+            return timed_out, held, provider.limiter.in_flight
+
+    timed_out, held, released = asyncio.run(run())
+    assert timed_out < 0.2
+    assert (held, released) == (1, 0)
+
+
+def test_api_and_queue_workers_split_one_provider_budget(monkeypatch):
+    monkeypatch.delenv("PROVIDER_SHARE", raising=False)
+    assert api_share("memory") == 1
+    assert api_share("sqlite") == 0.5
+    monkeypatch.setenv("PROVIDER_SHARE", "0.25")
+    api, worker = fake_provider(concurrency=16), fake_provider(concurrency=16)
+    # 2 API processes and 3 queue workers, as main.lifespan and worker.serve scale them
+    api.scale(api_share("sqlite") / 2)
+    worker.scale((1 - api_share("sqlite")) / 3)
+    assert 2 * api.limiter.maximum + 3 * worker.limiter.maximum <= 16
+    monkeypatch.setenv("PROVIDER_SHARE", "0")
+    with pytest.raises(ValueError):
+        api_share("sqlite")
+
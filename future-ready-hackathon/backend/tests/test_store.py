@@ -0,0 +1,31 @@
+# tests/test_store.py
+import os
+import sqlite3
+import time
+
+from store import ResultsStore
+
+
+def pragma(store, name):
+    return store._conn().execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def test_expiry_gives_the_space_back(tmp_path):
+    store = ResultsStore(tmp_path / "results.db")
+    assert pragma(store, "auto_vacuum") == 2
+    for i in range(40):
+        store.save(f"invoice-{i}.pdf", f"{i:064x}", {}, artifacts={"parsed": {"text": os.urandom(16384).hex()}})
+    before = pragma(store, "page_count")
+    time.sleep(0.01)
+    assert store.expire_artifacts(older_than=0.001) == 40
+    assert pragma(store, "freelist_count") == 0
+    assert pragma(store, "page_count") < before / 4
+
+
+def test_existing_database_is_converted_to_incremental_vacuum(tmp_path):
+    path = tmp_path / "results.db"
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE legacy (x)")
+    conn.close()
+    assert pragma(ResultsStore(path), "auto_vacuum") == 2
@@ -0,0 +1,65 @@
+# tests/test_structured_extract.py
+import json
+from pathlib import Path
+
+import pytest
+
+from page_extract import join_pages
+from structured_extract import resolve_path, structured_extract
+
+FIXTURES = sorted((Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "llamaparse").glob("*.json"))
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=lambda path: path.stem)
+def test_fixture_maps_to_its_expected_fields(path):
+    fixture = json.loads(path.read_text(encoding="utf-8"))
+    text, _ = join_pages(fixture["markdown_pages"])
+    extractions = structured_extract(fixture["structured_data"], text)
+    assert {x.extraction_class: x.extraction_text for x in extractions} == fixture["expected"]
+
+
+def test_line_item_path_names_the_row():
+    data = {"line_items": [{"quantity": 40, "description": "A4 paper"}, {"quantity": 2, "description": "Toner"}]}
+    by_field = {x.extraction_class: x for x in structured_extract(data)}
+    assert by_field["Quantity"].extraction_text == "40"
+    assert by_field["Quantity"].attributes == {"source": "structured_data", "path": "line_items[0].quantity"}
+    assert by_field["Description of Product or Service"].extraction_text == "A4 paper"
+
+
+@pytest.mark.parametrize("path, field", [
+    (("lineItems", "[0]", "description"), "Description of Product or Service"),
+    (("items", "description"), "Description of Product or Service"),
+    (("item_description",), "Description of Product or Service"),
+    (("products", "[0]", "taxType"), "Tax Type"),
+    (("totals", "totalPayable"), "Total Payable Amount"),
+    (("subtotal",), "Subtotal"),
+    (("supplier", "business_activity_description"), "Supplier business activity description"),
+])
+def test_resolves(path, field):
+    assert resolve_path(path) == field
+
+
+@pytest.mark.parametrize("path", [
+    ("description",),
+    ("vendor", "description"),
+    ("invoice", "tax", "type"),
+    ("quantity",),
+    ("buyer", "business_activity"),
+])
+def test_does_not_resolve(path):
+    assert resolve_path(path) is None
+
+
+def test_generic_keys_outside_the_items_stay_unmapped():
+    data = {
+        "vendor": {"tin": "C20931844020", "description": "Wholesale of stationery"},
+        "type": "01",
+        "quantity": 3,
+        "items": [{"description": "A4 paper 80gsm", "quantity": 40}],
+    }
+    by_field = {x.extraction_class: x.extraction_text for x in structured_extract(data)}
+    assert by_field == {
+        "Supplier TIN": "C20931844020",
+        "Description of Product or Service": "A4 paper 80gsm",
+        "Quantity": "40",
+    }
@@ -1,17 +1,43 @@
 # utils/invoice_utils.py
 
-from invoice_schema import ITEM_COLUMNS
+import logging
+import os
+import re
+import time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+
+import numpy as np
+
+from invoice_schema import FIELD_SECTIONS, ITEM_COLUMNS, OFFICIAL_NAMES, extraction_score, resolve_field
+
+logger = logging.getLogger("invoice.validate")
+
 
 def to_structured(extractions):
     """
     Convert raw Extraction objects into a tidy dict grouped by
     supplier, buyer, invoice, and items.
+
+    Field names and item columns are resolved through the alias index in
+    invoice_schema and keyed by their official names (unknown field names are
+    kept as they are). Plain per-field extractions, as the API produces them,
+    are placed by their field's section; item-level ones among them are
+    single values and go under "invoice".
     """
     out = {"supplier": {}, "buyer": {}, "invoice": {}, "items": []}
+    scores = {}
 
     def norm_quotes(s):
         return s.replace("’", "'") if isinstance(s, str) else s
 
+    def keep(sec, name, field, x, text):
+        # prefer the better aligned, then the longer text if duplicate
+        score = extraction_score(x, field)
+        if score > scores.get((sec, name), (-1,)):
+            scores[(sec, name)] = score
+            out[sec][name] = text
+
     for x in (extractions or []):
         cls = getattr(x, "extraction_class", None)
         attrs = getattr(x, "attributes", None) or {}
@@ -20,36 +46,368 @@ def to_structured(extractions):
         if cls == "field":
             sec = attrs.get("section")
             name = norm_quotes(attrs.get("field_name"))
-            if sec in out and name and text:
-                # prefer longer text if duplicate
-                cur = out[sec].get(name, "")
-                out[sec][name] = text if len(text) > len(cur) else cur
+            field = resolve_field(name)
+            if sec in out and sec != "items" and name and text:
+                keep(sec, OFFICIAL_NAMES[field] if field else name, field, x, text)
 
         elif cls == "line_item" and attrs.get("section") == "items":
-            cols = {k: v for k, v in (attrs.get("columns") or {}).items()
-                    if k in ITEM_COLUMNS and v}
+            cols = {}
+            for k, v in (attrs.get("columns") or {}).items():
+                field = resolve_field(k)
+                if field and FIELD_SECTIONS[field] == "items" and v:
+                    cols[OFFICIAL_NAMES[field]] = v
             if cols:
                 out["items"].append(cols)
 
+        else:
+            field = resolve_field(cls)
+            if field and text:
+                sec = FIELD_SECTIONS[field]
+                keep("invoice" if sec == "items" else sec, OFFICIAL_NAMES[field], field, x, text)
+
     return out
 
 
-def validate_invoice(structured: dict) -> dict:
+# --- Line-item arithmetic -------------------------------------------------
+#
+# Every numeric item column is parsed once into an exact fixed-point int64
+# column (amounts in cents, quantities in thousandths, unit prices in 1/10000,
+# tax rates in hundredths of a percent) and all checks run as array
+# operations over the item table of every invoice at once.
+
+QUANTITY = "Quantity"
+UNIT_PRICE = "Unit Price"
+SUBTOTAL = "Subtotal"
+TAX_RATE = "Tax Rate [Mandatory, where applicable]"
+EXEMPT_AMOUNT = "Amount Exempted from Tax [Mandatory if tax exemption is applicable]"
+TOTAL_EXCLUDING_TAX = "Total Excluding Tax"
+TOTAL_INCLUDING_TAX = "Total Including Tax"
+TOTAL_PAYABLE = "Total Payable Amount"
+
+MONEY_SCALE = 100
+QUANTITY_SCALE = 1000
+UNIT_PRICE_SCALE = 10000
+RATE_SCALE = 100
+
+# column -> (scale, kind); "money" only accepts amounts, "quantity" allows a
+# trailing unit ("2 pcs"), "rate" skips anything that isn't a number or a
+# percentage ("Exempt", "RM 10.00 per night")
+NUMERIC_COLUMNS = {
+    QUANTITY: (QUANTITY_SCALE, "quantity"),
+    UNIT_PRICE: (UNIT_PRICE_SCALE, "money"),
+    SUBTOTAL: (MONEY_SCALE, "money"),
+    TAX_RATE: (RATE_SCALE, "rate"),
+    EXEMPT_AMOUNT: (MONEY_SCALE, "money"),
+    TOTAL_EXCLUDING_TAX: (MONEY_SCALE, "money"),
+    TOTAL_INCLUDING_TAX: (MONEY_SCALE, "money"),
+    TOTAL_PAYABLE: (MONEY_SCALE, "money"),
+}
+assert set(NUMERIC_COLUMNS) <= set(ITEM_COLUMNS)
+
+# Invoice-level totals that must equal the sum over the line items
+TOTAL_COLUMNS = (SUBTOTAL, TOTAL_EXCLUDING_TAX, TOTAL_INCLUDING_TAX, TOTAL_PAYABLE)
+
+# Rounding slack per line item, in cents (invoice totals allow it per item)
+TOLERANCE_CENTS = int(os.getenv("VALIDATION_TOLERANCE_CENTS", 1))
+
+# Products are compared in int64; rows whose operands could overflow it are
+# reported as out of range instead of being checked
+_INT64_SAFE = float(2 ** 62)
+_INT64_MAX = 2 ** 63 - 1
+
+_MISSING = 0
+_OK = 1
+_INVALID = 2
+
+_EMPTY = {"", "-", "--", "na", "n/a", "nan", "nil", "none", "not applicable"}
+_NUMBER = re.compile(
+    r"""^\(?\s*(?:RM|MYR|USD|SGD|EUR|\$)?\s*(?P<sign>[-+])?\s*(?:RM|MYR|USD|SGD|EUR|\$)?\s*
+        (?P<num>\d{1,3}(?:,\d{3})+(?:\.\d*)?|\d+(?:\.\d*)?|\.\d+)\s*
+        (?P<suffix>%|[A-Za-z][A-Za-z ./]{0,15})?\s*(?P<close>\))?$""",
+    re.IGNORECASE | re.VERBOSE,
+)
+_CURRENCY_SUFFIX = {"rm", "myr", "usd", "sgd", "eur"}
+# Integers below this are exact in float64, with room for the multiplication error
+_FLOAT_EXACT = float(2 ** 51)
+
+
+@lru_cache(maxsize=65536)
+def parse_number(text, scale: int, kind: str = "money"):
+    """
+    "RM 3,000.00" -> (300000, _OK) at scale 100. Returns (value, status) with
+    status _MISSING for empty / "N/A" cells and _INVALID for text that
+    doesn't parse; the value is rounded half-up to the scale.
+    """
+    if text is None:
+        return 0, _MISSING
+    if isinstance(text, (int, float)):
+        text = str(text)
+    stripped = text.strip()
+    if stripped.lower() in _EMPTY:
+        return 0, _MISSING
+    if kind == "rate" and any(c.isalpha() for c in stripped):
+        # A tax rate that isn't a percentage ("Exempt", "RM 10.00 per night") is not an error
+        return 0, _MISSING
+    match = _NUMBER.match(stripped)
+    if match is None:
+        return 0, _INVALID
+    suffix = (match.group("suffix") or "").strip().lower()
+    if suffix and not (
+        suffix in _CURRENCY_SUFFIX
+        or (kind == "rate" and suffix == "%")
+        or (kind == "quantity" and suffix != "%")
+    ):
+        return 0, _INVALID
+    try:
+        value = Decimal(match.group("num").replace(",", ""))
+    except InvalidOperation:
+        return 0, _INVALID
+    if match.group("sign") == "-" or (match.group("close") and stripped.startswith("(")):
+        value = -value
+    return int((value * scale).to_integral_value(ROUND_HALF_UP)), _OK
+
+
+@lru_cache(maxsize=None)
+def _bulk_cell(scale: int, kind: str):
+    """
+    The cells parse_column converts in one numpy call: a non-negative number,
+    with or without thousands separators, with at most as many decimals as
+    `scale` has zeros; "RM" / "MYR" before it for money, "%" after it for
+    rates. Group 1 is the number. Times `scale` such a number is an integer,
+    which float64 gets exactly while it stays below _FLOAT_EXACT. Every other
+    cell (empty, signs, parentheses, units, extra decimals, non-ASCII digits,
+    junk) is left to parse_number.
+    """
+    places = len(str(scale)) - 1
+    fraction = rf"(?:\.\d{{1,{places}}})?" if places else ""
+    prefix = r"(?:(?:RM|MYR)\s*)?" if kind == "money" else ""
+    suffix = r"(?:\s*%)?" if kind == "rate" else ""
+    return re.compile(rf"\s*{prefix}((?:\d{{1,3}}(?:,\d{{3}})+|\d+){fraction}){suffix}\s*", re.ASCII)
+
+
+def parse_column(values, scale: int, kind: str = "money"):
+    """
+    Parse a column of cells into (int64 values, int8 status) arrays, with
+    the same result per cell as parse_number. Cells of the _bulk_cell shape
+    are converted together; the others (and values too big for the bulk
+    path) go through parse_number one by one. Values that don't fit int64
+    are invalid.
+    """
+    bulk = _bulk_cell(scale, kind)
+    numbers = []
+    odd = []
+    for row, value in enumerate(values):
+        match = bulk.fullmatch(value) if isinstance(value, str) else None
+        if match is None:
+            numbers.append("0")
+            odd.append(row)
+        else:
+            numbers.append(match[1].replace(",", ""))
+
+    scaled = np.rint(np.array(numbers, dtype=np.float64) * scale)
+    too_big = scaled >= _FLOAT_EXACT
+    result = np.where(too_big, 0, scaled).astype(np.int64)
+    status = np.full(len(numbers), _OK, dtype=np.int8)
+    for row in odd + np.flatnonzero(too_big).tolist():
+        value, status[row] = parse_number(values[row], scale, kind)
+        if not -_INT64_MAX <= value <= _INT64_MAX:
+            value, status[row] = 0, _INVALID
+        result[row] = value
+    return result, status
+
+
+def format_fixed(value: int, scale: int) -> str:
+    """Exact decimal text of a fixed-point value: (300000, 100) -> "3000.00"."""
+    places = len(str(scale)) - 1
+    return str(Decimal(int(value)).scaleb(-places))
+
+
+def _fits(*estimates):
+    """Rows where every float64 estimate of a product is safely inside int64."""
+    return np.logical_and.reduce([np.abs(estimate) < _INT64_SAFE for estimate in estimates])
+
+
+def _differs(lhs, rhs, tolerance, both, safe):
+    """(|lhs - rhs| > tolerance where `both` holds, rows of `both` too large to compare)."""
+    with np.errstate(over="ignore"):
+        diff = np.abs(np.where(safe, lhs, 0) - np.where(safe, rhs, 0))
+    return both & safe & (diff > tolerance), both & ~safe
+
+
+def check_items(columns):
     """
-    Run simple validations on the structured invoice data.
-    Returns a dict with 'ok': bool and a list of 'issues'.
+    Run the per-row arithmetic checks over a parsed item table.
+
+    `columns` maps each NUMERIC_COLUMNS name to (values, status). Returns
+    a list of (check, column, failing mask, expected, actual) where expected
+    / actual are the cent values to report for failing rows (or None).
     """
-    issues = []
+    ok = {name: status == _OK for name, (_, status) in columns.items()}
+    value = {name: values for name, (values, _) in columns.items()}
+    results = []
+
+    # Quantity x Unit Price = Subtotal, compared at quantity x unit-price scale
+    factor = QUANTITY_SCALE * UNIT_PRICE_SCALE // MONEY_SCALE
+    with np.errstate(over="ignore"):
+        product = value[QUANTITY] * value[UNIT_PRICE]
+        subtotal = value[SUBTOTAL] * factor
+    safe = _fits(value[QUANTITY].astype(np.float64) * value[UNIT_PRICE], value[SUBTOTAL].astype(np.float64) * factor)
+    both = ok[QUANTITY] & ok[UNIT_PRICE] & ok[SUBTOTAL]
+    failed, overflow = _differs(product, subtotal, TOLERANCE_CENTS * factor, both, safe)
+    expected = (product + factor // 2) // factor
+    results.append(("quantity_x_unit_price", SUBTOTAL, failed, expected, value[SUBTOTAL]))
+    results.append(("out_of_range", SUBTOTAL, overflow, None, None))
 
-    # Check mandatory supplier/buyer TIN
-    if not structured["supplier"].get("Supplier's TIN"):
-        issues.append("Missing Supplier's TIN")
-    if not structured["buyer"].get("Buyer's TIN"):
-        issues.append("Missing Buyer's TIN")
+    # Total Excluding Tax x (1 + Tax Rate) = Total Including Tax
+    percent = 100 * RATE_SCALE
+    with np.errstate(over="ignore"):
+        taxed = value[TOTAL_EXCLUDING_TAX] * (percent + value[TAX_RATE])
+        including = value[TOTAL_INCLUDING_TAX] * percent
+    safe = _fits(
+        value[TOTAL_EXCLUDING_TAX].astype(np.float64) * (percent + value[TAX_RATE]),
+        value[TOTAL_INCLUDING_TAX].astype(np.float64) * percent,
+    )
+    both = ok[TOTAL_EXCLUDING_TAX] & ok[TAX_RATE] & ok[TOTAL_INCLUDING_TAX]
+    failed, overflow = _differs(taxed, including, TOLERANCE_CENTS * percent, both, safe)
+    expected = (taxed + percent // 2) // percent
+    results.append(("tax_rate", TOTAL_INCLUDING_TAX, failed, expected, value[TOTAL_INCLUDING_TAX]))
+    results.append(("out_of_range", TOTAL_INCLUDING_TAX, overflow, None, None))
 
-    # Validate totals if present
-    totals = [float(item.get("Total Payable Amount", "0")) for item in structured["items"]]
-    if totals and structured["invoice"].get("Invoice Currency Code") and sum(totals) <= 0:
-        issues.append("Invoice totals look invalid")
+    # Without a tax rate the including-tax total still can't be the smaller one
+    both = ok[TOTAL_EXCLUDING_TAX] & ok[TOTAL_INCLUDING_TAX] & ~ok[TAX_RATE]
+    failed = both & (value[TOTAL_INCLUDING_TAX] < value[TOTAL_EXCLUDING_TAX])
+    results.append((
+        "including_below_excluding", TOTAL_INCLUDING_TAX, failed,
+        value[TOTAL_EXCLUDING_TAX], value[TOTAL_INCLUDING_TAX],
+    ))
 
-    return {"ok": len(issues) == 0, "issues": issues}
+    both = ok[EXEMPT_AMOUNT] & ok[TOTAL_EXCLUDING_TAX]
+    failed = both & (value[EXEMPT_AMOUNT] > value[TOTAL_EXCLUDING_TAX])
+    results.append(("exempt_above_total", EXEMPT_AMOUNT, failed, value[TOTAL_EXCLUDING_TAX], value[EXEMPT_AMOUNT]))
+
+    for name, (scale, kind) in NUMERIC_COLUMNS.items():
+        if kind == "money" and scale == MONEY_SCALE:
+            results.append(("negative_amount", name, ok[name] & (value[name] < 0), None, value[name]))
+    return results
+
+
+def _segment_sums(values, starts, ends):
+    """Sum of values[starts[i]:ends[i]] for every i, exactly in int64."""
+    cumulative = np.concatenate(([0], np.cumsum(values, dtype=np.int64)))
+    return cumulative[ends] - cumulative[starts]
+
+
+def validate_invoices(invoices) -> list:
+    """
+    Validate many structured invoices (to_structured output) in one pass.
+
+    Returns one {"ok", "issues", "rows"} dict per invoice: "issues" are the
+    human-readable problems, "rows" the failing line items as
+    {"row", "check", "column", "expected", "actual"}. Throughput is logged at
+    DEBUG in rows per second.
+    """
+    started = time.perf_counter()
+    invoices = list(invoices)
+    counts = np.array([len(inv.get("items") or []) for inv in invoices], dtype=np.int64)
+    ends = np.cumsum(counts)
+    starts = ends - counts
+    items = [item for inv in invoices for item in (inv.get("items") or [])]
+
+    raw = {name: [item.get(name, "") for item in items] for name in NUMERIC_COLUMNS}
+    columns = {
+        name: parse_column(raw[name], scale, kind)
+        for name, (scale, kind) in NUMERIC_COLUMNS.items()
+    }
+    checks = check_items(columns)
+
+    results = [{"ok": True, "issues": [], "rows": []} for _ in invoices]
+    owner = np.repeat(np.arange(len(invoices)), counts)
+
+    def report(index, row, check, column, expected=None, actual=None):
+        results[index]["rows"].append({
+            "row": int(row - starts[index]),
+            "check": check,
+            "column": column,
+            "expected": expected,
+            "actual": actual,
+        })
+
+    # Only failing rows are visited in Python
+    for name, (values, status) in columns.items():
+        for row in np.flatnonzero(status == _INVALID):
+            report(owner[row], row, "unparseable", name, actual=raw[name][row])
+    for check, column, failed, expected, actual in checks:
+        for row in np.flatnonzero(failed):
+            report(
+                owner[row], row, check, column,
+                format_fixed(expected[row], MONEY_SCALE) if expected is not None else None,
+                format_fixed(actual[row], MONEY_SCALE) if actual is not None else None,
+            )
+
+    # Invoice totals against the sums over their items
+    totals = {}
+    for name in TOTAL_COLUMNS:
+        values, status = columns[name]
+        present = status == _OK
+        totals[name] = (
+            _segment_sums(np.where(present, values, 0), starts, ends),
+            _segment_sums(present.astype(np.int64), starts, ends),
+        )
+    mismatches = [[] for _ in invoices]
+    for name in TOTAL_COLUMNS:
+        sums, rows = totals[name]
+        stated, stated_status = parse_column(
+            [(inv.get("invoice") or {}).get(name) for inv in invoices], MONEY_SCALE,
+        )
+        mismatch = (stated_status == _OK) & (rows > 0) & (np.abs(stated - sums) > TOLERANCE_CENTS * rows)
+        for index in np.flatnonzero(mismatch):
+            mismatches[index].append(
+                f"{name} {format_fixed(stated[index], MONEY_SCALE)} does not match "
+                f"the line items ({format_fixed(sums[index], MONEY_SCALE)})"
+            )
+    payable, payable_rows = totals[TOTAL_PAYABLE]
+
+    for index, inv in enumerate(invoices):
+        issues = results[index]["issues"]
+
+        # Check mandatory supplier/buyer TIN
+        if not (inv.get("supplier") or {}).get("Supplier's TIN"):
+            issues.append("Missing Supplier's TIN")
+        if not (inv.get("buyer") or {}).get("Buyer's TIN"):
+            issues.append("Missing Buyer's TIN")
+
+        # Validate totals if present
+        if (
+            payable_rows[index] > 0
+            and (inv.get("invoice") or {}).get("Invoice Currency Code")
+            and payable[index] <= 0
+        ):
+            issues.append("Invoice totals look invalid")
+        issues.extend(mismatches[index])
+
+        results[index]["rows"].sort(key=lambda entry: entry["row"])
+        failing = {}
+        for entry in results[index]["rows"]:
+            failing.setdefault(entry["check"], {})[entry["row"]] = None
+        for check, rows in failing.items():
+            rows = list(rows)
+            shown = ", ".join(str(row + 1) for row in rows[:5]) + (", ..." if len(rows) > 5 else "")
+            issues.append(f"{len(rows)} line item(s) fail {check} (rows {shown})")
+        results[index]["ok"] = not issues
+
+    elapsed = time.perf_counter() - started
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "validated %d rows of %d invoices in %.1f ms (%.0f rows/s)",
+            len(items), len(invoices), elapsed * 1000, len(items) / elapsed if elapsed else 0,
+        )
+    return results
+
+
+def validate_invoice(structured: dict) -> dict:
+    """
+    Run the validations on one structured invoice.
+    Returns a dict with 'ok': bool, a list of 'issues' and the failing
+    line items under 'rows'.
+    """
+    return validate_invoices([structured])[0]
@@ -0,0 +1,212 @@
+# worker.py
+"""
+Extraction workers for the shared job queue (JOB_QUEUE=sqlite).
+
+    JOB_QUEUE=sqlite API_WORKERS=4 python main.py      # API processes: save uploads, queue them
+    python worker.py --workers 4 --concurrency 8        # extraction processes: work the queue
+
+Each of the `--workers` processes runs its own event loop with up to
+`--concurrency` job items in flight. It claims items from job_queue.JobQueue
+(--db, default $JOB_DB), runs them through the API's pipeline
+(main.run_job_item: cache, parse, fast path, structured data, LLM, score,
+results store) and writes the results back, where every API process can
+serve them. Leases are renewed every third of --lease-seconds while the
+work runs. On SIGTERM / Ctrl-C a process stops claiming, lets its items
+finish for up to --drain-seconds and puts whatever is left back in the
+queue. The workers share what the API processes leave of each provider's
+rate limits (1 - PROVIDER_SHARE, see scheduler.api_share), divided between
+the processes as in bulk mode.
+
+Workers on other hosts need the same JOB_DB, PDF_DIR and CACHE_DIR paths
+on shared storage; SQLite locking over network filesystems is unreliable,
+so keep them on one host per queue.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Set
+from uuid import uuid4
+
+from job_queue import Claim, JobQueue
+
+logger = logging.getLogger("invoice.worker")
+
+
+class QueueWorker:
+    """Claims items from `queue` and runs `process(payload)` on them, `concurrency` at a time."""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        process: Callable[[Any], Awaitable[Dict[str, Any]]],
+        concurrency: int = 8,
+        poll_seconds: float = 0.5,
+        drain_seconds: float = 60,
+    ):
+        self.queue = queue
+        self.process = process
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.drain_seconds = drain_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+        self.done = 0
+
+    async def _run(self, claim: Claim) -> None:
+        item_id, job_id, index, payload = claim
+        try:
+            result = await self.process(payload)
+        except Exception as e:
+            result = {"error": f"Job error: {str(e)}"}
+        if await asyncio.to_thread(self.queue.complete, self.owner, item_id, result):
+            self.done += 1
+        else:
+            logger.warning("lost the lease on item %d of job %s, result dropped", index, job_id)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.queue.heartbeat, self.owner)
+            except Exception as e:
+                # A busy database: the lease has two more beats before it runs out
+                logger.warning("heartbeat failed: %s", e)
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Work the queue until `stop` is set."""
+        heartbeat = asyncio.create_task(self._heartbeat())
+        stopping = asyncio.create_task(stop.wait())
+        running: Set[asyncio.Task] = set()
+        try:
+            while not stop.is_set():
+                free = self.concurrency - len(running)
+                claims = await asyncio.to_thread(self.queue.claim, self.owner, free) if free else []
+                running.update(asyncio.create_task(self._run(claim)) for claim in claims)
+                if claims and len(running) < self.concurrency:
+                    # There may be more waiting
+                    continue
+                # Wait for a free slot, or poll again while idle
+                await asyncio.wait(
+                    running | {stopping},
+                    timeout=self.poll_seconds if len(running) < self.concurrency else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                running = {task for task in running if not task.done()}
+
+            if running:
+                logger.info("stopping, waiting for %d item(s)", len(running))
+                _, running = await asyncio.wait(running, timeout=self.drain_seconds)
+        finally:
+            stopping.cancel()
+            released = await asyncio.to_thread(self.queue.release, self.owner)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            heartbeat.cancel()
+            if released:
+                logger.info("put %d unfinished item(s) back in the queue", released)
+
+
+async def _work_queued_item(saved: Dict[str, Any]) -> Dict[str, Any]:
+    from main import run_job_item
+
+    if "file_path" in saved:
+        saved["file_path"] = Path(saved["file_path"])
+    # Put back in the queue if cancelled: the upload is still needed
+    saved["keep_upload"] = True
+    return await run_job_item(saved)
+
+
+def serve(db: str, concurrency: int, workers: int = 1, lease_seconds: float = 60, max_attempts: int = 3,
+          poll_seconds: float = 0.5, drain_seconds: float = 60, log_level: str = "INFO") -> None:
+    """Run one worker process until SIGTERM / SIGINT."""
+    logging.basicConfig(format="%(message)s")
+    logging.getLogger("invoice").setLevel(log_level.upper())
+
+    import main
+    import parse
+    from scheduler import api_share, scheduler
+
+    # This process already is one of `workers`: parse on a thread, not another pool
+    parse.set_local_pool(ThreadPoolExecutor(max_workers=2))
+    # The API processes keep api_share() of each provider for /upload-pdf
+    for provider in scheduler.providers.values():
+        provider.scale((1 - api_share("sqlite")) / workers)
+    main.warm_up()
+
+    queue = JobQueue(db, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    worker = QueueWorker(queue, _work_queued_item, concurrency, poll_seconds, drain_seconds)
+
+    async def run() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows: Ctrl-C kills the process, leases run out instead
+                pass
+        logger.info("worker %s ready, %d item(s) at a time", worker.owner, concurrency)
+        await worker.run(stop)
+        logger.info("worker %s done, %d item(s) processed", worker.owner, worker.done)
+
+    try:
+        asyncio.run(run())
+    finally:
+        parse.shutdown()
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=os.getenv("JOB_DB", Path(__file__).parent / "jobs.db"),
+                    help="SQLite job queue (default: $JOB_DB or jobs.db)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    ap.add_argument("--concurrency", type=int, default=8, help="items in flight per worker")
+    ap.add_argument("--lease-seconds", type=float, default=float(os.getenv("JOB_LEASE_SECONDS", 60)),
+                    help="how long a claimed item stays with a worker that stopped heartbeating")
+    ap.add_argument("--max-attempts", type=int, default=int(os.getenv("JOB_MAX_ATTEMPTS", 3)),
+                    help="claims of an item before it is failed")
+    ap.add_argument("--poll-seconds", type=float, default=0.5, help="queue polling interval while idle")
+    ap.add_argument("--drain-seconds", type=float, default=60, help="time to finish claimed items on shutdown")
+    ap.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "INFO"))
+    args = ap.parse_args(argv)
+
+    from scheduler import api_share
+
+    try:
+        if api_share("sqlite") >= 1:
+            ap.error("PROVIDER_SHARE=1 leaves the queue workers no provider quota")
+    except ValueError as e:
+        ap.error(str(e))
+
+    options = dict(
+        db=str(args.db), concurrency=args.concurrency, workers=args.workers,
+        lease_seconds=args.lease_seconds, max_attempts=args.max_attempts,
+        poll_seconds=args.poll_seconds, drain_seconds=args.drain_seconds, log_level=args.log_level,
+    )
+    if args.workers <= 1:
+        serve(**options)
+        return
+
+    # Spawned, not forked, like the rescore pool; each child signals its own drain
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=serve, kwargs=options, name=f"worker-{i}") for i in range(args.workers)]
+    for process in processes:
+        process.start()
+    signal.signal(signal.SIGTERM, lambda *_: [p.terminate() for p in processes if p.is_alive()])
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # The terminal sent SIGINT to the children too; let them drain
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()